@@ -1,61 +1,240 @@
 #!/usr/bin/python3
 #   Creates FF_SmsServer config default file from template and Domoticz device list
 #   V1.1.0
-import requests
 import base64
 import pathlib
 import os
 import json
 import re
+import filecmp
+import sys
+from FF_analyzeCommand import FF_analyzeCommand, getControllerTopicErrors
+from FF_domoticzApi import DomoticzApi, DomoticzApiError, getControllers, readControllers, iterDeviceListFiles, loadDictionary, getKey
 
 removeLeadingPluginName = False
 keepDomoticzDeviceList = False
 showHiddenDevices = False
 showUsedDeviceOnly = True
+incrementalUpdate = False
 minimalConfigVersion = "V1.0.0"
 minimalTemplateVersion = "V1.0.0"
 
-# Load a dictionary from a file
-def loadDictionary(file):
-    if os.path.exists(file):
-        with open(file, 'rt', encoding='utf-8') as f:
-            return json.loads(f.read())
-    else:
-        return {}
-
-# Check if new API is used
-def isNewApi(version):
-    return version[:2] == "20" and version >= "2023.2"
-
-# Execute a JSON request
-def readApi(command):
-    # Send request
-    response = requests.get(domoticzUrl+"json.htm?"+command)
-    # If status code
-    if response.status_code == 200:
-        # Check status answer = "OK"
-        if response.json()["status"] == "OK":
-            return response
-    # Print error message and exit
-    print("Error "+str(response.status_code)+" reading "+response.url)
-    print("Returned: "+response.text)
-    exit(2)
+# Return device key, made of Domoticz idx, prefixed by controller name when multiple controllers are used
+def deviceKey(deviceEntry):
+    if "controller" in deviceEntry:
+        return F"{deviceEntry['controller']}:{getKey('index', deviceEntry, '')}"
+    return str(getKey("index", deviceEntry, ""))
 
-# Get a key in dictionary, return default value if not found
-def getKey(key, dict, default = None):
-    if key in dict:
-        return dict[key]
-    else:
-        return default
+# Merge devices generated from Domoticz into existing ones, keeping hand-edited entries
+#   generatedDevices and existingDevices are indexed by SMS device name, lastRunDevices by device key
+def mergeDevices(generatedDevices, existingDevices, lastRunDevices):
+    generatedByIdx = {}
+    for (deviceName, deviceEntry) in generatedDevices.items():
+        generatedByIdx[deviceKey(deviceEntry)] = (deviceName, deviceEntry)
+    mergedDevices = {}
+    seenIdx = set()
+    for (deviceName, deviceEntry) in existingDevices.items():
+        deviceIdx = deviceKey(deviceEntry)
+        lastRun = getKey(deviceIdx, lastRunDevices)
+        if deviceIdx not in generatedByIdx:
+            if lastRun:
+                # Device was generated by previous run, but is not in Domoticz (or is now hidden)
+                print(F"Removing device {deviceName} (idx {deviceIdx})")
+            else:
+                # Device has been added by hand, keep it
+                mergedDevices[deviceName] = deviceEntry
+            continue
+        seenIdx.add(deviceIdx)
+        newName, newEntry = generatedByIdx[deviceIdx]
+        if lastRun == None:
+            # No trace of previous run, keep existing entry
+            mergedDevices[deviceName] = deviceEntry
+            continue
+        # Keep name and content if modified by hand since previous run
+        if deviceName == lastRun["name"] and newName != deviceName and newName not in existingDevices:
+            print(F"Renaming device {deviceName} to {newName} (idx {deviceIdx})")
+            deviceName = newName
+        if deviceEntry == lastRun["entry"] and newEntry != deviceEntry:
+            print(F"Updating device {deviceName} (idx {deviceIdx})")
+            deviceEntry = newEntry
+        mergedDevices[deviceName] = deviceEntry
+    # Add new devices
+    for (deviceIdx, (deviceName, deviceEntry)) in generatedByIdx.items():
+        if deviceIdx not in seenIdx:
+            if deviceName in mergedDevices:
+                print(F"Can't add device {deviceName} (idx {deviceIdx}), name already used by idx {mergedDevices[deviceName]['index']}")
+            else:
+                print(F"Adding device {deviceName} (idx {deviceIdx})")
+                mergedDevices[deviceName] = deviceEntry
+    return mergedDevices
+
+# Create an empty name trie node
+def newTrieNode():
+    return {"children": {}, "names": [], "wordEnds": []}
+
+# Build a character trie of normalized device names (words separated by a space)
+#   Each node keeps list of word ends (space nodes) reachable within current word
+def buildNameTrie(normalizedNames):
+    root = newTrieNode()
+    for (name, normalizedName) in normalizedNames:
+        node = root
+        wordNodes = [root]
+        for char in normalizedName:
+            isNew = char not in node["children"]
+            node = node["children"].setdefault(char, newTrieNode())
+            if char == " ":
+                # Register new word end in all nodes of current word
+                if isNew:
+                    for wordNode in wordNodes:
+                        wordNode["wordEnds"].append(node)
+                wordNodes = [node]
+            else:
+                wordNodes.append(node)
+        node["names"].append(name)
+    return root
+
+# Return all names stored under a trie node
+def trieNames(node):
+    names = list(node["names"])
+    for child in node["children"].values():
+        names.extend(trieNames(child))
+    return names
+
+# Return names matching all words of a normalized name, word by word, as findInDict does
+def trieMatches(root, normalizedName):
+    states = [root]
+    for char in normalizedName:
+        if char == " ":
+            # Current word can be completed by any chars up to next word
+            states = [wordEnd for state in states for wordEnd in state["wordEnds"]]
+        else:
+            states = [state["children"][char] for state in states if char in state["children"]]
+        if not states:
+            break
+    matches = []
+    for state in states:
+        matches.extend(trieNames(state))
+    return matches
+
+# Print device names hidden by another one when typed in full, for each command value allowing both
+#   Names are split into words as analyzer does (ignored words and elisions being removed)
+def checkAmbiguousNames(devices, ignoresList, analyzer):
+    analyzer.ignoresSet = set(analyzer.convertUserData(ignoresList))
+    analyzer.itemWordsCache = {}
+    normalizedNames = {deviceName: " ".join(analyzer.itemWords(deviceName)) for deviceName in devices.keys()}
+    # Build one trie per command value, with devices allowing it
+    commandNames = {}
+    for (deviceName, deviceEntry) in devices.items():
+        for commandValue in getKey("allow", deviceEntry, []):
+            commandNames.setdefault(commandValue, []).append((deviceName, normalizedNames[deviceName]))
+    hiddenBy = {}
+    for (commandValue, names) in commandNames.items():
+        root = buildNameTrie(names)
+        for (deviceName, normalizedName) in names:
+            for otherName in trieMatches(root, normalizedName):
+                if otherName != deviceName:
+                    hiddenBy.setdefault((deviceName, otherName), []).append(commandValue)
+    for ((deviceName, otherName), commandValues) in sorted(hiddenBy.items()):
+        print(F"\"{deviceName}\" is hidden by \"{otherName}\" for {commandValues}")
+
+# Write smsTables.json from template data, one section item per line
+#   "replaceMeBy" items are replaced by items returned by replacement function of same name
+def writeTables(stream, templateData, replacements):
+    sectionSeparator = "\n"
+    stream.write("{")
+    for (sectionName, sectionData) in templateData.items():
+        stream.write(sectionSeparator + "\t" + json.dumps(sectionName, ensure_ascii=False) + ": ")
+        sectionSeparator = ",\n"
+        if type(sectionData).__name__ == "dict":
+            itemSeparator = "\n"
+            stream.write("{")
+            for (key, value) in sectionData.items():
+                items = replacements[value]() if key == "replaceMeBy" else [(key, value)]
+                for (itemKey, itemValue) in items:
+                    stream.write(itemSeparator + "\t\t" + json.dumps(itemKey, ensure_ascii=False) + ": " + json.dumps(itemValue, ensure_ascii=False))
+                    itemSeparator = ",\n"
+            stream.write("\n\t}")
+        elif type(sectionData).__name__ == "list":
+            itemSeparator = "\n"
+            stream.write("[")
+            for item in sectionData:
+                stream.write(itemSeparator + "\t\t" + json.dumps(item, ensure_ascii=False))
+                itemSeparator = ",\n"
+            stream.write("\n\t]")
+        else:
+            stream.write(json.dumps(sectionData, ensure_ascii=False))
+    stream.write("\n}\n")
+
+# Compile a regEx list (ignoring case), returning (combined regEx, [(index, regEx)] of items matched separately)
+#   Each item is compiled alone first, to check it. Items without groups nor global flags are then combined into one regEx,
+#       each of them being an optional lookahead named group, so that all matching items are found in one pass
+#   Items using groups (which may be referred by number) or global flags (like "(?s)", only allowed at regEx start) keep their own regEx
+def compileRegExList(regExList):
+    combinedItems = []
+    separateItems = []
+    for ptr, item in enumerate(regExList):
+        try:
+            regEx = re.compile(item, flags=re.IGNORECASE)
+        except re.error as e:
+            print(F"Error {e} in regEx {item}")
+            exit(2)
+        if regEx.groups == 0 and not re.search(r"\(\?[aiLmsux]+\)", item):
+            combinedItems.append(F"(?:(?=(?P<r{ptr}>{item})))?")
+        else:
+            separateItems.append((ptr, regEx))
+    return (re.compile("".join(combinedItems), flags=re.IGNORECASE) if combinedItems else None), separateItems
+
+# Return list of regEx (from original list) matching start of toTest value, ignoring case, using compiled regEx list
+def checkRegExIn(toTest, compiledRegEx, regExList):
+    combinedRegEx, separateItems = compiledRegEx
+    hits = set()
+    if combinedRegEx:
+        for (name, value) in combinedRegEx.match(toTest).groupdict().items():
+            if value != None:
+                hits.add(int(name[1:]))
+    for (ptr, regEx) in separateItems:
+        if regEx.match(toTest):
+            hits.add(ptr)
+    return [regExList[ptr] for ptr in sorted(hits)]
+
+# Compute device category from type, subtype and switch type, using first matching category rule, then first matching rename rule
+def computeCategory(deviceType, deviceSubType, deviceSwitchType, deviceSwitchTypeVal):
+    fields = {"type": deviceType, "subType": deviceSubType, "switchType": deviceSwitchType, "switchTypeVal": deviceSwitchTypeVal}
+    deviceCategory = deviceType
+    for (conditions, category) in categoryRules:
+        if all((fields[key] != "") if accepted == "*" else (fields[key] in accepted) for (key, accepted) in conditions.items()):
+            deviceCategory = category.format(**fields)
+            break
+    for (test, value, newCategory) in categoryRenames:
+        if (test == "startsWith" and deviceCategory.startswith(value)) \
+                or (test == "contains" and value in deviceCategory) \
+                or (test == "equals" and deviceCategory == value):
+            return newCategory
+    return deviceCategory
 
-# Return true if toTest valie is found in compiled regEx list 
-def checkRegExIn(toTest, regExList):
-    hits = []
-    for regEx in regExList:
-        result = re.match(regEx, toTest)
-        if result:
-            hits.append(result.re.pattern)
-    return hits
+# Return device category, computing it only once for each type, subtype, switch type and switch type value
+def getCategory(deviceType, deviceSubType, deviceSwitchType, deviceSwitchTypeVal):
+    key = deviceType+"|"+deviceSubType+"|"+deviceSwitchType+"|"+deviceSwitchTypeVal
+    deviceCategory = categoryTable.get(key)
+    if deviceCategory == None:
+        deviceCategory = computeCategory(deviceType, deviceSubType, deviceSwitchType, deviceSwitchTypeVal)
+        categoryTable[key] = deviceCategory
+    return deviceCategory
+
+# Return allowed commands, define parameters and hiddenCategories hits of a category, computing them only once
+def getCategoryData(deviceCategory):
+    categoryData = categoryDataTable.get(deviceCategory)
+    if categoryData == None:
+        allowCommands = ["cdeShow"]
+        if deviceCategory in onCategories:
+            allowCommands.append("cdeOn")
+        if deviceCategory in offCategories:
+            allowCommands.append("cdeOff")
+        if deviceCategory in defineCategories:
+            allowCommands.append("cdeSet")
+        categoryData = (allowCommands, getKey(deviceCategory, defineCategories, {}), checkRegExIn(deviceCategory, hiddenCategoriesRegEx, hiddenCategories))
+        categoryDataTable[deviceCategory] = categoryData
+    return categoryData
 
 #   *****************
 #   *** Main code ***
@@ -76,17 +255,23 @@ if jsonSettings == None:
     exit(2)
 
 # Load settings in local variables
-onCategories = getKey("onCategories", jsonSettings)
-offCategories = getKey("offCategories", jsonSettings)
-defineCategories = getKey("defineCategories", jsonSettings)
-hiddenCategories = getKey("hiddenCategories", jsonSettings)
-hiddenDevices = getKey("hiddenDevices", jsonSettings)
+onCategories = set(getKey("onCategories", jsonSettings, []))
+offCategories = set(getKey("offCategories", jsonSettings, []))
+defineCategories = getKey("defineCategories", jsonSettings, {})
+hiddenCategories = getKey("hiddenCategories", jsonSettings, [])
+hiddenDevices = getKey("hiddenDevices", jsonSettings, [])
+categoryTable = getKey("categoryTable", jsonSettings, {})
 domoticzUrl = getKey("domoticzUrl", getKey("settings", jsonSettings), "http://127.0.0.1:8080/")
 language = getKey("language", getKey("settings", jsonSettings), "EN")
 removeLeadingPluginName = getKey("removeLeadingPluginName", getKey("settings", jsonSettings), removeLeadingPluginName)
 keepDomoticzDeviceList = getKey("keepDomoticzDeviceList", getKey("settings", jsonSettings), keepDomoticzDeviceList)
 showHiddenDevices = getKey("showHiddenDevices", getKey("settings", jsonSettings), showHiddenDevices)
 showUsedDeviceOnly = getKey("showUsedDeviceOnly", getKey("settings", jsonSettings), showUsedDeviceOnly)
+incrementalUpdate = getKey("incrementalUpdate", getKey("settings", jsonSettings), incrementalUpdate)
+deviceListFiles = getKey("deviceListFiles", getKey("settings", jsonSettings), [])
+apiTimeout = getKey("apiTimeout", getKey("settings", jsonSettings), 10)
+apiRetries = getKey("apiRetries", getKey("settings", jsonSettings), 3)
+apiCacheFolder = getKey("apiCacheFolder", getKey("settings", jsonSettings), ".")
 configVersion = getKey("configVersion", getKey("settings", jsonSettings), "V0.0.0")
 
 # Check for config json file version
@@ -95,58 +280,100 @@ if configVersion < minimalConfigVersion:
     print(F"Please copy {jsonSettingsFile} from /examples folder, applying changes you may have done to it again")
     exit(2)
 
-# Define counter types from 0 to 5
-counterTypes = ["Energy", "Gas", "Water", "Counter", "Energy Generated", "Time"]
-
-# Load devices regex from hiddenCategories
-hiddenCategoriesRegEx = []
-for item in hiddenCategories:
-    regEx = re.compile(item, flags=re.IGNORECASE)
-    hiddenCategoriesRegEx.append(regEx)
-
-# Load devices regex from hiddenDevices
-hiddenDevicesRegEx = []
-for item in hiddenDevices:
-    regEx = re.compile(item, flags=re.IGNORECASE)
-    hiddenDevicesRegEx.append(regEx)
-
-# Get Domoticz settings to find version number
-domoticzVersionResponse = readApi("type=command&param=getversion")
-domoticzVersion = getKey("version", domoticzVersionResponse.json(), "")
-if domoticzVersion == "":
-    domoticzVersion = "2099.9"
-    print(F"Can't find 'version' in {domoticzVersionResponse.text}, setting to {domoticzVersion}")
-
-# Compose command to send depending on user needs
-if isNewApi(domoticzVersion):
-    params = "type=command&param=getdevices"
-else:
-    params = "type=devices"
+# Define counter categories for switch type values from 0 to 5
+counterCategories = ["Energy", "Gas", "Water", "Counter", "Energy Generated", "Time"]
 
-if showHiddenDevices:
-    params +="&displayhidden=1"
+# Define category rules ({field: accepted values or "*" for any non empty value}, category format using fields), first match wins
+categoryRules = [
+    ({"subType": ["Security Panel"]}, "SecurityPanel"),                 # Fixed category for "Security Panel" subtype
+    ({"type": ["Color Switch"]}, "Color {switchType}"),                 # Transform "Color switch" type to "Color xxx" using switch type
+    ({"switchType": "*"}, "{switchType}"),                              # Use switch type if given
+    ({"type": ["General", "P1 Smart Meter"]}, "{subType}")              # Use subtype for "General" and "P1 Smart Meter"
+]
+for (switchTypeVal, counterCategory) in enumerate(counterCategories):   # Use counter type for "Counter Incremental", "Managed counter" or "RFXMeter"
+    categoryRules.append(({"subType": ["Counter Incremental", "Managed counter"], "switchTypeVal": [str(switchTypeVal)]}, counterCategory))
+    categoryRules.append(({"type": ["RFXMeter"], "switchTypeVal": [str(switchTypeVal)]}, counterCategory))
+categoryRules.append(({}, "{type}"))                                    # Else use type
+categoryRenames = [                                                     # Category renames (test, value, new category), first match wins
+    ("startsWith", "Temp ", "Temp"),                                    # Use "Temp" for all categories starting with "Temp "
+    ("startsWith", "Current", "Current"),                               # Use "Current" for all categories starting with "Current"
+    ("contains", "Door Lock", "Door Lock"),                             # Use "Door lock" for all categories containing "Door lock"
+    ("equals", "Thermostat", "Setpoint"),                               # Change "Thermostat" to "Setpoint" (which replaces "Thermostat" from already few versions)
+    ("contains", "Blinds Percentage", "Blinds Percentage"),             # Use "Blinds Percentage" for all categories containing "Blinds Percentage"
+    ("contains", "Blinds", "Blinds")                                    # Use "Blinds" for all other categories containing "Blinds"
+]
 
-if showUsedDeviceOnly:
-    params +="&used=true"
+# Category rules can be replaced by FF_SmsServerConfig.json ones
+categoryRules = getKey("categoryRules", jsonSettings, categoryRules)
+categoryRenames = getKey("categoryRenames", jsonSettings, categoryRenames)
+for (conditions, category) in categoryRules:
+    if not conditions.keys() <= {"type", "subType", "switchType", "switchTypeVal"}:
+        print(F"Unknown field in category rule {conditions}, should be type, subType, switchType or switchTypeVal")
+        exit(2)
+categoryDataTable = {}                                                  # Allowed commands, define parameters and hidden status by category
 
-# Execute device list request
-response = readApi(params)
+# Compile hiddenCategories and hiddenDevices regEx lists
+hiddenCategoriesRegEx = compileRegExList(hiddenCategories)
+hiddenDevicesRegEx = compileRegExList(hiddenDevices)
 
-# Save answer if required
-if keepDomoticzDeviceList:
-    with open(cdeFile+"DeviceList.json", "wt") as jsonStream:
-        jsonStream.write(response.text)
+# Device list files given on command line replace those in settings
+if len(sys.argv) > 1:
+    deviceListFiles = sys.argv[1:]
 
 # Initialize device list
-deviceNameList = []
-jsonDeviceList = []
+generatedDevices = {}
+scannedDevices = []
+responseHeader = {}
+deviceListStream = None
+controllers = getControllers(domoticzUrl)
+
+# Each controller needs its own topics, else plug-in commands would be executed by all of them
+topicErrors = getControllerTopicErrors(domoticzUrl, getKey("domoticzInTopic", getKey("settings", jsonSettings), ""), \
+    getKey("domoticzOutTopic", getKey("settings", jsonSettings), ""))
+if topicErrors:
+    print("\n".join(topicErrors))
+    exit(2)
+
+# Return devices given by deviceIterator, exiting on Domoticz API error
+def checkedDevices(deviceIterator):
+    try:
+        yield from deviceIterator
+    except DomoticzApiError as e:
+        print(e)
+        exit(2)
 
-# Scan all devices
-for device in response.json()["result"]:
+# Read saved device list files instead of Domoticz, if given
+if deviceListFiles:
+    deviceListSource = str(deviceListFiles)
+    deviceIterator = iterDeviceListFiles(deviceListFiles, responseHeader, controllers)
+# Read all controllers in parallel if more than one is given
+elif len(controllers) > 1:
+    if len(set(controllerName for (controllerName, url) in controllers)) != len(controllers):
+        print(F"Controller names should be unique, found {[controllerName for (controllerName, url) in controllers]}")
+        exit(2)
+    saveFiles = [F"{cdeFile}DeviceList_{controllerName}.json" for (controllerName, url) in controllers] if keepDomoticzDeviceList else None
+    deviceListSource = str([url for (controllerName, url) in controllers])
+    deviceIterator = readControllers(controllers, apiTimeout, apiRetries, apiCacheFolder, showHiddenDevices, showUsedDeviceOnly, responseHeader, saveFiles)
+else:
+    # Save answer if required, while reading it
+    if keepDomoticzDeviceList:
+        deviceListStream = open(cdeFile+"DeviceList.json", "wb")
+    # Execute device list request, reading answer by chunks
+    domoticzApi = DomoticzApi(controllers[0][1], apiTimeout, apiRetries, apiCacheFolder)
+    try:
+        response, devices = domoticzApi.getDevices(showHiddenDevices, showUsedDeviceOnly, responseHeader, deviceListStream)
+    except DomoticzApiError as e:
+        print(e)
+        exit(2)
+    deviceListSource = response.url
+    deviceIterator = ((None, device) for device in devices)
+deviceIterator = checkedDevices(deviceIterator)
+
+# Scan all devices, one at a time
+for (controllerName, device) in deviceIterator:
     deviceName = device["Name"]                                             # Load device name (text)
-    rejectList = checkRegExIn(deviceName, hiddenDevicesRegEx)               # Check device name against hiddenDevices regEx compiled list
+    rejectList = checkRegExIn(deviceName, hiddenDevicesRegEx, hiddenDevices)    # Check device name against hiddenDevices regEx compiled list
     if not rejectList:                                                      # Is device not in list of hidden one?
-        deviceNameList.append(deviceName)                                       # Add device to list for futher check
         deviceHardwareName = device["HardwareName"]                         # Load hardware name (text)
         # If required, remove deviceHardwareName
         if removeLeadingPluginName and deviceName[:len(deviceHardwareName)+3] == deviceHardwareName+' - ':
@@ -158,92 +385,75 @@ for device in response.json()["result"]:
         deviceSwitchTypeVal = str(getKey("SwitchTypeVal", device, ""))      # Load device type (number)
         deviceLevelNames = getKey("LevelNames", device)                     # Load level names (text, separator |, base 64 encoded)
         # Define device category from type, subtype and switchtype
-        if deviceSwitchType:
-            deviceCategory = deviceSwitchType                               # Use switch type if given
-        elif deviceType == "General" or deviceType == "P1 Smart Meter":
-            deviceCategory = deviceSubType                                  # Use subtype for "General" and "P1 Smart Meter"
-        elif (deviceSubType == "Counter Incremental" or deviceSubType == "Managed counter" or deviceType == "RFXMeter") and deviceSwitchTypeVal >= "0" and deviceSwitchTypeVal <="5":
-            deviceCategory = counterTypes[int(deviceSwitchTypeVal)]         # Use counter type for "Counter Incremental", "Managed counter" or "RFXMeter"
-        else:
-            deviceCategory = deviceType                                     # Else use type
-        # Transform "Color switch" type to "Color xxx" using switch type
-        if deviceType == "Color Switch": deviceCategory = "Color " + deviceSwitchType
-        # Use "Temp" for all categories starting with "Temp"
-        if deviceCategory[:5] == "Temp ": deviceCategory = "Temp"
-        # Use "Current" for all categories starting with "Current"
-        if deviceCategory[:7] == "Current": deviceCategory = "Current"
-        # Use "Door look" for all categories containing  "Door look"
-        if "Door Lock" in deviceCategory: deviceCategory = "Door Lock"
-        # Change "Thermostat" to "Setpoint" (which replaces "Thermostat" from already few versions)
-        if deviceCategory == "Thermostat" : deviceCategory = "Setpoint"
-        # Use "Blinds Percentage" for all categories containing  "Blinds Percentage"
-        if "Blinds Percentage" in deviceCategory:
-            deviceCategory = "Blinds Percentage"
-        # Use "Blinds" for all categories containing  "Blinds" (and not "Blinds Percentage")
-        elif "Blinds" in deviceCategory:
-            deviceCategory = "Blinds"
-        # Set category to "SecurityPanel" if subtype is "Security Panel"
-        if deviceSubType == "Security Panel": deviceCategory = "SecurityPanel"
+        deviceCategory = getCategory(deviceType, deviceSubType, deviceSwitchType, deviceSwitchTypeVal)
+        allowCommands, defineParams, rejectList = getCategoryData(deviceCategory)
         # Convert level names if existing
-        selectorValues = ""
+        selectorValues = {}
         if deviceLevelNames:
             deviceLevelNamesList = base64.b64decode(deviceLevelNames.encode("ascii")).decode("UTF8").split("|")
             deviceMappingLevel = 0
             for level in deviceLevelNamesList:
-                if selectorValues:
-                    selectorValues += ", "
-                selectorValues += "\""+level+"\": "+str(deviceMappingLevel)
+                selectorValues[level] = deviceMappingLevel
                 deviceMappingLevel += 10
-        # Compute allow from configuration lists
-        allowCommands = "\"allow\": [\"cdeShow\""
-        # Add other  allowed types
-        if deviceCategory in onCategories:
-                allowCommands += ", \"cdeOn\""
-        if deviceCategory in offCategories:
-                allowCommands += ", \"cdeOff\""
-        if deviceCategory in defineCategories:
-                allowCommands += ", \"cdeSet\""
-                defineParams = ", " + str(getKey(deviceCategory, defineCategories)).replace("\'","\"")[1:-1].replace("\"[[selectorValues]]\"", "{"+selectorValues+"}")
-        else:
-                defineParams = ""
+        # Set name, idx, category, allow & define parameters
+        deviceEntry = {"index": int(deviceIdx), "category": deviceCategory, "allow": list(allowCommands)}
+        for (key, value) in defineParams.items():
+            deviceEntry[key] = selectorValues if value == "[[selectorValues]]" else value
+        # Record controller owning device, when more than one
+        if controllerName:
+            deviceEntry["controller"] = controllerName
         # If category in hiddenCategories, don't write device to list
-        rejectList = checkRegExIn(deviceCategory,hiddenCategories)
         if not rejectList:
-            # Add name, idx, category, allow & define parameters
-            jsonDeviceList.append("\t\t\""+str(deviceName)+"\": {\"index\": "+str(deviceIdx)+", \"category\": \""+str(deviceCategory)+"\", "+str(allowCommands)+"]"+defineParams+"}")
+            scannedDevices.append((controllerName, deviceName, deviceEntry))
         else:
             print(F"Ignoring category {deviceCategory} for {deviceName}, rejected by {rejectList}")
     else:
             print(F"Ignoring device {deviceName}, rejected by {rejectList}")
 
-# Sort json device list
-jsonDeviceList.sort()
-deviceList = ""
-for item in jsonDeviceList:
-    if deviceList:
-        deviceList += ",\n"
-    deviceList += item
-
-# Load settings to be inserted into JSON
-jsonSettingsList = ""
-for (key, value) in getKey("settings", jsonSettings).items():
-    if jsonSettingsList:
-        jsonSettingsList += ",\n"
-    jsonSettingsList += "\t\t\"" + key + "\": "
-    if type(value).__name__ in ["int", "float", "bool"]:
-        jsonSettingsList +=  str(value).lower()
-    else:
-        jsonSettingsList += "\"" + value + "\""
+# Close saved answer
+if deviceListStream:
+    deviceListStream.close()
+
+# Check status answer = "OK"
+if getKey("status", responseHeader) != "OK":
+    print(F"Error reading {deviceListSource}, status is {getKey('status', responseHeader)}")
+    exit(2)
+
+# Prefix device names used by several controllers with controller name
+nameControllers = {}
+for (controllerName, deviceName, deviceEntry) in scannedDevices:
+    nameControllers.setdefault(deviceName, set()).add(controllerName)
+for (controllerName, deviceName, deviceEntry) in scannedDevices:
+    if len(nameControllers[deviceName]) > 1:
+        print(F"Renaming {deviceName} of {controllerName} to {controllerName} {deviceName}, name used by several controllers")
+        deviceName = F"{controllerName} {deviceName}"
+    generatedDevices[deviceName] = deviceEntry
+
+# Compose json result file name
+jsonFile = "smsTables.json"
+lastRunFile = cdeFile+"LastRun.json"
+
+# In incremental mode, only apply changes since previous run to existing devices
+lastRunDevices = None
+if incrementalUpdate:
+    existingData = loadDictionary(jsonFile) if os.path.exists(jsonFile) else {}
+    lastRunDevices = loadDictionary(lastRunFile) if os.path.exists(lastRunFile) else {}
+    if existingData == None or lastRunDevices == None:
+        exit(2)
+    existingDevices = getKey("devices", existingData, {})
+    devices = mergeDevices(generatedDevices, existingDevices, lastRunDevices)
+else:
+    devices = generatedDevices
 
 # Compose template name
 templateFile = "smsTables"+language+".template"
 
 # Read template file
-with open(templateFile, "rb") as templateStream:
-    templateData = templateStream.read().decode("utf-8")
+with open(templateFile, "rt", encoding="utf-8") as templateStream:
+    templateData = json.load(templateStream)
 
 # Extract template version
-templateVersion = getKey("templateVersion", getKey("settings", json.loads(templateData)), "V0.0.0")
+templateVersion = getKey("templateVersion", getKey("settings", templateData), "V0.0.0")
 
 # Check template version
 if templateVersion < minimalTemplateVersion:
@@ -251,13 +461,48 @@ if templateVersion < minimalTemplateVersion:
     print(F"Please copy {templateFile} from /examples folder, applying changes you may have done to it again")
     exit(2)
 
-# Write json result file
-jsonFile = "smsTables.json"
-with open(jsonFile, "wt", encoding='utf-8') as jsonStream:
-        jsonStream.write(templateData.replace("\"replaceMeBy\": \"settings\"", jsonSettingsList).replace("\"replaceMeBy\": \"devices\"", deviceList))
+# Check devices against analyzer rules, using template command values
+analyzer = FF_analyzeCommand()
+analyzer.checkFile = jsonFile
+analyzer.checkPhase = "checking devices"
+analyzer.commandValuesDict = getKey("commandValues", templateData, {})
+
+# Return devices sorted by name, checking them on the fly
+def sortedDevices():
+    for deviceName in sorted(devices.keys()):
+        analyzer.checkDevice(deviceName, devices[deviceName])
+        yield (deviceName, devices[deviceName])
+
+# Write json result file into a temporary file
+tempFile = jsonFile+".tmp"
+with open(tempFile, "wt", encoding='utf-8') as jsonStream:
+    writeTables(jsonStream, templateData, {"settings": getKey("settings", jsonSettings).items, "devices": sortedDevices})
+
+# Don't replace json result file if errors were found
+if analyzer.errorSeen:
+    print(analyzer.allMessages)
+    print(F"Error detected, {jsonFile} not written")
+    os.remove(tempFile)
+    exit(2)
+
+# Replace json result file, only if changed
+if os.path.exists(jsonFile) and filecmp.cmp(tempFile, jsonFile, shallow=False):
+    print(F"No change, {jsonFile} not written")
+    os.remove(tempFile)
+else:
+    os.replace(tempFile, jsonFile)
+
+# Save generated devices by key, to detect hand-made changes at next incremental run, only if they changed since previous run
+newLastRunDevices = {}
+for (deviceName, deviceEntry) in generatedDevices.items():
+    newLastRunDevices[deviceKey(deviceEntry)] = {"name": deviceName, "entry": deviceEntry}
+if lastRunDevices == None and os.path.exists(lastRunFile):
+    lastRunDevices = loadDictionary(lastRunFile)
+if newLastRunDevices == lastRunDevices:
+    print(F"No change, {lastRunFile} not written")
+else:
+    with open(lastRunFile, "wt", encoding='utf-8') as jsonStream:
+        jsonStream.write(json.dumps(newLastRunDevices, ensure_ascii=False, indent=1))
 
 # Check for ambiguous device names
-for deviceName in deviceNameList:
-    for deviceToCheck in deviceNameList:
-        if deviceToCheck == deviceName[:len(deviceToCheck)] and deviceToCheck != deviceName:
-            print("\""+deviceName+"\" share root with \""+deviceToCheck+"\" and will hide it")
\ No newline at end of file
+checkAmbiguousNames(devices, getKey("ignores", templateData, []), analyzer)
\ No newline at end of file
@@ -5,6 +5,7 @@ It is both adapted to get French or English SMS messages to remotely manage auto
 
 General command organization is:
     [command] [device name] [value to set].
+    Other orders (like [device name] [command] [value to set]), with optional particles, can be given as grammars.
 
 For example:
     For French:  "allume la lampe de la cuisine", "ouvre le volet du salon", "règle la consigne de la clim du séjour sur 21", ...
@@ -21,10 +22,174 @@ License: GNU GPL V3
 import pathlib
 import os
 import json
+import itertools
+import bisect
+import hashlib
+import unicodedata
+import re
 from re import A, match, search
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
 import unidecode
 
+# Return name of a Domoticz controller, given as an URL or {"url": ..., "name": ...}: its name if not empty, else URL host name
+#   Used by plug-in and tooling scripts, so that they name controllers (recorded into devices) the same way
+def getControllerName(item):
+    if isinstance(item, dict):
+        return item.get("name") or urlparse(item.get("url") or "").hostname
+    return urlparse(item).hostname
+
+# Return errors of Domoticz controllers sharing an in or out topic (controller topics defaulting to domoticzInTopic and domoticzOutTopic settings)
+#   When more than one controller is given, each one needs its own topics, else all of them would execute commands sent to one
+def getControllerTopicErrors(domoticzUrl, domoticzInTopic, domoticzOutTopic):
+    items = domoticzUrl if isinstance(domoticzUrl, list) else [domoticzUrl]
+    errors = []
+    if len(items) < 2:
+        return errors
+    for (key, defaultTopic) in [("domoticzInTopic", domoticzInTopic), ("domoticzOutTopic", domoticzOutTopic)]:
+        controllersByTopic = {}
+        for item in items:
+            topic = (item.get(key) if isinstance(item, dict) else None) or defaultTopic
+            controllersByTopic.setdefault(topic, []).append(getControllerName(item))
+        for (topic, controllerNames) in controllersByTopic.items():
+            if len(controllerNames) > 1:
+                errors.append(F"Controllers {controllerNames} share {key} {topic}, each controller should have its own one")
+    return errors
+
+# Burkhard-Keller tree, indexing words by edit distance, to find close words without comparing all of them
+class BkTree:
+    # Class initialization
+    def __init__(self):
+        self.root = None                                    # Root node (word, {distance: child node})
+
+    # Return edit (Levenshtein) distance between 2 words
+    @staticmethod
+    def distance(word1, word2):
+        previousRow = list(range(len(word2) + 1))
+        for (ptr1, char1) in enumerate(word1):
+            currentRow = [ptr1 + 1]
+            for (ptr2, char2) in enumerate(word2):
+                currentRow.append(min(previousRow[ptr2 + 1] + 1, currentRow[ptr2] + 1, previousRow[ptr2] + (char1 != char2)))
+            previousRow = currentRow
+        return previousRow[-1]
+
+    # Add a word to tree
+    def add(self, word):
+        if self.root == None:
+            self.root = (word, {})
+            return
+        node = self.root
+        while True:
+            distance = self.distance(word, node[0])
+            if distance == 0:
+                return
+            if distance not in node[1]:
+                node[1][distance] = (word, {})
+                return
+            node = node[1][distance]
+
+    # Return list of (distance, word) for words at most maxDistance from given word
+    def search(self, word, maxDistance):
+        result = []
+        nodes = [self.root] if self.root else []
+        while nodes:
+            node = nodes.pop()
+            distance = self.distance(word, node[0])
+            if distance <= maxDistance:
+                result.append((distance, node[0]))
+            # Only children within [distance - maxDistance, distance + maxDistance] may be close enough (triangle inequality)
+            for (childDistance, child) in node[1].items():
+                if distance - maxDistance <= childDistance <= distance + maxDistance:
+                    nodes.append(child)
+        return result
+
+# Compiled checks of values given to a settable device: bounds are parsed, list is normalized and mapping values are indexed once
+class ValueValidator:
+    # Class initialization, from device item
+    def __init__(self, analyzer, deviceItem):
+        self.setType = analyzer.getValue(deviceItem, "setType")       # Value type
+        self.setBy = analyzer.getValue(deviceItem, "setBy", "plugIn")   # Value to be set by 'user' or 'plugIn'
+        # Conversion of value, and its error message
+        if self.setType in ["level", "integer"]:
+            (self.convert, self.convertError) = (int, "is not a valid number")
+        elif self.setType in ["float", "setPoint"]:
+            (self.convert, self.convertError) = (float, "is not a valid floating point")
+        else:
+            (self.convert, self.convertError) = (None, "")
+        # Bounds, converted to value type (level defaulting to 0-100)
+        self.minValue = analyzer.getValue(deviceItem, "minValue", 0 if self.setType == "level" else None)
+        self.maxValue = analyzer.getValue(deviceItem, "maxValue", 100 if self.setType == "level" else None)
+        if self.convert:
+            self.minValue = self.convert(self.minValue) if self.minValue != None else None
+            self.maxValue = self.convert(self.maxValue) if self.maxValue != None else None
+        # Allowed values, normalized
+        self.list = analyzer.getValue(deviceItem, "list")
+        self.listValues = set(analyzer.convertUserData(str(item)) for item in self.list) if self.list else None
+        # Mapping values, and index of their normalized word prefixes (for each word position, items by prefix)
+        self.mapping = analyzer.getValue(deviceItem, "mapping")
+        self.mappingIndex = []
+        for item in self.mapping or {}:
+            for (ptr, word) in enumerate(analyzer.itemWords(item)):
+                if ptr == len(self.mappingIndex):
+                    self.mappingIndex.append({})
+                for length in range(1, len(word) + 1):
+                    self.mappingIndex[ptr].setdefault(word[:length], set()).add(item)
+
+    # Return the only mapping value starting with (normalized) words, as findInDict would do, or None
+    def findMapping(self, words):
+        matchingItems = None
+        for (ptr, word) in enumerate(words):
+            if ptr >= len(self.mappingIndex):
+                return None
+            items = self.mappingIndex[ptr].get(word, set())
+            matchingItems = items if matchingItems == None else matchingItems & items
+            if len(matchingItems) == 1:
+                return next(iter(matchingItems))
+            if not matchingItems:
+                return None
+        return None
+
+    # Check value given by keywords (starting at keywordIndex), setting analyzer value to set, or printing an error
+    #   Value not mapped is given text, as is (rawValue, message part starting at first keyword of value)
+    def check(self, analyzer, keywords, normalizedKeywords, keywordIndex, rawValue):
+        analyzer.valueToSetType = self.setType
+        analyzer.valueToSet = rawValue
+        if self.mapping:
+            # Let findInDict report errors (or correct typing errors) when not found
+            mappingItem = self.findMapping(normalizedKeywords[keywordIndex:]) or analyzer.findInDict(keywords, keywordIndex, self.mapping, "mapping", \
+                analyzer.getValue(analyzer.mappingAbbreviations, analyzer.deviceName), analyzer.getValue(analyzer.mappingTypoTrees, analyzer.deviceName), \
+                False, normalizedKeywords)
+            if mappingItem == "":
+                return
+            analyzer.valueToSetOriginal = mappingItem
+            analyzer.valueToSet = self.mapping[mappingItem]
+            keywordIndex += len(analyzer.itemWords(mappingItem))
+            if keywordIndex < len(keywords):
+                analyzer.printError(F"Can't understand {keywords[keywordIndex:]} after {analyzer.valueToSet}")
+                return
+        if self.listValues != None and analyzer.convertUserData(str(analyzer.valueToSet)) not in self.listValues:
+            analyzer.printError(F"Given value ({analyzer.valueToSet}) should be one of {self.list}")
+            return
+        value = analyzer.valueToSet
+        if self.convert:
+            try:
+                value = self.convert(value)
+            except ValueError:
+                analyzer.printError(F"({analyzer.valueToSet}) {self.convertError}")
+                return
+        if self.minValue != None and value < self.minValue:
+            analyzer.printError(F"Given value ({value}) should not be less than {self.minValue}")
+        elif self.maxValue != None and value > self.maxValue:
+            analyzer.printError(F"Given value ({value}) should not be greater than {self.maxValue}")
+        else:
+            analyzer.setBy = self.setBy
+
 class FF_analyzeCommand:
+    tablesFileCache = {}                                    # Results of tables files loads and checks, by (phase, file name), shared by instances
+    abbreviationsCache = {}                                 # Abbreviation tables of last load, by (normalized items, ignores), shared by instances
+    tablesFileSections = {"settings": "dict", "include": "list", "ignores": "list", "commandValues": "dict", \
+        "commands": "dict", "devices": "dict", "grammars": "list"}  # Sections allowed in tables files, with their type
+
     # Class initialization 
     def __init__(self):
         self.fileVersion = "2.1.1"                          # File version
@@ -34,9 +199,26 @@ class FF_analyzeCommand:
         self.firstErrorMessage = ""                         # First error message seen
         self.allMessages = ""                               # All messages to be printed
         self.ignoresList = []                               # List of keywords to be ignored
+        self.ignoresSet = set()                             # Set of (normalized) keywords to be ignored
+        self.itemWordsCache = {}                            # Normalized words of commands, devices and mapping values (as tokenized), by item
         self.commandValuesDict = {}                         # Dictionary of commandValues
         self.commandsDict = {}                              # Dictionary of commands
         self.devicesDict = {}                               # Dictionary of devices
+        self.settings = {}                                  # Dictionary of settings
+        self.loadedFiles = {}                               # Modification time of loaded tables files, by file name
+        self.commandAbbreviations = ({}, {})                # Shortest abbreviations of commands (by command, by abbreviation)
+        self.deviceAbbreviations = {}                       # Shortest abbreviations of devices, by allowed commandValue
+        self.mappingAbbreviations = {}                      # Shortest abbreviations of mapping values, by device
+        self.valueValidators = {}                           # Compiled value checks (ValueValidator), by settable device
+        self.grammars = []                                  # Compiled grammars merged by item order (lists of (slot, particles, completeMatch) states)
+        self.firstWords = {"command": [], "device": []}     # Sorted first words of commands and devices, to find item given by first keyword
+        self.devicesBeforeCommand = False                   # Does a grammar give device before command?
+        self.typoMaxDistance = 0                            # Maximum edit distance of corrected typing errors (0 to disable correction)
+        self.typoMinConfidence = 0.75                       # Minimum confidence (1 - distance / word length) to accept a correction
+        self.commandTypoTree = []                           # Words of commands, indexed by edit distance (list of BkTree, one per tables file)
+        self.deviceTypoTrees = {}                           # Words of devices by allowed commandValue, indexed by edit distance (lists of BkTree)
+        self.mappingTypoTrees = {}                          # Words of mapping values by device, indexed by edit distance (lists of BkTree)
+        self.typoTreesLoaded = False                        # Are typo trees of this (single file) tables computed?
         self.checkFile = ""                                 # File being scanned
         self.checkPhase = ""                                # Scan phase
         self.command = ""                                   # Command
@@ -45,6 +227,7 @@ class FF_analyzeCommand:
         self.deviceName = ""                                # Device name
         self.deviceId = 0                                   # DeviceId
         self.deviceIdName = ""                              # Name of deviceId
+        self.deviceController = ""                          # Domoticz controller owning device (empty for default one)
         self.deviceCategory = ""                            # Device category
         self.valueToSetType = None                          # Value to set type ()
         self.valueToSet = None                              # Value to set
@@ -63,8 +246,8 @@ class FF_analyzeCommand:
     def printInfo(self, message):
         self.allMessages += (self.utf8ToAscii7(message) if self.convertUtf8ToAscii7Output else message)+"\r\n"
 
-    # Load a dictionary to a file
-    def loadDictionary(self, file):
+    # Load a dictionary to a file (from its content if already read)
+    def loadDictionary(self, file, content = None):
         # Print duplicates on dictionary
         def dict_print_duplicates(ordered_pairs):
             d = {}
@@ -75,13 +258,15 @@ class FF_analyzeCommand:
                     print (F"    {v}")
                 d[k] = v
             return d
-        if os.path.exists(file):
-            with open(file, encoding="UTF-8") as f:
-                try:
-                    return json.loads(f.read(), object_pairs_hook=dict_print_duplicates)
-                except Exception as e:
-                    self.printError(F"{e} when loading {file}")
-                    return None
+        if content != None or os.path.exists(file):
+            try:
+                if content == None:
+                    with open(file, encoding="UTF-8") as f:
+                        content = f.read()
+                return json.loads(content, object_pairs_hook=dict_print_duplicates)
+            except Exception as e:
+                self.printError(F"{e} when loading {file}")
+                return None
         else:
             return {}
 
@@ -157,7 +342,7 @@ class FF_analyzeCommand:
         else:
             isOk = (self.convertUserData(valueIs) == self.convertUserData(valueShouldBe))
         if not isOk:
-            self.printError(F"Error analyzing {self.checkFile}, when {self.checkPhase}: {msg} is {valueIs}, should be "+str(valueShouldBe.keys()).replace("dict_keys(","")[:-1] if type(valueShouldBe).__name__ == "dict" else str(valueShouldBe))
+            self.printError(F"Error analyzing {self.checkFile}, when {self.checkPhase}: {msg} is {valueIs}, should be "+(str(valueShouldBe.keys()).replace("dict_keys(","")[:-1] if type(valueShouldBe).__name__ == "dict" else str(valueShouldBe)))
             if context != None:
                 self.printInfo(F"Context is {context}")
             return False
@@ -181,7 +366,7 @@ class FF_analyzeCommand:
         else:
             isOk = (self.convertUserData(valueIs) != self.convertUserData(valueShouldBe))
         if not isOk:
-            self.printError(F"Error analyzing {self.checkFile}, when {self.checkPhase}: {msg} should not be "+str(valueShouldBe.keys()).replace("dict_keys(","")[:-1] if type(valueShouldBe).__name__ == "dict" else str(valueShouldBe))
+            self.printError(F"Error analyzing {self.checkFile}, when {self.checkPhase}: {msg} should not be "+(str(valueShouldBe.keys()).replace("dict_keys(","")[:-1] if type(valueShouldBe).__name__ == "dict" else str(valueShouldBe)))
             if context != None:
                 self.printInfo(F"Context is {context}")
             return False
@@ -201,22 +386,76 @@ class FF_analyzeCommand:
             return False
         return True
 
+    # Split a message into keywords in one pass, returning (normalized keywords, original keywords, position of keywords in message)
+    #   Words are separated by any Unicode white space, and punctuation around them is removed (except sign of numbers)
+    #   Words to ignore are dropped, as well as ignored elisions in front of words (like "l'" in "l'entrée")
+    #   Position of a keyword is the one of the message word it comes from
+    def tokenize(self, message):
+        normalizedKeywords = []
+        keywords = []
+        positions = []
+        for tokenMatch in re.finditer(r"\S+", message):
+            word = tokenMatch.group()
+            normalizedWord = self.convertUserData(word)
+            if normalizedWord in self.ignoresSet:
+                continue
+            # Remove ignored elision
+            for (ptr, char) in enumerate(word[:-1]):
+                if char in "'’":
+                    if self.convertUserData(word[:ptr]) + "'" in self.ignoresSet:
+                        word = word[ptr+1:]
+                    break
+            # Remove punctuation around word
+            start = 0
+            while start < len(word) and word[start] != "-" and unicodedata.category(word[start]).startswith("P"):
+                start += 1
+            end = len(word)
+            while end > start and unicodedata.category(word[end-1]).startswith("P"):
+                end -= 1
+            word = word[start:end]
+            normalizedWord = self.convertUserData(word)
+            if word and normalizedWord not in self.ignoresSet:
+                normalizedKeywords.append(normalizedWord)
+                keywords.append(word)
+                positions.append(tokenMatch.start())
+        return normalizedKeywords, keywords, positions
+
+    # Return normalized words of a command, device or mapping value, tokenized as messages are (so that they match)
+    #   Items made only of ignored words keep all their words
+    def itemWords(self, item):
+        words = self.itemWordsCache.get(item)
+        if words == None:
+            words = self.tokenize(item)[0] or self.convertUserData(item).split(" ")
+            self.itemWordsCache[item] = words
+        return words
+
     # Find keyword in dictionary, checking for multiple matches
     #   List can contain values with spaces. In this case, as many keywords as word count in list element are compared
-    def findInDict(self, keywords, startPtr, dict, text):
+    #   When given, abbreviations table (as returned by makeAbbreviations) resolves exact abbreviations directly,
+    #       and gives shortest forms to suggest when keywords are ambiguous
+    #   When given, typoTree (list of BkTree of item words) corrects an unknown word if close enough to only one known word
+    #   When completeMatch is set, next keywords belong to another part of message,
+    #       so an item whose all words were given stops the scan when next keyword matches nothing
+    #   When given, normalizedKeywords (as returned by tokenize) avoids converting keywords again
+    def findInDict(self, keywords, startPtr, dict, text, abbreviations = None, typoTree = None, completeMatch = False, normalizedKeywords = None):
+        if normalizedKeywords == None:
+            normalizedKeywords = self.convertUserData(keywords)
+        if abbreviations:
+            for ptr in range(startPtr, len(keywords)):
+                item = abbreviations[1].get(" ".join(normalizedKeywords[startPtr:ptr+1]))
+                if item != None:
+                    return item
         previousMatchingList = []
-        words = []
-        # Remaps keywords from 0
-        for ptr in range(startPtr, len(keywords)):
-            words.append(keywords[ptr])
+        # Remaps (normalized) keywords from 0
+        words = normalizedKeywords[startPtr:]
         # Scan each device, word by word (to be able to limit list of displayed possibilities when dupplicates found)
         for wordPtr in range(0,len(words)):
             # List of matching devices
             matchingList = []
             # For each item in search list
             for item in dict.keys():
-                # Split item using space as separator
-                itemParts = item.split(" ")
+                # Split item into (normalized) words
+                itemParts = self.itemWords(item)
                 matchFound = True
                 # For each keyword in item
                 for ptr in range(0, wordPtr+1):
@@ -226,7 +465,7 @@ class FF_analyzeCommand:
                         matchFound = False
                     else:
                         # Are the keyword chars same as item?
-                        if self.convertUserData(itemParts[ptr][:len(words[ptr])]) != self.convertUserData(words[ptr]):
+                        if itemParts[ptr][:len(words[ptr])] != words[ptr]:
                             # No, this is not correct
                             matchFound = False
                 # If we got a match
@@ -235,10 +474,25 @@ class FF_analyzeCommand:
                     matchingList.append(item)
             # Here, we scanned all devices
             if len(matchingList) == 0:
+                # Keep the only item completely given, if any
+                if completeMatch and wordPtr:
+                    givenWords = " ".join(words[:wordPtr])
+                    completeList = [item for item in previousMatchingList if " ".join(self.itemWords(item)) == givenWords]
+                    if len(completeList) == 1:
+                        return completeList[0]
+                # Try to correct a typing error in this word, then search again
+                correctedWord = self.correctTypo(words[wordPtr], typoTree)
+                if correctedWord:
+                    self.printInfo(F"Understood {keywords[startPtr + wordPtr]} as {correctedWord}")
+                    correctedKeywords = keywords.copy()
+                    correctedKeywords[startPtr + wordPtr] = correctedWord
+                    correctedNormalizedKeywords = normalizedKeywords.copy()
+                    correctedNormalizedKeywords[startPtr + wordPtr] = correctedWord
+                    return self.findInDict(correctedKeywords, startPtr, dict, text, abbreviations, typoTree, completeMatch, correctedNormalizedKeywords)
                 # No match found
                 if len(previousMatchingList):
                     # Previous round found dupplicates, print them
-                    self.printError(F"{keywords[startPtr:]} is an ambiguous {text}, could be {previousMatchingList}")
+                    self.printError(F"{keywords[startPtr:]} is an ambiguous {text}, could be {previousMatchingList}"+self.suggestAbbreviations(previousMatchingList, abbreviations))
                 else:
                     # Previous round found nothing, list all
                     self.printError(F"{keywords[startPtr:]} is not a known {text}, use "+str(dict.keys()).replace("dict_keys(","")[:-1])
@@ -251,153 +505,652 @@ class FF_analyzeCommand:
         # We're at end of scan
         if len(previousMatchingList):
             # Previous round found dupplicates, print them
-            self.printError(F"{keywords[startPtr:]} is an ambiguous {text}, could be {previousMatchingList}")
+            self.printError(F"{keywords[startPtr:]} is an ambiguous {text}, could be {previousMatchingList}"+self.suggestAbbreviations(previousMatchingList, abbreviations))
         else:
             # Previous round found nothing, list all
             self.printError(F"{keywords[startPtr:]} is not a known {text}, use "+str(dict.keys()).replace("dict_keys(","")[:-1])
         return ""
 
+    # Return the only known word close enough to a (mistyped) word, or None
+    #   Trees of several tables files are searched together, a word known by more than one counting once
+    def correctTypo(self, word, typoTree):
+        if not typoTree or self.typoMaxDistance <= 0:
+            return None
+        word = self.convertUserData(word)
+        candidates = sorted({candidate for tree in typoTree for candidate in tree.search(word, self.typoMaxDistance)})
+        # Refuse if nothing found, or best distance is shared by more than one word
+        if not candidates or (len(candidates) > 1 and candidates[1][0] == candidates[0][0]):
+            return None
+        distance, candidate = candidates[0]
+        if distance == 0 or 1 - distance / max(len(word), len(candidate)) < self.typoMinConfidence:
+            return None
+        return candidate
+
+    # Return a BkTree of words of items
+    def makeTypoTree(self, items):
+        typoTree = BkTree()
+        for item in items:
+            for word in self.itemWords(item):
+                typoTree.add(word)
+        return typoTree
+
+    # Compute typo trees of commands, devices (by allowed commandValue, all devices being under "") and mapping values (by device)
+    #   Trees are computed once, as parts of this file tables to be merged with other files ones
+    def loadTypoTrees(self):
+        if self.typoTreesLoaded:
+            return
+        self.commandTypoTree = [self.makeTypoTree(self.commandsDict.keys())]
+        self.deviceTypoTrees = {}
+        for commandValue in self.commandValuesDict.keys():
+            filteredDevicesDict = dict()
+            self.filterDictionary(self.devicesDict, "allow", commandValue, filteredDevicesDict)
+            self.deviceTypoTrees[commandValue] = [self.makeTypoTree(filteredDevicesDict.keys())]
+        self.deviceTypoTrees[""] = [self.makeTypoTree(self.devicesDict.keys())]
+        self.mappingTypoTrees = {}
+        for (deviceName, deviceItem) in self.devicesDict.items():
+            deviceMapping = self.getValue(deviceItem, "mapping")
+            if deviceMapping:
+                self.mappingTypoTrees[deviceName] = [self.makeTypoTree(deviceMapping.keys())]
+        self.typoTreesLoaded = True
+
+    # Return shortest forms of ambiguous items as text to add to error message (empty if none known)
+    def suggestAbbreviations(self, items, abbreviations):
+        if not abbreviations:
+            return ""
+        suggestions = [abbreviations[0][item] for item in items if abbreviations[0].get(item)]
+        return F", shortest forms are {suggestions}" if suggestions else ""
+
+    # Return shortest prefixes of words (list) isolating them from competitors (list of word lists), or None if not possible
+    #   Each competitor needs at least one word whose prefix doesn't match it
+    def shortestPrefixes(self, words, competitors):
+        # Length of prefix needed for each word to differ from each competitor (None if word is a prefix of competitor one)
+        needs = []
+        for competitor in competitors:
+            need = []
+            for (word, competitorWord) in zip(words, competitor):
+                common = len(os.path.commonprefix([word, competitorWord]))
+                need.append(common + 1 if common < len(word) else None)
+            if not any(need):
+                return None
+            needs.append(need)
+        # Useful prefix lengths for each word (limited to 1 and 3 longest ones, to keep search short)
+        candidates = []
+        for ptr in range(len(words)):
+            lengths = sorted({need[ptr] for need in needs if need[ptr]})
+            candidates.append([1] + [length for length in lengths[-3:] if length > 1])
+        # Keep shortest combination isolating words from all competitors
+        bestLengths = None
+        for lengths in itertools.product(*candidates):
+            if bestLengths == None or sum(lengths) < sum(bestLengths):
+                if all(any(needed and length >= needed for (length, needed) in zip(lengths, need)) for need in needs):
+                    bestLengths = lengths
+        if bestLengths == None:
+            return None
+        return [word[:length] for (word, length) in zip(words, bestLengths)]
+
+    # Compute shortest unambiguous abbreviation of each item (as findInDict matches them, word by word)
+    #   Returns (abbreviation by item, None if item can't be isolated, item by abbreviation)
+    def makeAbbreviations(self, items):
+        itemWords = {}
+        for item in items:
+            itemWords[item] = self.itemWords(item)
+        byItem = {}
+        # One word abbreviations: first word prefix must be longer than common prefix with closest (sorted) first words
+        firstWords = sorted((words[0], item) for (item, words) in itemWords.items())
+        for (index, (word, item)) in enumerate(firstWords):
+            common = 0
+            for neighbor in (index - 1, index + 1):
+                if 0 <= neighbor < len(firstWords):
+                    common = max(common, len(os.path.commonprefix([word, firstWords[neighbor][0]])))
+            byItem[item] = word[:common+1] if common < len(word) else None
+        # Group items by first letter of their first words, for each word count (only items in same group can conflict)
+        groups = {}
+        for (item, words) in itemWords.items():
+            for count in range(2, len(words)+1):
+                groups.setdefault(tuple(word[:1] for word in words[:count]), []).append(item)
+        # Multiple words abbreviations, only when they may be shorter than current one
+        for (item, words) in itemWords.items():
+            for count in range(2, len(words)+1):
+                if byItem[item] != None and 2 * count - 1 >= len(byItem[item]):
+                    break
+                competitors = [itemWords[other][:count] for other in groups[tuple(word[:1] for word in words[:count])] if other != item]
+                prefixes = self.shortestPrefixes(words[:count], competitors)
+                if prefixes:
+                    abbreviation = " ".join(prefixes)
+                    if byItem[item] == None or len(abbreviation) < len(byItem[item]):
+                        byItem[item] = abbreviation
+        # Lengthen abbreviation words that would be removed as ignored words (a longer prefix stays unambiguous)
+        ignores = self.ignoresSet
+        byAbbreviation = {}
+        for (item, abbreviation) in byItem.items():
+            if abbreviation != None:
+                prefixes = abbreviation.split(" ")
+                for (ptr, word) in enumerate(itemWords[item][:len(prefixes)]):
+                    while prefixes[ptr] in ignores and len(prefixes[ptr]) < len(word):
+                        prefixes[ptr] = word[:len(prefixes[ptr])+1]
+                byItem[item] = " ".join(prefixes)
+                byAbbreviation[byItem[item]] = item
+        return byItem, byAbbreviation
+
+    # Return abbreviation tables of items (as makeAbbreviations), reusing the ones of last load when the same items are given
+    #   Used abbreviation tables are saved into usedAbbreviations, to become the cache of next load
+    def cachedAbbreviations(self, items, usedAbbreviations):
+        key = (tuple(sorted((item, tuple(self.itemWords(item))) for item in items)), frozenset(self.ignoresSet))
+        abbreviations = usedAbbreviations.get(key) or self.abbreviationsCache.get(key) or self.makeAbbreviations(items)
+        usedAbbreviations[key] = abbreviations
+        return abbreviations
+
+    # Compute abbreviation tables of commands and devices (by allowed commandValue)
+    #   These tables depend on items of all tables files (any of them can be a competitor), they're computed again only for changed item lists
+    def loadAbbreviations(self):
+        usedAbbreviations = {}
+        self.commandAbbreviations = self.cachedAbbreviations(self.commandsDict.keys(), usedAbbreviations)
+        self.deviceAbbreviations = {}
+        for commandValue in self.commandValuesDict.keys():
+            filteredDevicesDict = dict()
+            self.filterDictionary(self.devicesDict, "allow", commandValue, filteredDevicesDict)
+            self.deviceAbbreviations[commandValue] = self.cachedAbbreviations(filteredDevicesDict.keys(), usedAbbreviations)
+        # Devices given before command are searched in all devices
+        if self.devicesBeforeCommand:
+            self.deviceAbbreviations[""] = self.cachedAbbreviations(self.devicesDict.keys(), usedAbbreviations)
+        FF_analyzeCommand.abbreviationsCache = usedAbbreviations
+
+    # Compute abbreviation tables of mapping values (by device)
+    def loadMappingAbbreviations(self):
+        self.mappingAbbreviations = {}
+        for (deviceName, deviceItem) in self.devicesDict.items():
+            deviceMapping = self.getValue(deviceItem, "mapping")
+            if deviceMapping:
+                self.mappingAbbreviations[deviceName] = self.makeAbbreviations(deviceMapping.keys())
+
+    # Compile a grammar (list of items) into a list of states, putting error messages for each problem found
+    #   Items are "command", "device", "value" (last one, added if not given) or a list of optional particles, which may precede next item
+    #   Each state is (slot, particles, completeMatch), message being parsed in one pass, state after state:
+    #       a keyword in particles is skipped, then slot is read (value being all remaining keywords)
+    #   Command or device followed by the other one stops at its last word, else it would swallow next keywords
+    def compileGrammar(self, grammar):
+        states = []
+        particles = set()
+        if self.compareType("grammar type", grammar, "list"):
+            for item in grammar:
+                if isinstance(item, list):
+                    for particle in item:
+                        if self.compareType("particle type", particle, "str", grammar):
+                            particles.add(self.convertUserData(particle))
+                elif item in ["command", "device", "value"]:
+                    if item in [state[0] for state in states]:
+                        self.printError(F"{item} is given twice in {grammar}")
+                    elif states and states[-1][0] == "value":
+                        self.printError(F"value should be last in {grammar}")
+                    else:
+                        states.append((item, particles, False))
+                        particles = set()
+                else:
+                    self.printError(F"Can't understand {item} in {grammar}, use 'command', 'device', 'value' or a list of particles")
+            slots = [state[0] for state in states]
+            for item in ["command", "device"]:
+                if item not in slots:
+                    self.printError(F"{item} is missing in {grammar}")
+            if "value" not in slots:
+                states.append(("value", particles, False))
+            elif particles:
+                self.printError(F"Particles {sorted(particles)} should precede an item in {grammar}")
+            # Set completeMatch of command or device followed by the other one
+            for ptr in range(len(states) - 1):
+                if states[ptr + 1][0] != "value":
+                    states[ptr] = (states[ptr][0], states[ptr][1], True)
+            if "command" in slots and "device" in slots and slots.index("device") < slots.index("command"):
+                self.devicesBeforeCommand = True
+        return states
+
+    # Compile grammars, merging those giving items in same order (particles of each state being merged), in order of first definition
+    #   As value is always last, merged grammars only differ by their first item (command or device)
+    def compileGrammars(self, grammars):
+        merged = {}
+        for states in [self.compileGrammar(grammar) for grammar in grammars]:
+            slots = tuple(state[0] for state in states)
+            if slots in merged:
+                merged[slots] = [(slot, particles | otherParticles, completeMatch) \
+                    for ((slot, particles, completeMatch), (otherSlot, otherParticles, otherMatch)) in zip(merged[slots], states)]
+            elif states:
+                merged[slots] = states
+        return list(merged.values())
+
+    # Compute sorted first words of commands and devices
+    def loadFirstWords(self):
+        self.firstWords = {"command": sorted({self.itemWords(item)[0] for item in self.commandsDict.keys()}), \
+            "device": sorted({self.itemWords(item)[0] for item in self.devicesDict.keys()})}
+
+    # Check if a (normalized) keyword starts one of (sorted) words
+    def startsWord(self, keyword, words):
+        ptr = bisect.bisect_left(words, keyword)
+        return ptr < len(words) and words[ptr].startswith(keyword)
+
+    # Return compiled grammar starting with the item (command or device) first keyword (after an optional particle) belongs to
+    #   A mistyped first keyword is corrected (in keywords and normalizedKeywords) against words of both commands and devices,
+    #       so that keyword is resolved once, by the grammar selected
+    #   First grammar is used when keyword may belong to both items or none (its errors being reported)
+    def selectGrammar(self, keywords, normalizedKeywords):
+        if len(self.grammars) <= 1:
+            return self.grammars[0] if self.grammars else None
+        keywordIndex = 0
+        if normalizedKeywords and any(normalizedKeywords[0] in grammar[0][1] for grammar in self.grammars):
+            keywordIndex = 1
+        if keywordIndex >= len(keywords):
+            return self.grammars[0]
+        keyword = normalizedKeywords[keywordIndex]
+        slots = [slot for slot in self.firstWords if self.startsWord(keyword, self.firstWords[slot])]
+        if not slots:
+            correctedWord = self.correctTypo(keyword, self.commandTypoTree + self.getValue(self.deviceTypoTrees, "", []))
+            if correctedWord:
+                self.printInfo(F"Understood {keywords[keywordIndex]} as {correctedWord}")
+                keywords[keywordIndex] = correctedWord
+                normalizedKeywords[keywordIndex] = correctedWord
+                slots = [slot for slot in self.firstWords if self.startsWord(correctedWord, self.firstWords[slot])]
+        for grammar in self.grammars:
+            if grammar[0][0] in slots:
+                return grammar
+        return self.grammars[0]
+
+    # Parse keywords (and their normalized form) with a compiled grammar in one pass, setting command and device name
+    #   Return index of first keyword of value to set, or None if keywords don't follow grammar (errors being printed)
+    def parseGrammar(self, grammar, keywords, normalizedKeywords):
+        self.command = ""
+        self.deviceName = ""
+        keywordIndex = 0
+        for (slot, particles, completeMatch) in grammar:
+            # Skip optional particle
+            if keywordIndex < len(keywords) and normalizedKeywords[keywordIndex] in particles:
+                keywordIndex += 1
+            if slot == "command":
+                self.command = self.findInDict(keywords, keywordIndex, self.commandsDict, "command", \
+                    self.commandAbbreviations, self.commandTypoTree, completeMatch, normalizedKeywords)
+                if self.command == "":
+                    return None
+                keywordIndex += len(self.itemWords(self.command))
+            elif slot == "device":
+                # Search devices allowing command if already known, else all devices
+                commandCommandValue = self.getValue2(self.commandsDict, self.command, "commandValue", "") if self.command else ""
+                if commandCommandValue:
+                    filteredDevicesDict = dict()
+                    self.filterDictionary(self.devicesDict, "allow", commandCommandValue, filteredDevicesDict)
+                else:
+                    filteredDevicesDict = self.devicesDict
+                self.deviceName = self.findInDict(keywords, keywordIndex, filteredDevicesDict, "device", \
+                    self.getValue(self.deviceAbbreviations, commandCommandValue), self.getValue(self.deviceTypoTrees, commandCommandValue), completeMatch, normalizedKeywords)
+                if self.deviceName == "":
+                    return None
+                keywordIndex += len(self.itemWords(self.deviceName))
+        return keywordIndex
+
+    # Compile value checks of settable devices (allowing a commandValue with set flag)
+    def loadValueValidators(self):
+        setCommandValues = [commandValue for commandValue in self.commandValuesDict if self.getValue2(self.commandValuesDict, commandValue, "set", False)]
+        self.valueValidators = {}
+        for (deviceName, deviceItem) in self.devicesDict.items():
+            if any(commandValue in self.getValue(deviceItem, "allow", []) for commandValue in setCommandValues):
+                self.valueValidators[deviceName] = ValueValidator(self, deviceItem)
+
+    # Check a device item (dict), putting error messages for each problem found
+    def checkDevice(self, key, deviceItem):
+        if self.compareType("deviceItem type", deviceItem, "dict"):
+            # Extract index
+            deviceIndex = self.getValue(deviceItem, "index")
+            if self.compareType("device index", deviceIndex, ["str", "int"]):
+                # Index should not be empty or zero
+                self.compareNotValue("device index", deviceIndex, "", deviceItem)
+                self.compareNotValue("device index", deviceIndex, 0, deviceItem)
+            # Extract controller, if given
+            deviceController = self.getValue(deviceItem, "controller", "")
+            if self.compareType("device controller", deviceController, "str", deviceItem):
+                pass
+            # Extract category
+            deviceCategory = self.getValue(deviceItem, "category")
+            if self.compareType("device category", deviceCategory, "str"):
+                pass
+            # Extract allowed commands and check them
+            deviceAllowedCommands = self.getValue(deviceItem, "allow")
+            if self.compareType("device allowed commands", deviceAllowedCommands, ["str","list"]):
+                # Does the device have one commandValue with a set attribute?
+                commandSet = False
+                # Scan all allowed command values
+                for item in deviceAllowedCommands:
+                    # Does this commandValue have the set flag set?
+                    if self.getValue2(self.commandValuesDict, item, "set", False):
+                        # Yes, set flag
+                        commandSet = True
+                        break
+                # Check other elements giving commandSet flag
+                if commandSet:
+                    # Command has a set flag, get mandatory setType value
+                    self.valueToSetType = self.getValue(deviceItem, "setType")
+                    # Check setType value as string
+                    if self.compareType("setType type", self.valueToSetType, "str", deviceItem):
+                        # Check for valid setType given
+                        if self.compareValue("setType", self.valueToSetType, ['level','setPoint', 'integer', 'float','string']):
+                            # Set min/max value depending on setType
+                            if self.valueToSetType == 'level':
+                                minValue = 0
+                                maxValue = 100
+                            else:
+                                minValue = None
+                                maxValue = None
+                            # Set authorized data type(s) depending on setType
+                            if self.valueToSetType == 'level' or self.valueToSetType == 'integer':
+                                allowedDataTypes = 'int'
+                            elif self.valueToSetType == 'float' or self.valueToSetType == 'setPoint':
+                                allowedDataTypes = ['int', 'float']
+                            else:
+                                allowedDataTypes = 'str'
+                            # Scan all items in device item
+                            for item in deviceItem.keys():
+                                    # Get item value
+                                    itemValue = deviceItem[item]
+                                    if item == "mapping":
+                                        deviceMap = self.getValue(deviceItem, "mapping")
+                                        # This should be a list of mapping value (dict)
+                                        if self.compareType("deviceMap type", deviceMap, "dict", deviceItem):
+                                            ## Check each value type against authorized ones
+                                            for mappingKey in itemValue.keys():
+                                                if self.compareType("mapping value type", itemValue[mappingKey], allowedDataTypes, deviceItem):
+                                                    pass
+                                    elif item == "minValue":
+                                        if self.compareType("minValue type", itemValue, allowedDataTypes, deviceItem):
+                                            minValue = itemValue
+                                    elif item == "maxValue":
+                                        if self.compareType("maxValue type", itemValue, allowedDataTypes, deviceItem):
+                                            maxValue = itemValue
+                                    elif item == "list":
+                                        # Check type as list
+                                        if self.compareType("list type", itemValue, "list", deviceItem):
+                                            # Check each item in list
+                                            for item in itemValue:
+                                                if self.compareType("list value type", item, allowedDataTypes, deviceItem):
+                                                    pass
+                                    elif item == "setBy":
+                                        if self.compareValue("setBy", itemValue, ['plugIn', 'user']):
+                                            pass
+                                    elif item not in ['index', 'category', 'allow', 'setType', 'controller']:
+                                        # And unknown item has been specified
+                                        self.printError(F"Can't understand {item} in {deviceItem} for {key}")
+                            # Check for min/max values
+                            if minValue != None and maxValue != None:
+                                # Min should be <= to max
+                                if minValue > maxValue:
+                                    self.printError(F"minValue ({minValue}) should be less or equal to maxValue ({maxValue})")
+
+    # Check tables (ignores, command values, commands, devices and grammars), putting error messages for each problem found
+    def checkTables(self, decodeData):
+        ### Checking  decodeData (dict)
+        if self.compareType("decodeData type", decodeData, "dict"):
+            ### Checking "ignores": ["of", "the", ...]
+            self.checkPhase = "checking ignores"
+            self.ignoresList = self.getValue(decodeData,"ignores")
+            # Extract all "ignores" (list)
+            if self.compareType("self.ignoresList type", self.ignoresList, "list"):
+                self.ignoresSet = set(self.convertUserData(self.ignoresList))
+                self.itemWordsCache = {}
+        ### Checking "commandValues": {	"cdeOn":{"codeValue":1}, ...}
+        self.checkPhase = "checking command values"
+        self.commandValuesDict =  self.getValue(decodeData,"commandValues")
+        # Extract all "commandValues" (dict)
+        if self.compareType("commandValuesDict type", self.commandValuesDict, "dict"):
+            # For each item in self.commandValuesDict
+            for key in self.commandValuesDict.keys():
+                # Key should not be in ignore list
+                if self.notInIgnoreList("key", key):
+                    # Check codeValue (dict)
+                    codeValueItem = self.commandValuesDict[key]
+                    if self.compareType("codeValueItem type", codeValueItem, "dict"):
+                        # Get the "codeValue" (int)
+                        codeValue = self.getValue(codeValueItem, "codeValue")
+                        if self.compareType("codeValue type", codeValue, "int", codeValueItem):
+                            pass
+
+        ### Checking "commands": {"turn":{"commandValue":"cdeSet"}, ...}
+        self.checkPhase = "checking commands"
+        # Extract all "commands" list
+        self.commandsDict =  self.getValue(decodeData,"commands")
+        if self.compareType("commandList type", self.commandsDict, "dict"):
+            # For each item in self.commandsDict
+            for key in self.commandsDict.keys():
+                # Key should not be in ignore list
+                if self.notInIgnoreList("key", key):
+                    commandItem = self.commandsDict[key]
+                    if self.compareType("commandItem type", commandItem, "dict"):
+                        # Get the first "command"
+                        commandCommandValue = self.getValue(commandItem, "commandValue")
+                        # Check command keyword
+                        if self.compareType("commandCommandValue type", commandCommandValue, "str", commandItem):
+                            # Value should be in self.commandValuesDict
+                            if self.compareValue("command commandValue", commandCommandValue , self.commandValuesDict, commandItem):
+                                pass
+
+        ### Checking "devices": {"kitchen target temperature":{"index":86, "category":"Setpoint", "allow":["cdeShow","cdeSet"], "setType": "setPoint", "minValue": -40, "maxValue": 100}, ...}
+        self.checkPhase = "checking devices"
+        # Extract all "devices"
+        self.devicesDict =  self.getValue(decodeData,"devices")
+        if self.compareType("self.devicesDict type", self.devicesDict, "dict"):
+            # For each item in self.devicesDict
+            for key in self.devicesDict.keys():
+                self.checkDevice(key, self.devicesDict[key])
+
+        ### Checking "grammars": [["command", "device", "value"], ["device", "command", ["to"], "value"], ...]
+        self.checkPhase = "checking grammars"
+        grammars = self.getValue(decodeData, "grammars", [["command", "device", "value"]])
+        self.devicesBeforeCommand = False
+        if self.compareType("grammars type", grammars, "list"):
+            self.grammars = self.compileGrammars(grammars)
+
+    # Use tables merged from files already checked one by one (ignores, command values, commands, devices and grammars)
+    def setTables(self, decodeData):
+        self.ignoresList = self.getValue(decodeData, "ignores", [])
+        self.ignoresSet = set(self.convertUserData(self.ignoresList))
+        self.itemWordsCache = {}
+        for (name, section) in [("commandValuesDict", "commandValues"), ("commandsDict", "commands"), ("devicesDict", "devices")]:
+            setattr(self, name, self.getValue(decodeData, section))
+            self.compareType(F"{section} type", getattr(self, name), "dict")
+        self.devicesBeforeCommand = False
+        self.grammars = self.compileGrammars(self.getValue(decodeData, "grammars", [["command", "device", "value"]]))
+
+    # Compile parts of checked tables depending only on this file (words of items, value checks and abbreviations of mapping values)
+    def compileTables(self):
+        for item in itertools.chain(self.commandsDict.keys(), self.devicesDict.keys()):
+            self.itemWords(item)
+        self.loadValueValidators()
+        self.loadMappingAbbreviations()
+        self.typoTreesLoaded = False
+
+    # Merge compiled parts of tables files (analyzers given in file order, first definition of an item being kept, as mergeTables does)
+    #   then compute parts depending on all files (abbreviations of commands and devices)
+    def mergeCompiledTables(self, parts):
+        itemWordsCache = {}
+        valueValidators = {}
+        mappingAbbreviations = {}
+        for part in parts:
+            for (item, words) in part.itemWordsCache.items():
+                itemWordsCache.setdefault(item, words)
+            for (deviceName, validator) in part.valueValidators.items():
+                if deviceName in self.devicesDict:
+                    valueValidators.setdefault(deviceName, validator)
+            for (deviceName, abbreviations) in part.mappingAbbreviations.items():
+                if deviceName in self.devicesDict:
+                    mappingAbbreviations.setdefault(deviceName, abbreviations)
+        self.itemWordsCache = itemWordsCache
+        self.valueValidators = valueValidators
+        self.mappingAbbreviations = mappingAbbreviations
+        self.loadAbbreviations()
+        self.loadFirstWords()
+
+    # Merge typo trees of tables files (analyzers given in file order), computing the ones not yet known
+    def mergeTypoTrees(self, parts):
+        commandTypoTree = []
+        deviceTypoTrees = {}
+        mappingTypoTrees = {}
+        for part in parts:
+            part.loadTypoTrees()
+            commandTypoTree += part.commandTypoTree
+            for (commandValue, trees) in part.deviceTypoTrees.items():
+                deviceTypoTrees[commandValue] = deviceTypoTrees.get(commandValue, []) + trees
+            for (deviceName, trees) in part.mappingTypoTrees.items():
+                if deviceName in self.devicesDict:
+                    mappingTypoTrees.setdefault(deviceName, trees)
+        self.commandTypoTree = commandTypoTree
+        self.deviceTypoTrees = deviceTypoTrees
+        self.mappingTypoTrees = mappingTypoTrees
+
+    # Return a new analyzer to check one tables file, with same conversion options
+    def newChecker(self, fileName):
+        checker = FF_analyzeCommand()
+        checker.convertUtf8ToAscii7Input = self.convertUtf8ToAscii7Input
+        checker.convertUtf8ToAscii7Output = self.convertUtf8ToAscii7Output
+        checker.checkFile = pathlib.Path(fileName).name
+        return checker
+
+    # Load a tables file and check its sections type, returning (data, first error message, all messages)
+    #   Result is cached, file being decoded again only if its content changed
+    def loadTablesFile(self, fileName):
+        try:
+            with open(fileName, "rb") as stream:
+                content = stream.read()
+        except OSError as e:
+            return None, F"{e} when loading {fileName}", F"{e} when loading {fileName}\r\n"
+        contentHash = hashlib.sha1(content).hexdigest()
+        cached = self.tablesFileCache.get(("load", fileName))
+        if cached and cached[0] == contentHash:
+            return cached[1]
+        checker = self.newChecker(fileName)
+        checker.checkPhase = "checking file"
+        data = checker.loadDictionary(fileName, content.decode("UTF-8", errors="replace"))
+        if data != None and checker.compareType("decodeData type", data, "dict"):
+            for (section, sectionData) in data.items():
+                if section not in self.tablesFileSections:
+                    checker.printError(F"Can't understand section {section} in {fileName}, use {list(self.tablesFileSections)}")
+                elif checker.compareType(F"{section} type", sectionData, self.tablesFileSections[section]):
+                    pass
+        result = (data if not checker.errorSeen else None, checker.firstErrorMessage, checker.allMessages)
+        self.tablesFileCache[("load", fileName)] = (contentHash, result)
+        return result
+
+    # Check tables of a file against command values and ignores of all files (context), compiling them if valid
+    #   Return (first error message, all messages, analyzer holding compiled tables of file)
+    #   Result is cached, file being checked and compiled again only if its content or context changed
+    def checkTablesFile(self, fileName, data, context):
+        key = hashlib.sha1(json.dumps([data, context, self.convertUtf8ToAscii7Input], sort_keys=True).encode("UTF-8")).hexdigest()
+        cached = self.tablesFileCache.get(("check", fileName))
+        if cached and cached[0] == key:
+            return cached[1]
+        checker = self.newChecker(fileName)
+        checker.checkTables(dict(context, **data))
+        if not checker.errorSeen:
+            checker.compileTables()
+        result = (checker.firstErrorMessage, checker.allMessages, checker)
+        self.tablesFileCache[("check", fileName)] = (key, result)
+        return result
+
+    # Merge sections of tables files ([(file name, data)]), first definition of an item being kept
+    #   Items defined in more than one file (ignoring case and accents for commands and devices) are reported if requested
+    def mergeTables(self, tablesFiles, sections, reportDuplicates):
+        mergedData = {}
+        origins = {}
+        for (fileName, data) in tablesFiles:
+            for section in sections:
+                if section not in data:
+                    continue
+                sectionData = data[section]
+                if section == "ignores":
+                    mergedData.setdefault(section, [])
+                    mergedData[section] += [item for item in sectionData if item not in mergedData[section]]
+                elif section == "grammars":
+                    if section not in mergedData:
+                        mergedData[section] = sectionData
+                        origins[section] = fileName
+                    elif reportDuplicates:
+                        self.printInfo(F"Warning: grammars of {fileName} ignored, already given in {origins[section]}")
+                else:
+                    mergedData.setdefault(section, {})
+                    for (key, value) in sectionData.items():
+                        originKey = (section, self.convertUserData(key) if section in ["commands", "devices"] else key)
+                        if originKey in origins:
+                            if reportDuplicates:
+                                self.printInfo(F"Warning: {section} item >{key}< of {fileName} ignored, already given in {origins[originKey]}")
+                        else:
+                            origins[originKey] = fileName
+                            mergedData[section][key] = value
+        return mergedData
+
+    # Load a tables file and the ones it includes, each file being loaded, checked and compiled independently and in parallel
+    #   Errors of all files are reported, load failing if any file (main or included one) can't be loaded or has errors
+    #   Included files can't include other files
+    #   Return (merged data, analyzers holding compiled tables of each file), or (None, None) if a file has errors
+    def loadIncludes(self, fileName, includes):
+        if not all([self.compareType("include item type", include, "str") for include in includes]):
+            return None, None
+        folder = os.path.dirname(fileName)
+        fileNames = [fileName] + [os.path.join(folder, include) for include in includes]
+        for name in fileNames:
+            self.loadedFiles[name] = os.path.getmtime(name) if os.path.exists(name) else None
+        # Report errors of all files, returning True if none found
+        def checkResults(names, results):
+            for (name, (firstErrorMessage, allMessages)) in zip(names, results):
+                if firstErrorMessage:
+                    self.allMessages += allMessages
+                    self.firstErrorMessage = self.firstErrorMessage or firstErrorMessage
+                    self.errorSeen = True
+            return not self.errorSeen
+        with ThreadPoolExecutor(max_workers=len(fileNames)) as executor:
+            # Load files and check their sections type
+            loadResults = list(executor.map(self.loadTablesFile, fileNames))
+            if not checkResults(fileNames, [result[1:] for result in loadResults]):
+                return None, None
+            loadedFiles = [(name, result[0]) for (name, result) in zip(fileNames, loadResults)]
+            for (name, data) in loadedFiles[1:]:
+                if "include" in data:
+                    self.printError(F"Can't include other files in {name}, only {fileName} can")
+            if self.errorSeen:
+                return None, None
+            # Check each file content against command values and ignores of all files
+            context = dict({"ignores": [], "commandValues": {}, "commands": {}, "devices": {}}, \
+                **self.mergeTables(loadedFiles, ["ignores", "commandValues"], False))
+            results = list(executor.map(lambda item: self.checkTablesFile(item[0], item[1], context), loadedFiles))
+            if not checkResults(fileNames, [result[:2] for result in results]):
+                return None, None
+        return self.mergeTables(loadedFiles, ["settings", "ignores", "commandValues", "commands", "devices", "grammars"], True), \
+            [result[2] for result in results]
+
+    # Load tables file (and the ones it includes), then check and compile them
+    #   Included files are checked and compiled one by one (and cached), their compiled parts being then merged
     def loadData(self, fileName):
         # Load JSON file
         self.checkFile = pathlib.Path(fileName).name
         self.checkPhase = "checking file"
+        self.loadedFiles = {fileName: os.path.getmtime(fileName) if os.path.exists(fileName) else None}
         decodeData = self.loadDictionary(fileName)
+        parts = None
+        # Load included files, if any
+        if isinstance(decodeData, dict) and "include" in decodeData:
+            includes = self.getValue(decodeData, "include")
+            if self.compareType("include type", includes, "list"):
+                (decodeData, parts) = self.loadIncludes(fileName, includes)
+            self.checkFile = pathlib.Path(fileName).name
 
         if decodeData:
-            ### Checking  decodeData (dict)
-            if self.compareType("decodeData type", decodeData, "dict"):
-                ### Checking "ignores": ["of", "the", ...]
-                self.checkPhase = "checking ignores"
-                self.ignoresList = self.getValue(decodeData,"ignores")
-                # Extract all "ignores" (list)
-                if self.compareType("self.ignoresList type", self.ignoresList, "list"):
-                    pass
-            ### Checking "commandValues": {	"cdeOn":{"codeValue":1}, ...}
-            self.checkPhase = "checking command values"
-            self.commandValuesDict =  self.getValue(decodeData,"commandValues")
-            # Extract all "commandValues" (dict)
-            if self.compareType("commandValuesDict type", self.commandValuesDict, "dict"):
-                # For each item in self.commandValuesDict
-                for key in self.commandValuesDict.keys():
-                    # Key should not be in ignore list
-                    if self.notInIgnoreList("key", key):
-                        # Check codeValue (dict)
-                        codeValueItem = self.commandValuesDict[key]
-                        if self.compareType("codeValueItem type", codeValueItem, "dict"):
-                            # Get the "codeValue" (int)
-                            codeValue = self.getValue(codeValueItem, "codeValue")
-                            if self.compareType("codeValue type", codeValue, "int", codeValueItem):
-                                pass
-
-            ### Checking "commands": {"turn":{"commandValue":"cdeSet"}, ...}
-            self.checkPhase = "checking commands"
-            # Extract all "commands" list
-            self.commandsDict =  self.getValue(decodeData,"commands")
-            if self.compareType("commandList type", self.commandsDict, "dict"):
-                # For each item in self.commandsDict
-                for key in self.commandsDict.keys():
-                    # Key should not be in ignore list
-                    if self.notInIgnoreList("key", key):
-                        commandItem = self.commandsDict[key]
-                        if self.compareType("commandItem type", commandItem, "dict"):
-                            # Get the first "command"
-                            commandCommandValue = self.getValue(commandItem, "commandValue")
-                            # Check command keyword
-                            if self.compareType("commandCommandValue type", commandCommandValue, "str", commandItem):
-                                # Value should be in self.commandValuesDict
-                                if self.compareValue("command commandValue", commandCommandValue , self.commandValuesDict, commandItem):
-                                    pass
-
-            ### Checking "devices": {"kitchen target temperature":{"index":86, "category":"Setpoint", "allow":["cdeShow","cdeSet"], "setType": "setPoint", "minValue": -40, "maxValue": 100}, ...}
-            self.checkPhase = "checking devices"
-            # Extract all "devices"
-            self.devicesDict =  self.getValue(decodeData,"devices")
-            if self.compareType("self.devicesDict type", self.devicesDict, "dict"):
-                # For each item in self.devicesDict
-                for key in self.devicesDict.keys():
-                    deviceItem = self.devicesDict[key]
-                    if self.compareType("deviceItem type", deviceItem, "dict"):
-                        # Extract index
-                        deviceIndex = self.getValue(deviceItem, "index")
-                        if self.compareType("device index", deviceIndex, ["str", "int"]):
-                            # Index should not be empty or zero
-                            self.compareNotValue("device index", deviceIndex, "", deviceItem)
-                            self.compareNotValue("device index", deviceIndex, 0, deviceItem)
-                        # Extract category
-                        deviceCategory = self.getValue(deviceItem, "category")
-                        if self.compareType("device category", deviceCategory, "str"):
-                            pass
-                        # Extract allowed commands and check them
-                        deviceAllowedCommands = self.getValue(deviceItem, "allow")
-                        if self.compareType("device allowed commands", deviceAllowedCommands, ["str","list"]):
-                            # Does the device have one commandValue with a set attribute?
-                            commandSet = False
-                            # Scan all allowed command values
-                            for item in deviceAllowedCommands:
-                                # Does this commandValue have the set flag set?
-                                if self.getValue2(self.commandValuesDict, item, "set", False):
-                                    # Yes, set flag
-                                    commandSet = True
-                                    break
-                            # Check other elements giving commandSet flag
-                            if commandSet:
-                                # Command has a set flag, get mandatory setType value
-                                self.valueToSetType = self.getValue(deviceItem, "setType")
-                                # Check setType value as string
-                                if self.compareType("setType type", self.valueToSetType, "str", deviceItem):
-                                    # Check for valid setType given
-                                    if self.compareValue("setType", self.valueToSetType, ['level','setPoint', 'integer', 'float','string']):
-                                        # Set min/max value depending on setType
-                                        if self.valueToSetType == 'level':
-                                            minValue = 0
-                                            maxValue = 100
-                                        else:
-                                            minValue = None
-                                            maxValue = None
-                                        # Set authorized data type(s) depending on setType
-                                        if self.valueToSetType == 'level' or self.valueToSetType == 'integer':
-                                            allowedDataTypes = 'int'
-                                        elif self.valueToSetType == 'float' or self.valueToSetType == 'setPoint':
-                                            allowedDataTypes = ['int', 'float']
-                                        else:
-                                            allowedDataTypes = 'str'
-                                        # Scan all items in device item
-                                        for item in deviceItem.keys():
-                                                # Get item value
-                                                itemValue = deviceItem[item]
-                                                if item == "mapping":
-                                                    deviceMap = self.getValue(deviceItem, "mapping")
-                                                    # This should be a list of mapping value (dict)
-                                                    if self.compareType("deviceMap type", deviceMap, "dict", deviceItem):
-                                                        ## Check each value type against authorized ones
-                                                        for mappingKey in itemValue.keys():
-                                                            if self.compareType("mapping value type", itemValue[mappingKey], allowedDataTypes, deviceItem):
-                                                                pass
-                                                elif item == "minValue":
-                                                    if self.compareType("minValue type", itemValue, allowedDataTypes, deviceItem):
-                                                        minValue = itemValue
-                                                elif item == "maxValue":
-                                                    if self.compareType("minValue type", itemValue, allowedDataTypes, deviceItem):
-                                                        maxValue = itemValue
-                                                elif item == "list":
-                                                    # Check type as list
-                                                    if self.compareType("list type", itemValue, "list", deviceItem):
-                                                        # Check each item in list
-                                                        for item in itemValue:
-                                                            if self.compareType("list value type", item, allowedDataTypes, deviceItem):
-                                                                pass
-                                                elif item == "setBy":
-                                                    if self.compareValue("setBy", itemValue, ['plugIn', 'user']):
-                                                        pass
-                                                elif item not in ['index', 'category', 'allow', 'setType']:
-                                                    # And unknown item has been specified
-                                                    self.printError(F"Can't understand {item} in {deviceItem} for {key}")
-                                        # Check for min/max values
-                                        if minValue != None and maxValue != None:
-                                            # Min should be <= to max
-                                            if minValue > minValue:
-                                                self.printError(F"minValue ({minValue}) should be less or equal to maxValue ({maxValue})")
-        else:
+            if parts == None:
+                self.checkTables(decodeData)
+                if not self.errorSeen:
+                    self.compileTables()
+                    parts = [self]
+            else:
+                self.setTables(decodeData)
+            self.settings = self.getValue(decodeData, "settings", {})
+            # Merge compiled tables (and typo trees if enabled) if no error found
+            if not self.errorSeen:
+                self.mergeCompiledTables(parts)
+                self.typoMaxDistance = self.getValue(self.settings, "typoMaxDistance", 0)
+                self.typoMinConfidence = self.getValue(self.settings, "typoMinConfidence", 0.75)
+                if self.typoMaxDistance > 0:
+                    self.mergeTypoTrees(parts)
+        elif not self.errorSeen:
             self.printError(F"Can't load {fileName}")
         # Set final check status (first value is short error message, second one all detected errors)
         if self.errorSeen:
@@ -405,6 +1158,13 @@ class FF_analyzeCommand:
         else:
             return "", self.allMessages
 
+    # Check if one of loaded tables files changed since loaded
+    def tablesChanged(self):
+        for (fileName, modificationTime) in self.loadedFiles.items():
+            if (os.path.getmtime(fileName) if os.path.exists(fileName) else None) != modificationTime:
+                return True
+        return False
+
     def analyzeCommand(self, givenCommand):
         # Init error seen and last message
         self.errorSeen = False
@@ -416,152 +1176,61 @@ class FF_analyzeCommand:
         self.deviceName = ""                                # Device name
         self.deviceId = 0                                   # DeviceId
         self.deviceIdName = ""                              # Name of deviceId
+        self.deviceController = ""                          # Domoticz controller owning device (empty for default one)
         self.valueToSet = None                              # Value to set
         self.valueToSetType = None                          # Value to set type
         self.valueToSetOriginal = None                      # Original Value to set (for mapping)
         self.setBy = None                                   # Value to be set by 'user' or 'plugIn'
 
-        # Split each word of message, replacing tabs by spaces
-        keywords = givenCommand.replace("\t"," ").split(" ")
-
-        # Remove words to ignore
-        for ptr in range(len(keywords)):
-            if keywords[ptr] in self.ignoresList:
-                keywords[ptr] = ""
+        # Split message into keywords, without words to ignore
+        (normalizedKeywords, keywords, positions) = self.tokenize(givenCommand)
 
-        # Rebuild command and clean leading/trailing spaces
-        cleanCommand = " ".join(keywords).strip()
-
-        # Remove double spaces
-        while cleanCommand.find("  ") != -1:
-            cleanCommand = cleanCommand.replace("  ", " ")
-        
-        # Split each word of cleaned message
-        keywords = cleanCommand.split(" ")
-
-        # Isolate command in first keyword
-        keywordIndex = 0
-        self.command = self.findInDict(keywords, keywordIndex, self.commandsDict, "command")
-        if self.command != "":
-            ##self.printInfo(F"Command is {self.command}")
-            # move index into keywords
-            keywordIndex += len(self.command.split(" "))
-            # Does the device name
-            filteredDevicesDict = dict()
-            self.filterDictionary(self.devicesDict, "allow", self.getValue2(self.commandsDict, self.command, "commandValue"), filteredDevicesDict)
-            self.deviceName = self.findInDict(keywords, keywordIndex, filteredDevicesDict, "device")
-            if self.deviceName != "":
-                keywordIndex += len(self.deviceName.split(" "))
-                # Get device data
-                deviceCategory = self.getValue2(self.devicesDict, self.deviceName, "category","")
-                deviceAllowedCommands = self.getValue2(self.devicesDict, self.deviceName, "allow")
-                ##self.printInfo(F"{self.command} command allows {deviceAllowedCommands}")
-                if not deviceAllowedCommands:
-                    self.printError(F"Can't find {self.deviceName} allowed commands...")
+        # Parse keywords in one pass with grammar starting with the item given by first keyword
+        keywordIndex = None
+        grammar = self.selectGrammar(keywords, normalizedKeywords)
+        if grammar == None:
+            self.printError("No grammar defined")
+        else:
+            keywordIndex = self.parseGrammar(grammar, keywords, normalizedKeywords)
+        if keywordIndex == None:
+            self.errorSeen = True
+        else:
+            # Get device data
+            deviceCategory = self.getValue2(self.devicesDict, self.deviceName, "category","")
+            deviceAllowedCommands = self.getValue2(self.devicesDict, self.deviceName, "allow")
+            ##self.printInfo(F"{self.command} command allows {deviceAllowedCommands}")
+            if not deviceAllowedCommands:
+                self.printError(F"Can't find {self.deviceName} allowed commands...")
+            else:
+                # Get command commandValue
+                commandCommandValue = self.getValue2(self.commandsDict, self.command, "commandValue")
+                if not commandCommandValue:
+                    self.printError(F"Can't find {self.command} command commandValue...")
                 else:
-                    # Get command commandValue
-                    commandCommandValue = self.getValue2(self.commandsDict, self.command, "commandValue")
-                    if not commandCommandValue:
-                        self.printError(F"Can't find {self.command} command commandValue...")
+                    ##self.printInfo(F"{self.command} command is {commandCommandValue}")
+                    if commandCommandValue not in deviceAllowedCommands:
+                        self.printError(F"Can't do command {self.command} on device {self.deviceName}")
                     else:
-                        ##self.printInfo(F"{self.command} command is {commandCommandValue}")
-                        if commandCommandValue not in deviceAllowedCommands:
-                            self.printError(F"Can't do command {self.command} on device {self.deviceName}")
-                        else:
-                            # Is command set enabled?
-                            commandSet = self.getValue2(self.commandValuesDict, commandCommandValue, "set", False)
-                            ##self.printInfo(F"{command} set is {commandSet}")
-                            # Is this a set command?
-                            if commandSet:
-                                # Extract all remaining keywords in value to set
-                                self.valueToSet = ""
-                                for ptr in range(keywordIndex, len(keywords)):
-                                    self.valueToSet += keywords[ptr]+ " "
-                                self.valueToSet = self.valueToSet.strip()
-                                ##self.printInfo(F"Value to set is {self.valueToSet}")
-                                # Do we have a value to set?
-                                if self.valueToSet != "":
-                                    # Extract setType value
-                                    self.valueToSetType = self.getValue2(self.devicesDict, self.deviceName, "setType")
-                                    # Do we have mapping associated with device?
-                                    deviceMapping = self.getValue2(self.devicesDict, self.deviceName, "mapping")
-                                    if deviceMapping:
-                                        # Substitute first value to set to mapped value
-                                        self.valueToSetOriginal = self.findInDict(keywords, keywordIndex, deviceMapping, "mapping")
-                                        if self.valueToSetOriginal != "":
-                                            # Load remapped value
-                                            self.valueToSet = self.getValue(deviceMapping, self.valueToSetOriginal)
-                                            keywordIndex += len(self.valueToSetOriginal)
-                                            # Do we have remaining keywords?
-                                            if keywordIndex + 1 < len(keywords):
-                                                self.printError(F"Can't understand {keywords[keywordIndex:]} after {self.valueToSet}")
-                                    # Do we have a list associated with device?
-                                    deviceList = self.getValue2(self.devicesDict, self.deviceName, "list")
-                                    if deviceList and self.compareValue("value", self.valueToSet, deviceList, givenCommand):
-                                        pass
-                                    # Do we have a minValue or maxValue?
-                                    deviceMinValue = self.getValue2(self.devicesDict, self.deviceName, "minValue", None)
-                                    deviceMaxValue = self.getValue2(self.devicesDict, self.deviceName, "maxValue")
-                                    # Set authorized data type(s) depending on setType
-                                    if self.valueToSetType == 'level':
-                                        try:
-                                            dummy = int(self.valueToSet)
-                                        except ValueError:
-                                            self.printError(F"({self.valueToSet}) is not a valid number")
-                                            return
-                                        if deviceMinValue == None:
-                                            deviceMinValue = 0
-                                        if deviceMaxValue == None:
-                                            deviceMaxValue = 100
-                                        if dummy < int(deviceMinValue):
-                                            self.printError(F"Given value ({dummy}) should not be less than {deviceMinValue}")
-                                            return
-                                        if dummy > int(deviceMaxValue):
-                                            self.printError(F"Given value ({dummy}) should not be greater than {deviceMaxValue}")
-                                            return
-                                    elif self.valueToSetType == 'integer':
-                                        try:
-                                            dummy = int(self.valueToSet)
-                                        except ValueError:
-                                            self.printError(F"({self.valueToSet}) is not a valid number")
-                                            return
-                                        if deviceMinValue != None and dummy < int(deviceMinValue):
-                                            self.printError(F"Given value ({dummy}) should not be less than {deviceMinValue}")
-                                            return
-                                        if deviceMaxValue != None and dummy > int(deviceMaxValue):
-                                            self.printError(F"Given value ({dummy}) should not be greater than {deviceMaxValue}")
-                                            return
-                                    elif self.valueToSetType == 'float' or self.valueToSetType == 'setPoint':
-                                        try:
-                                            dummy = float(self.valueToSet)
-                                        except ValueError:
-                                            self.printError(F"({self.valueToSet}) is not a valid floating point")
-                                            return
-                                        if deviceMinValue != None and dummy < float(deviceMinValue):
-                                            self.printError(F"Given value ({dummy}) should not be less than {deviceMinValue}")
-                                            return
-                                        if deviceMaxValue != None and dummy > float(deviceMaxValue):
-                                            self.printError(F"Given value ({dummy}) should not be greater than {deviceMaxValue}")
-                                            return
-                                    else:
-                                        if deviceMinValue != None and self.valueToSet < deviceMinValue:
-                                            self.printError(F"Given value ({self.valueToSet}) should not be less than {deviceMinValue}")
-                                            return
-                                        if deviceMaxValue != None and self.valueToSet > deviceMaxValue:
-                                            self.printError(F"Given value ({self.valueToSet}) should not be greater than {deviceMaxValue}")
-                                            return
-                                    # Load setBy
-                                    self.setBy = self.getValue2(self.devicesDict, self.deviceName, "setBy", "plugIn")
-                                else:
-                                    self.printError("Value to set is missing")
+                        # Is command set enabled?
+                        commandSet = self.getValue2(self.commandValuesDict, commandCommandValue, "set", False)
+                        ##self.printInfo(F"{command} set is {commandSet}")
+                        # Is this a set command?
+                        if commandSet:
+                            # Check remaining keywords as value to set
+                            if keywordIndex < len(keywords):
+                                self.valueValidators[self.deviceName].check(self, keywords, normalizedKeywords, keywordIndex, \
+                                    givenCommand[positions[keywordIndex]:].strip())
                             else:
-                                # Do we have an available keyword?
-                                if keywordIndex < len(keywords):
-                                    self.printError(F"Can't understand {keywords[keywordIndex:]} after {self.deviceName}")
-                            if not self.errorSeen:
-                                self.deviceId = self.getValue2(self.devicesDict,self.deviceName, "index")
-                                self.deviceIdName = self.getValue2(self.devicesDict,self.deviceName, "name",self.deviceName)
-                                self.commandValue = self.getValue2(self.commandValuesDict,commandCommandValue, "codeValue")
-                                self.commandValueText = commandCommandValue
-                                self.deviceCategory = deviceCategory
+                                self.printError("Value to set is missing")
+                        else:
+                            # Do we have an available keyword?
+                            if keywordIndex < len(keywords):
+                                self.printError(F"Can't understand {keywords[keywordIndex:]} after {self.deviceName}")
+                        if not self.errorSeen:
+                            self.deviceId = self.getValue2(self.devicesDict,self.deviceName, "index")
+                            self.deviceIdName = self.getValue2(self.devicesDict,self.deviceName, "name",self.deviceName)
+                            self.deviceController = self.getValue2(self.devicesDict,self.deviceName, "controller", "")
+                            self.commandValue = self.getValue2(self.commandValuesDict,commandCommandValue, "codeValue")
+                            self.commandValueText = commandCommandValue
+                            self.deviceCategory = deviceCategory
         return self.firstErrorMessage, self.allMessages
@@ -0,0 +1,346 @@
+"""
+This code contains Domoticz JSON API client and helpers shared by FF_SmsServerConfig.py and makeDoc.py.
+
+Requests are sent through a keep-alive session, with timeout and retries.
+    Domoticz version is cached (Domoticz doesn't send ETag nor Last-Modified headers on JSON answers,
+    so they can't be asked again only if modified).
+    Errors are raised as DomoticzApiError, caller deciding what to do.
+
+Answers (like device list) are read by chunks and decoded item by item,
+    in order to keep memory usage flat, whatever the device count is.
+
+When several Domoticz controllers are given, their device lists are read in parallel,
+    devices being passed to caller through a bounded queue.
+
+Author: Flying Domotic
+License: GNU GPL V3
+"""
+
+import codecs
+import json
+import os
+import pathlib
+import time
+import hashlib
+import queue
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from FF_analyzeCommand import getControllerName
+
+chunkSize = 65536                                           # Size of chunks read from streamed answers
+versionCacheDuration = 86400                                # Duration of Domoticz version cache (seconds)
+queueSize = 1000                                            # Maximum count of devices read in advance from controllers
+
+# Error reading Domoticz API
+class DomoticzApiError(Exception):
+    pass
+
+# Load a dictionary from a file
+def loadDictionary(file):
+    if os.path.exists(file):
+        with open(file, encoding="UTF-8") as f:
+            try:
+                return json.loads(f.read())
+            except Exception as e:
+                print(F"{e} when loading {file}")
+                return None
+    else:
+        print(F"File {file} not found!")
+        return None
+
+# Get a key in dictionary, return default value if not found
+def getKey(key, dict, default = None):
+    if key in dict:
+        return dict[key]
+    else:
+        return default
+
+# Check if new API is used
+def isNewApi(version):
+    return version[:2] == "20" and version >= "2023.2"
+
+# Return controller list [(name, url)] from domoticzUrl setting
+#   domoticzUrl is either an URL or a list of URLs or {"url": ..., "name": ...} items, named by getControllerName
+def getControllers(domoticzUrl):
+    controllers = []
+    for item in domoticzUrl if isinstance(domoticzUrl, list) else [domoticzUrl]:
+        url = getKey("url", item, "") if isinstance(item, dict) else item
+        controllers.append((getControllerName(item), url))
+    return controllers
+
+# Iterate over devices of several controllers read in parallel, as (controllerName, device)
+#   Devices are passed through a bounded queue as soon as read, so that memory usage stays flat
+#   Each controller answer is saved into corresponding saveFiles item if given
+#   When iteration ends, header "controllers" gives header of each controller answer, and "status" is set to "OK" only if all answers are "OK"
+def readControllers(controllers, timeout, retries, cacheFolder, showHiddenDevices, showUsedDeviceOnly, header, saveFiles = None):
+    deviceQueue = queue.Queue(maxsize=queueSize)
+    stopped = threading.Event()
+    controllerHeaders = {}
+
+    # Put an item into queue, unless consumer stopped
+    def putItem(item):
+        while not stopped.is_set():
+            try:
+                deviceQueue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    # Read one controller device list, ending with a (controllerName, None) item
+    def readController(index):
+        controllerName, url = controllers[index]
+        controllerHeader = {}
+        saveStream = open(saveFiles[index], "wb") if saveFiles else None
+        try:
+            domoticzApi = DomoticzApi(url, timeout, retries, cacheFolder)
+            response, deviceIterator = domoticzApi.getDevices(showHiddenDevices, showUsedDeviceOnly, controllerHeader, saveStream)
+            for device in deviceIterator:
+                if not putItem((controllerName, device)):
+                    return
+            controllerHeaders[controllerName] = controllerHeader
+            if getKey("status", controllerHeader) != "OK" and getKey("status", header, "OK") == "OK":
+                header["status"] = F"{getKey('status', controllerHeader)} from {response.url}"
+        finally:
+            if saveStream:
+                saveStream.close()
+            putItem((controllerName, None))
+
+    with ThreadPoolExecutor(max_workers=len(controllers)) as executor:
+        futures = [executor.submit(readController, index) for index in range(len(controllers))]
+        try:
+            running = len(controllers)
+            while running:
+                controllerName, device = deviceQueue.get()
+                if device == None:
+                    running -= 1
+                else:
+                    yield (controllerName, device)
+        finally:
+            # Let readers end if iteration is stopped
+            stopped.set()
+    # Raise error of any reader
+    for future in futures:
+        future.result()
+    header["controllers"] = controllerHeaders
+    header.setdefault("status", "OK")
+
+# Domoticz JSON API client
+class DomoticzApi:
+    # Class initialization: save parameters and create session
+    def __init__(self, domoticzUrl, timeout = 10, retries = 3, cacheFolder = ""):
+        self.domoticzUrl = domoticzUrl                      # Domoticz URL
+        self.timeout = timeout                              # Request timeout (seconds)
+        self.cacheFolder = cacheFolder                      # Folder where Domoticz version is cached (no cache if empty)
+        self.domoticzVersion = None                         # Domoticz version
+        # Keep connections alive, retrying failed requests with backoff
+        retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=[500, 502, 503, 504], allowed_methods=["GET"])
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(max_retries=retry))
+        self.session.mount("https://", HTTPAdapter(max_retries=retry))
+        if self.cacheFolder:
+            os.makedirs(self.cacheFolder, exist_ok=True)
+
+    # Return cache file name for a given URL and extension
+    def cacheFile(self, url, extension):
+        return os.path.join(self.cacheFolder, hashlib.sha1(url.encode("UTF-8")).hexdigest()+extension)
+
+    # Execute a JSON request (answer status is checked by caller when streamed)
+    def readApi(self, command, stream = False):
+        url = self.domoticzUrl+"json.htm?"+command
+        # Send request
+        try:
+            response = self.session.get(url, stream=stream, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            raise DomoticzApiError(F"Error {e} reading {url}")
+        # Check status answer = "OK"
+        if response.status_code == 200:
+            if stream:
+                return response
+            try:
+                if getKey("status", response.json()) == "OK":
+                    return response
+            except ValueError as e:
+                raise DomoticzApiError(F"Error {e} decoding {response.url}\nReturned: {response.text}")
+        raise DomoticzApiError(F"Error {response.status_code} reading {response.url}\nReturned: {response.text}")
+
+    # Return Domoticz version, asking it only if not cached (or cache is too old)
+    def getVersion(self):
+        if self.domoticzVersion:
+            return self.domoticzVersion
+        versionFile = self.cacheFile(self.domoticzUrl, ".version") if self.cacheFolder else ""
+        if versionFile and os.path.exists(versionFile):
+            versionCache = loadDictionary(versionFile)
+            if versionCache and versionCache.get("url") == self.domoticzUrl and time.time() - versionCache.get("time", 0) < versionCacheDuration:
+                self.domoticzVersion = versionCache.get("version")
+                return self.domoticzVersion
+        # Get Domoticz settings to find version number
+        domoticzVersionResponse = self.readApi("type=command&param=getversion")
+        self.domoticzVersion = getKey("version", domoticzVersionResponse.json(), "")
+        if self.domoticzVersion == "":
+            self.domoticzVersion = "2099.9"
+            print(F"Can't find 'version' in {domoticzVersionResponse.text}, setting to {self.domoticzVersion}")
+        elif versionFile:
+            with open(versionFile, "wt", encoding="UTF-8") as stream:
+                stream.write(json.dumps({"url": self.domoticzUrl, "version": self.domoticzVersion, "time": time.time()}))
+        return self.domoticzVersion
+
+    # Check if new API is used
+    def isNewApi(self):
+        return isNewApi(self.getVersion())
+
+    # Request device list, returning answer and an iterator over its devices
+    #   Answer is saved into saveStream (binary) if given
+    #   When lastUpdate is given, only devices changed since this Domoticz time (header "ActTime" of a previous answer) are returned
+    def getDevices(self, showHiddenDevices, showUsedDeviceOnly, header, saveStream = None, lastUpdate = None):
+        # Compose command to send depending on user needs
+        if self.isNewApi():
+            params = "type=command&param=getdevices"
+        else:
+            params = "type=devices"
+
+        if showHiddenDevices:
+            params +="&displayhidden=1"
+
+        if showUsedDeviceOnly:
+            params +="&used=true"
+
+        if lastUpdate != None:
+            params +=F"&lastupdate={lastUpdate}"
+
+        # Execute device list request, reading answer by chunks
+        response = self.readApi(params, True)
+        chunks = responseChunks(response)
+        if saveStream:
+            chunks = teeChunks(chunks, saveStream)
+        return response, iterDeviceList(chunks, header, response.url)
+
+# Return chunks of a streamed answer, raising DomoticzApiError if reading fails
+def responseChunks(response):
+    try:
+        yield from response.iter_content(chunkSize)
+    except requests.exceptions.RequestException as e:
+        raise DomoticzApiError(F"Error {e} reading {response.url}")
+
+# Write chunks to a (binary) stream, passing them to caller
+def teeChunks(chunks, stream):
+    for chunk in chunks:
+        stream.write(chunk)
+        yield chunk
+
+# Return chunks read from a (binary) stream
+def streamChunks(stream):
+    return iter(lambda: stream.read(chunkSize), b"")
+
+# Return controller name of a saved device list file (named <...>DeviceList_<controller name>.json by readControllers callers)
+#   None is returned when only one controller is given, or if file name doesn't match any controller
+def deviceListFileController(fileName, controllers):
+    if len(controllers) > 1:
+        fileStem = pathlib.Path(fileName).stem
+        for (controllerName, url) in controllers:
+            if fileStem.endswith("DeviceList_"+controllerName):
+                return controllerName
+    return None
+
+# Iterate over devices of saved device list files (as written by keepDomoticzDeviceList), one file after the other, as (controllerName, device)
+#   Controller of each file is found from its name, as saved when reading several controllers
+#   Header "status" is set to "OK" only if all files have an "OK" status
+def iterDeviceListFiles(fileNames, header, controllers = []):
+    for fileName in fileNames:
+        controllerName = deviceListFileController(fileName, controllers)
+        fileHeader = {}
+        with open(fileName, "rb") as stream:
+            for device in iterDeviceList(streamChunks(stream), fileHeader, fileName):
+                yield (controllerName, device)
+        header.update(fileHeader)
+        if fileHeader.get("status") != "OK":
+            header["status"] = F"{fileHeader.get('status')} in {fileName}"
+            return
+
+# Iterate over devices of a device list answer read by chunks, raising DomoticzApiError if answer can't be decoded
+def iterDeviceList(chunks, header, source):
+    try:
+        yield from iterJsonList(chunks, "result", header)
+    except ValueError as e:
+        raise DomoticzApiError(F"Error {e} decoding {source}")
+
+# Iterate over items of a list, given its key in a top level JSON object, reading data by chunks
+#   Other top level items are loaded into header dictionary (complete when iteration ends)
+def iterJsonList(chunks, listKey, header):
+    decoder = json.JSONDecoder()
+    utf8Decoder = codecs.getincrementaldecoder("utf-8")()
+    chunkIterator = iter(chunks)
+    buffer = ""
+    position = 0
+    endOfData = False
+
+    # Read next chunk, keeping only unread part of buffer
+    def readMore():
+        nonlocal buffer, position, endOfData
+        chunk = next(chunkIterator, None)
+        if chunk == None:
+            endOfData = True
+            text = utf8Decoder.decode(b"", True)
+        else:
+            text = utf8Decoder.decode(chunk)
+        buffer = buffer[position:] + text
+        position = 0
+
+    # Skip white spaces and return next char ("" at end of data)
+    def nextChar():
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n":
+                position += 1
+            if position < len(buffer):
+                return buffer[position]
+            if endOfData:
+                return ""
+            readMore()
+
+    # Check next char and skip it
+    def skipChar(char):
+        nonlocal position
+        if nextChar() != char:
+            raise ValueError(F"Expecting '{char}', found '{nextChar()}'")
+        position += 1
+
+    # Decode next JSON value, reading more data until value is complete
+    def nextValue():
+        nonlocal position
+        nextChar()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if endOfData:
+                    raise
+                readMore()
+                continue
+            # Value ending with buffer (like a number) may continue in next chunk
+            if end < len(buffer) or endOfData:
+                position = end
+                return value
+            readMore()
+
+    skipChar("{")
+    while nextChar() != "}":
+        if nextChar() == ",":
+            position += 1
+        key = nextValue()
+        skipChar(":")
+        if key == listKey:
+            skipChar("[")
+            while nextChar() != "]":
+                if nextChar() == ",":
+                    position += 1
+                yield nextValue()
+            position += 1
+        else:
+            header[key] = nextValue()
+    # Read remaining data, so that chunk consumers (like cache or save file) get complete answer
+    for chunk in chunkIterator:
+        pass
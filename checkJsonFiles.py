@@ -3,8 +3,61 @@ fileVersion = "1.1.1"                                       # File version
 
 import pathlib
 import os
+import sys
+import json
+import time
+import statistics
 from FF_analyzeCommand import FF_analyzeCommand
 
+# Run commands of a corpus file through analyzer, comparing results to expected ones and timing them
+#   Corpus is a JSON list of {"message": "SMS text", "command": ..., "device": ..., "value": ..., "error": ...}
+#       Only given keys are checked ("error" is first error message, "" when command should be accepted)
+#   Returns count of mismatches
+def runCorpus(analyzer, corpusFile, repeat = 1):
+    with open(corpusFile, encoding="UTF-8") as corpusStream:
+        corpus = json.load(corpusStream)
+    mismatches = 0
+    latencies = []
+    for test in corpus:
+        message = test["message"]
+        # Keep best time of all repetitions, to ignore system noise
+        bestTime = None
+        for _ in range(repeat):
+            startTime = time.perf_counter()
+            errorText, messages = analyzer.analyzeCommand(message)
+            elapsed = time.perf_counter() - startTime
+            if bestTime == None or elapsed < bestTime:
+                bestTime = elapsed
+        latencies.append(bestTime)
+        # Compare results to expected ones
+        results = {"command": analyzer.command, "device": analyzer.deviceName, \
+            "value": None if analyzer.valueToSet == None else str(analyzer.valueToSet), "error": errorText}
+        for key in results.keys() & test.keys():
+            expected = test[key] if test[key] == None else str(test[key])
+            if results[key] != expected:
+                mismatches += 1
+                print(F"Mismatch for >{message}<: {key} is >{results[key]}<, expected >{expected}<")
+    # Print latency statistics (in microseconds)
+    if latencies:
+        latencies.sort()
+        print(F"{len(corpus)} command(s), {mismatches} mismatch(es)")
+        print(F"Latency (us): min={latencies[0]*1e6:.1f}, mean={statistics.mean(latencies)*1e6:.1f}, "\
+            F"median={statistics.median(latencies)*1e6:.1f}, p95={latencies[int(0.95*(len(latencies)-1))]*1e6:.1f}, max={latencies[-1]*1e6:.1f}")
+    return mismatches
+
+# Print shortest abbreviations of commands, devices (by allowed commandValue) and mapping values (by device)
+def printAbbreviations(analyzer):
+    # Print one abbreviation table
+    def printTable(title, abbreviations):
+        print(title)
+        for (item, abbreviation) in sorted(abbreviations[0].items()):
+            print(F"\t{item}: {abbreviation if abbreviation != None else '(none, hidden by another one)'}")
+    printTable("Commands:", analyzer.commandAbbreviations)
+    for (commandValue, abbreviations) in analyzer.deviceAbbreviations.items():
+        printTable(F"Devices allowing {commandValue}:" if commandValue else "All devices:", abbreviations)
+    for (deviceName, abbreviations) in analyzer.mappingAbbreviations.items():
+        printTable(F"Values of {deviceName}:", abbreviations)
+
 #   *****************
 #   *** Main code ***
 #   *****************
@@ -22,6 +75,21 @@ analyzer = FF_analyzeCommand()
 errorText, messages = analyzer.loadData(decodeFile)
 print("LoadData status: "+(errorText if errorText != "" else "Ok"))
 print(messages)
+
+# Abbreviation report
+if len(sys.argv) > 1 and sys.argv[1] == "--abbreviations":
+    if errorText:
+        exit(2)
+    printAbbreviations(analyzer)
+    exit(0)
+
+# Batch mode: corpus file (and optional repeat count) given on command line
+if len(sys.argv) > 1:
+    if errorText:
+        exit(2)
+    mismatches = runCorpus(analyzer, sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 1)
+    exit(1 if mismatches else 0)
+
 if errorText:
     exit()
 
@@ -138,4 +138,11 @@ return commandArray
 
 	Default example comes with security panel example (as well as root for other commands type).
         Define your security panel code and Domoticz URL in header if needed.
+
+	When "userRequestTopic" is set in FF_SmsServerConfig.json, requests are not written into this device anymore,
+        but sent as JSON on this MQTT topic, to be read by an external handler (Node-RED, script using mosquitto_sub...), like:
+        {"id": "<unique request id>", "number": "+33...", "command": "cdeSet", "commandValue": 8, "idx": 123, "device": "alarm", "category": "panel",
+            "value": "armed home", "originalValue": "armed home", "setType": "string", "controller": "<controller name>"}
+        "command" is the commandValue name of smsTables.json, "commandValue" its codeValue (as in "~" separated values).
+        Device name is then given directly, without having to search it from its idx.
 ]]
\ No newline at end of file
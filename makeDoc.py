@@ -16,47 +16,14 @@ fileVersion = "1.1.0" # File version
 import pathlib
 import os
 import json
-import requests
 import base64
+import sys
+import csv
+import html
+import io
+import time
 from FF_analyzeCommand import FF_analyzeCommand
-
-# Load a dictionary to a file
-def loadDictionary(file):
-    if os.path.exists(file):
-        with open(file, encoding="UTF-8") as f:
-            try:
-                return json.loads(f.read())
-            except Exception as e:
-                print(F"{e} when loading {file}")
-                return None
-    else:
-        print("File {file} not found!")
-        return None
-
-# Check if new API is used
-def isNewApi(version):
-    return version[:2] == "20" and version >= "2023.2"
-
-# Execute a JSON request
-def readApi(command):
-    # Send request
-    response = requests.get(domoticzUrl+"json.htm?"+command)
-    # If status code
-    if response.status_code == 200:
-        # Check status answer = "OK"
-        if response.json()["status"] == "OK":
-            return response
-    # Print error message and exit
-    print("Error "+str(response.status_code)+" reading "+response.url)
-    print("Returned: "+response.text)
-    exit(2)
-
-# Get a key in dictionary, return default value if not found
-def getKey(key, dict, default = None):
-    if key in dict:
-        return dict[key]
-    else:
-        return default
+from FF_domoticzApi import DomoticzApi, DomoticzApiError, getControllers, readControllers, iterDeviceListFiles, getKey
 
 #   *****************
 #   *** Main code ***
@@ -82,103 +49,288 @@ if messages:
 if errorText:
     exit(2)
 
-# Read SMS server json configuration file
-jsonData = loadDictionary(decodeFile)
-if jsonData == None:
-    exit(2)
+# Get settings (merged from all tables files)
+jsonData = {"settings": analyzer.settings}
 
 # Get Domoticz URL
 domoticzUrl = analyzer.getValue2(jsonData, "settings", "domoticzUrl", "http://127.0.0.1:8080/")
 prefix = analyzer.getValue2(jsonData, "settings", "smsServerPrefix", "domoticz")
 showHiddenDevices = analyzer.getValue2(jsonData, "settings", "showHiddenDevices", False)
 showUsedDeviceOnly = analyzer.getValue2(jsonData, "settings", "showUsedDeviceOnly", True)
+deviceListFiles = analyzer.getValue2(jsonData, "settings", "deviceListFiles", [])
+apiTimeout = analyzer.getValue2(jsonData, "settings", "apiTimeout", 10)
+apiRetries = analyzer.getValue2(jsonData, "settings", "apiRetries", 3)
+apiCacheFolder = analyzer.getValue2(jsonData, "settings", "apiCacheFolder", ".")
+docFormat = analyzer.getValue2(jsonData, "settings", "docFormat", "text")
+docFile = analyzer.getValue2(jsonData, "settings", "docFile", "")
+docSort = analyzer.getValue2(jsonData, "settings", "docSort", True)
+docWatch = analyzer.getValue2(jsonData, "settings", "docWatch", 0)
+
+# Device list files given on command line replace those in settings
+if len(sys.argv) > 1:
+    deviceListFiles = sys.argv[1:]
+
+# Check arguments before writing anything
+if docWatch and deviceListFiles:
+    print("Watch mode needs Domoticz, can't be used with device list files")
+    exit(2)
+
+# Index command words by commandValue, keeping commandsDict order
+commandsByValue = {}
+for (position, command) in enumerate(analyzer.commandsDict):
+    commandValue = analyzer.getValue2(analyzer.commandsDict, command, "commandValue")
+    commandsByValue.setdefault(commandValue, []).append((position, command))
+allowCommandsCache = {}
+
+# Return allowed commands (like "on/off/show") for a device allow list, computed once per allow set
+def getAllowCommands(deviceCommandValues):
+    if isinstance(deviceCommandValues, str):
+        deviceCommandValues = [deviceCommandValues]
+    allowSet = frozenset(deviceCommandValues or [])
+    if allowSet not in allowCommandsCache:
+        commands = sorted(command for commandValue in allowSet for command in getKey(commandValue, commandsByValue, []))
+        allowCommandsCache[allowSet] = "/".join(command for (position, command) in commands)
+    return allowCommandsCache[allowSet]
+
+responseHeader = {}
+controllers = getControllers(domoticzUrl)
 
-# Get Domoticz settings to find version number
-domoticzVersionResponse = readApi("type=command&param=getversion")
-domoticzVersion = getKey("version", domoticzVersionResponse.json(), "")
-if domoticzVersion == "":
-    domoticzVersion = "2099.9"
-    print(F"Can't find 'version' in {domoticzVersionResponse.text}, setting to {domoticzVersion}")
+# Index SMS devices by controller and Domoticz idx (devices without controller belong to first one)
+smsDevicesByIdx = {}
+for (smsName, smsDevice) in analyzer.devicesDict.items():
+    smsKey = (analyzer.getValue(smsDevice, "controller", "") or controllers[0][0], str(analyzer.getValue(smsDevice, "index", "")))
+    smsDevicesByIdx.setdefault(smsKey, []).append(smsName)
+seenKeys = set()
 
-# Compose command to send depending on user needs
-if isNewApi(domoticzVersion):
-    params = "type=command&param=getdevices"
+# Return devices given by deviceIterator, exiting on Domoticz API error
+def checkedDevices(deviceIterator):
+    try:
+        yield from deviceIterator
+    except DomoticzApiError as e:
+        print(e)
+        exit(2)
+
+# Read saved device list files instead of Domoticz, if given
+if deviceListFiles:
+    deviceListSource = str(deviceListFiles)
+    deviceIterator = iterDeviceListFiles(deviceListFiles, responseHeader, controllers)
+# Read all controllers in parallel if more than one is given
+elif len(controllers) > 1:
+    deviceListSource = str([url for (controllerName, url) in controllers])
+    deviceIterator = readControllers(controllers, apiTimeout, apiRetries, apiCacheFolder, showHiddenDevices, showUsedDeviceOnly, responseHeader)
 else:
-    params = "type=devices"
-
-if showHiddenDevices:
-    params +="&displayhidden=1"
-
-if showUsedDeviceOnly:
-    params +="&used=true"
-
-# Extract Domoticz device list
-list=[]
-response = readApi(params)
-
-# For each device in response
-for deviceData in response.json()['result']:
-    # Extract some data
-    status = getKey('Data', deviceData)
-    usage = getKey('Usage', deviceData)
-    deviceName = deviceData['Name']
-    # Specific case for counter and/or usage
-    if usage:
-        status = usage
-    counter = getKey('CounterToday', deviceData)
-    if counter:
-        status = counter
-    if usage and counter:
-        status = usage + "/" + counter
-    # Extract level, if existing
-    level = getKey('Level', deviceData)
-    if level:
-        status = str(level) + "%"
-        names = getKey('LevelNames', deviceData)
-        if names:
-            nameList = base64.b64decode(names.encode("ascii")).decode('UTF8').split('|')
-            status = nameList[int(level/10)]
-    # Try to find device in SMS server data
-    if deviceName in analyzer.devicesDict.keys():
-        # Extract device SMs server settings
-        device = analyzer.getValue2(analyzer.devicesDict, deviceName, "name", deviceName)
-        deviceCommandValues = analyzer.getValue2(analyzer.devicesDict, device, "allow")
-        deviceClassMappings = analyzer.getValue2(analyzer.devicesDict, device, "mapping")
-        # Extract all allowed commands for this device
-        deviceCommands = ""
-        for command in analyzer.commandsDict:
-            commandValue = analyzer.getValue2(analyzer.commandsDict, command, "commandValue")
-            if commandValue in deviceCommandValues:
-                deviceCommands += "/" + command
-        # Extract device list of values
-        setValues = []
-        if deviceClassMappings:
-            for value in deviceClassMappings.keys():
-                setValues.append(value)
-        # Extract min/max values
-        minValue = analyzer.getValue2(analyzer.devicesDict, device, "minValue")
-        maxValue = analyzer.getValue2(analyzer.devicesDict, device, "maxValue")
-        if minValue != None:
-            if maxValue != None:
-                setValues.append(F"{minValue}:{maxValue}")
+    # Extract Domoticz device list, reading answer by chunks
+    domoticzApi = DomoticzApi(controllers[0][1], apiTimeout, apiRetries, apiCacheFolder)
+    try:
+        response, devices = domoticzApi.getDevices(showHiddenDevices, showUsedDeviceOnly, responseHeader)
+    except DomoticzApiError as e:
+        print(e)
+        exit(2)
+    deviceListSource = response.url
+    deviceIterator = ((None, deviceData) for deviceData in devices)
+deviceIterator = checkedDevices(deviceIterator)
+
+# Return a record for each (controllerName, deviceData) given by deviceIterator
+def deviceRecords(deviceIterator):
+    for (controllerName, deviceData) in deviceIterator:
+        # Extract some data
+        status = getKey('Data', deviceData)
+        usage = getKey('Usage', deviceData)
+        deviceName = deviceData['Name']
+        # Find SMS devices having this controller and idx
+        deviceKey = (controllerName or controllers[0][0], str(deviceData['idx']))
+        seenKeys.add(deviceKey)
+        smsNames = getKey(deviceKey, smsDevicesByIdx, [])
+        # Prefix name with controller name when more than one
+        if controllerName:
+            deviceName = controllerName+" "+deviceName
+        # Specific case for counter and/or usage
+        if usage:
+            status = usage
+        counter = getKey('CounterToday', deviceData)
+        if counter:
+            status = counter
+        if usage and counter:
+            status = usage + "/" + counter
+        # Extract level, if existing
+        level = getKey('Level', deviceData)
+        if level:
+            status = str(level) + "%"
+            names = getKey('LevelNames', deviceData)
+            if names:
+                nameList = base64.b64decode(names.encode("ascii")).decode('UTF8').split('|')
+                status = nameList[int(level/10)]
+        # Set Domoticz data
+        record = {"name": deviceName, "status": status, "lastUpdate": deviceData['LastUpdate'], \
+            "controller": controllerName or "", "idx": str(deviceData['idx']), "sms": []}
+        # Add each SMS device with this idx
+        for smsName in smsNames:
+            # Extract device SMs server settings
+            device = analyzer.getValue2(analyzer.devicesDict, smsName, "name", smsName)
+            deviceCommandValues = analyzer.getValue2(analyzer.devicesDict, device, "allow")
+            deviceClassMappings = analyzer.getValue2(analyzer.devicesDict, device, "mapping")
+            # Extract device list of values
+            setValues = []
+            if deviceClassMappings:
+                for value in deviceClassMappings.keys():
+                    setValues.append(value)
+            # Extract min/max values
+            minValue = analyzer.getValue2(analyzer.devicesDict, device, "minValue")
+            maxValue = analyzer.getValue2(analyzer.devicesDict, device, "maxValue")
+            if minValue != None:
+                if maxValue != None:
+                    setValues.append(F"{minValue}:{maxValue}")
+                else:
+                    setValues.append(F">={minValue}")
             else:
-                setValues.append(F">={minValue}")
-        else:
-            if maxValue != None:
-                setValues.append(F"<={maxValue}")
-        if setValues:
-            setValues = " " + str(setValues)
-        else:
-            setValues = ""
-        # Add Domoticz data and SMS values
-        list.append(deviceName+' = '+status+' ('+deviceData['LastUpdate'][8:-3]+')\n\t'+prefix+' ['+deviceCommands[1:]+'] '+device.lower()+setValues)
-    else:
-        # Add Domoticz data
-        list.append(deviceName+' = '+status+' ('+deviceData['LastUpdate'][8:-3]+')')
+                if maxValue != None:
+                    setValues.append(F"<={maxValue}")
+            # Add SMS name, allowed commands and values
+            record["sms"].append({"name": device.lower(), "commands": getAllowCommands(deviceCommandValues), "values": setValues})
+        yield record
+
+# Format a record as text (as displayed on terminal)
+def formatText(record):
+    text = record["name"]+' = '+record["status"]+' ('+record["lastUpdate"][8:-3]+')\n'
+    for sms in record["sms"]:
+        text += '\t'+prefix+' ['+sms["commands"]+'] '+sms["name"]+(" "+str(sms["values"]) if sms["values"] else "")+'\n'
+    return text
 
-# Sort list
-list.sort()
+# Format a record as JSON line (one JSON object per device)
+def formatJsonLine(record):
+    return json.dumps(record, ensure_ascii=False)+'\n'
 
-# Print each line on terminal
-for item in list:
-    print(item)
\ No newline at end of file
+# Format CSV rows
+def formatCsvRows(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+# Format a record as CSV (one line per SMS device, or per Domoticz device without SMS device)
+def formatCsv(record):
+    deviceColumns = [record["name"], record["status"], record["lastUpdate"], record["controller"], record["idx"]]
+    if record["sms"]:
+        return formatCsvRows([deviceColumns + [sms["name"], sms["commands"], "|".join(sms["values"])] for sms in record["sms"]])
+    return formatCsvRows([deviceColumns + ["", "", ""]])
+
+# Format a record as HTML table row
+def formatHtml(record):
+    smsText = "<br>".join(html.escape(prefix+' ['+sms["commands"]+'] '+sms["name"]+(" "+str(sms["values"]) if sms["values"] else "")) for sms in record["sms"])
+    return F'<tr><td>{html.escape(record["name"])}</td><td>{html.escape(record["status"])}</td><td>{html.escape(record["lastUpdate"])}</td><td>{smsText}</td></tr>\n'
+
+# Output formats (header, record formatter, footer)
+formats = {
+    "text": ("", formatText, ""),
+    "jsonl": ("", formatJsonLine, ""),
+    "csv": (formatCsvRows([["name", "status", "lastUpdate", "controller", "idx", "smsName", "commands", "values"]]), formatCsv, ""),
+    "html": ('<!DOCTYPE html>\n<html>\n<head><meta charset="utf-8"><title>SMS commands</title></head>\n<body>\n<table border="1">\n'\
+        '<tr><th>Device</th><th>Status</th><th>Last update</th><th>SMS commands</th></tr>\n', formatHtml, '</table>\n</body>\n</html>\n')
+}
+if docFormat not in formats:
+    print(F"Unknown docFormat {docFormat}, should be one of {list(formats.keys())}")
+    exit(2)
+header, formatRecord, footer = formats[docFormat]
+
+# Return record key (controller, idx) and sort key (name, controller, idx)
+def recordKey(record):
+    return (record["controller"], record["idx"])
+def sortKey(record):
+    return (record["name"], record["controller"], record["idx"])
+
+# Write formatted records, with format header and footer
+def writeDoc(stream, texts):
+    stream.write(header)
+    for text in texts:
+        stream.write(text)
+    stream.write(footer)
+
+# Write formatted records into a temporary file, replacing docFile
+def replaceDocFile(texts):
+    with open(docFile+".tmp", "wt", encoding="UTF-8", newline="") as docStream:
+        writeDoc(docStream, texts)
+    os.replace(docFile+".tmp", docFile)
+
+# Check status answer = "OK", exiting if not
+def checkStatus():
+    if getKey('status', responseHeader) != "OK":
+        print(F"Error reading {deviceListSource}, status is {getKey('status', responseHeader)}")
+        if docFile and os.path.exists(docFile+".tmp"):
+            os.remove(docFile+".tmp")
+        exit(2)
+
+# Records are written as they are read, unless they should be sorted (on name, controller and idx) or watched
+records = deviceRecords(deviceIterator)
+if docSort:
+    records = sorted(records, key=sortKey)
+    checkStatus()
+elif docWatch:
+    records = list(records)
+    checkStatus()
+
+# Write records on terminal, or into a temporary file replacing docFile when complete
+if docFile:
+    with open(docFile+".tmp", "wt", encoding="UTF-8", newline="") as docStream:
+        writeDoc(docStream, map(formatRecord, records))
+else:
+    writeDoc(sys.stdout, map(formatRecord, records))
+
+# Check status answer, then replace docFile
+checkStatus()
+if docFile:
+    os.replace(docFile+".tmp", docFile)
+
+# Report SMS devices not found in Domoticz device list (on error output when writing data on terminal in another format than text)
+reportStream = sys.stderr if docFormat != "text" and not docFile else sys.stdout
+for smsKey in sorted(smsDevicesByIdx.keys() - seenKeys):
+    for smsName in smsDevicesByIdx[smsKey]:
+        print(F"SMS device {smsName} (idx {smsKey[1]} on {smsKey[0]}) not found in Domoticz device list", file=reportStream)
+
+# Watch mode: every docWatch seconds, ask Domoticz for devices changed since previous poll, formatting only changed records
+#   docFile is rewritten when something changed, else changed records are written on terminal
+#   docFile is written as a whole, from already formatted records, through a temporary file: records have variable length
+#       (and are sorted by name), so they can't be updated in place, and readers (like a status page) never see a partial file
+if docWatch:
+    # Keep sort key and formatted text of each record
+    formatted = {recordKey(record): (sortKey(record), formatRecord(record)) for record in records}
+    # Start polling from Domoticz time of initial read
+    if len(controllers) > 1:
+        domoticzApis = {controllerName: DomoticzApi(url, apiTimeout, apiRetries) for (controllerName, url) in controllers}
+        lastUpdates = {controllerName: getKey("ActTime", header, 0) for (controllerName, header) in getKey("controllers", responseHeader, {}).items()}
+    else:
+        domoticzApis = {None: domoticzApi}
+        lastUpdates = {None: getKey("ActTime", responseHeader, 0)}
+    try:
+        while True:
+            time.sleep(docWatch)
+            changedRecords = []
+            for (controllerName, controllerApi) in domoticzApis.items():
+                pollHeader = {}
+                # Keep watching if Domoticz can't be read, polling it again next time
+                try:
+                    response, devices = controllerApi.getDevices(showHiddenDevices, showUsedDeviceOnly, pollHeader, lastUpdate=lastUpdates[controllerName])
+                    changedRecords.extend(deviceRecords((controllerName, deviceData) for deviceData in devices))
+                except DomoticzApiError as e:
+                    print(e)
+                    continue
+                if getKey('status', pollHeader) != "OK":
+                    print(F"Error reading {response.url}, status is {getKey('status', pollHeader)}")
+                    continue
+                lastUpdates[controllerName] = getKey("ActTime", pollHeader, lastUpdates[controllerName])
+            # Format changed records, keeping only those whose output changed
+            changedKeys = []
+            for record in changedRecords:
+                value = (sortKey(record), formatRecord(record))
+                if formatted.get(recordKey(record)) != value:
+                    formatted[recordKey(record)] = value
+                    changedKeys.append(recordKey(record))
+            if not changedKeys:
+                continue
+            if docFile:
+                values = sorted(formatted.values()) if docSort else formatted.values()
+                replaceDocFile(text for (key, text) in values)
+            else:
+                for key in changedKeys:
+                    sys.stdout.write(formatted[key][1])
+                sys.stdout.flush()
+    except KeyboardInterrupt:
+        pass
@@ -46,14 +46,20 @@
 from sys import settrace
 import Domoticz
 from urllib.parse import urlparse
-from datetime import datetime
+from datetime import datetime, timedelta
 from itertools import count, filterfalse
 import typing_extensions
 import json
 import time
+import random
 import traceback
 import base64
-from FF_analyzeCommand import FF_analyzeCommand
+import heapq
+import os
+import re
+import uuid
+from collections import deque
+from FF_analyzeCommand import FF_analyzeCommand, getControllerName, getControllerTopicErrors
 
 # Local MQTT client class
 class MqttClient:
@@ -67,9 +73,18 @@ class MqttClient:
     lwtData = ""                    # Last Will data
     analyzer = None                 # Command analyzer object
     isConnected = False             # MQTT connected flag
+    bufferedMessages = None         # Messages published while disconnected (topic, payload, retain)
+    droppedMessages = 0             # Count of buffered messages dropped because buffer was full
+    firstReconnectDelay = 1         # Delay before first reconnection attempt (seconds)
+    maxReconnectDelay = 60          # Maximum delay between reconnection attempts (seconds)
+    reconnectAttempts = 0           # Reconnection attempts since connection lost
+    nextReconnect = 0               # Time of next reconnection attempt
+    disconnectedSince = None        # Time connection has been lost
+    connectTimeout = 10             # Maximum delay for TCP connection and MQTT handshake (seconds)
+    connectStarted = 0              # Time of last connection attempt
 
     # Class initialization: save parameters and open connection
-    def __init__(self, destination, port, mqttConnectedCb, mqttDisconnectedCb, mqttPublishCb, mqttSubackCb, lwtTopic = None, lwtData = None):
+    def __init__(self, destination, port, mqttConnectedCb, mqttDisconnectedCb, mqttPublishCb, mqttSubackCb, lwtTopic = None, lwtData = None, bufferSize = 50):
         Domoticz.Debug("MqttClient::__init__")
         self.Address = destination
         self.Port = port
@@ -80,7 +95,11 @@ class MqttClient:
         self.lwtTopic = lwtTopic
         self.lwtData = lwtData
         self.isConnected = False
+        self.bufferedMessages = deque(maxlen=bufferSize)
+        self.droppedMessages = 0
+        self.disconnectedSince = None
         self.Open()
+        self.scheduleReconnect()
 
     # Class default string
     def __str__(self):
@@ -96,6 +115,7 @@ class MqttClient:
         if (self.mqttConn != None):
             self.Close()
         self.isConnected = False
+        self.connectStarted = time.time()
         self.mqttConn = Domoticz.Connection(Name="MQTT", Transport="TCP/IP", Protocol="MQTT", Address=self.Address, Port=self.Port)
         self.mqttConn.Connect()
 
@@ -113,19 +133,24 @@ class MqttClient:
                 Domoticz.Log(F"MQTT Connect ID: {ID}")
                 self.mqttConn.Send({'Verb': 'CONNECT', 'ID': ID})
 
-    # Send a MQTT Ping message
+    # Send a MQTT Ping message (or reconnect when reconnection delay is reached, if not connected)
     def Ping(self):
         #Domoticz.Debug("MqttClient::Ping")
         if (self.mqttConn == None or not self.isConnected):
-            self.Open()
+            self.checkReconnect()
         else:
             self.mqttConn.Send({'Verb': 'PING'})
 
-    #  Publish a payload on a given topic (and retain flag)
+    #  Publish a payload on a given topic (and retain flag), buffering it while disconnected
     def Publish(self, topic, payload, retain = 0):
         Domoticz.Debug(F"MqttClient::Publish {topic} ({payload})")
         if (self.mqttConn == None or not self.isConnected):
-            self.Open()
+            # Oldest message is lost when buffer is full
+            if len(self.bufferedMessages) == self.bufferedMessages.maxlen:
+                self.droppedMessages += 1
+            self.bufferedMessages.append((topic, payload, retain))
+            Domoticz.Debug(F"MqttClient::Publish not connected, {len(self.bufferedMessages)} message(s) buffered")
+            self.checkReconnect()
         else:
             self.mqttConn.Send({'Verb': 'PUBLISH', 'Topic': topic, 'Payload': bytearray(payload, 'utf-8'), 'Retain': retain})
 
@@ -135,8 +160,9 @@ class MqttClient:
         subscriptionlist = []
         for topic in topics:
             subscriptionlist.append({'Topic':topic, 'QoS':0})
+        # Subscriptions are done again by connection callback once connected
         if (self.mqttConn == None or not self.isConnected):
-            self.Open()
+            self.checkReconnect()
         else:
             self.mqttConn.Send({'Verb': 'SUBSCRIBE', 'Topics': subscriptionlist})
 
@@ -146,6 +172,54 @@ class MqttClient:
         self.mqttConn = None
         self.isConnected = False
 
+    # Compute next reconnection time: fast first retry, then exponential backoff with jitter
+    def scheduleReconnect(self):
+        if self.reconnectAttempts == 0:
+            delay = self.firstReconnectDelay
+        else:
+            delay = min(self.maxReconnectDelay, self.firstReconnectDelay * (2 ** self.reconnectAttempts))
+            delay = random.uniform(delay / 2, delay)
+        self.reconnectAttempts += 1
+        self.nextReconnect = time.time() + delay
+        Domoticz.Debug(F"MqttClient::scheduleReconnect attempt {self.reconnectAttempts} in {delay:.1f} seconds")
+
+    # Mark connection as lost
+    def connectionLost(self):
+        if self.disconnectedSince == None:
+            self.disconnectedSince = time.time()
+            self.reconnectAttempts = 0
+            self.scheduleReconnect()
+
+    # Check if TCP connection or MQTT handshake (waiting for CONNACK) is in progress and not too old
+    def isConnecting(self):
+        return self.mqttConn != None and not self.isConnected and (self.mqttConn.Connecting() or self.mqttConn.Connected()) \
+            and time.time() - self.connectStarted < self.connectTimeout
+
+    # Reconnect if connection is down and reconnection delay is reached
+    def checkReconnect(self):
+        # Don't abort a connection in progress
+        if self.isConnecting():
+            return
+        if self.isConnected:
+            # Connection dropped without disconnect callback
+            self.Close()
+        self.connectionLost()
+        if time.time() >= self.nextReconnect:
+            self.Open()
+            self.scheduleReconnect()
+
+    # Send messages buffered while disconnected, in order
+    def flushBuffer(self):
+        if self.disconnectedSince != None:
+            Domoticz.Log(F"MQTT connection recovered after {time.time() - self.disconnectedSince:.1f} seconds and {self.reconnectAttempts} attempt(s), "\
+                F"{len(self.bufferedMessages)} buffered message(s) to send, {self.droppedMessages} dropped")
+        self.disconnectedSince = None
+        self.reconnectAttempts = 0
+        self.droppedMessages = 0
+        while self.bufferedMessages:
+            topic, payload, retain = self.bufferedMessages.popleft()
+            self.Publish(topic, payload, retain)
+
     # TCP connect callback
     def onConnect(self, Connection, Status, Description):
         Domoticz.Debug("MqttClient::onConnect")
@@ -159,6 +233,7 @@ class MqttClient:
     def onDisconnect(self, Connection):
         Domoticz.Log(F"MqttClient::onDisonnect Disconnected from {Connection.Address}:{Connection.Port}")
         self.Close()
+        self.connectionLost()
         if self.mqttDisconnectedCb != None:
             self.mqttDisconnectedCb()
 
@@ -174,6 +249,8 @@ class MqttClient:
 
         if Data['Verb'] == "CONNACK":
             self.isConnected = True
+            # Send messages buffered while disconnected before new ones
+            self.flushBuffer()
             if self.mqttConnectedCb != None:
                 self.mqttConnectedCb()
 
@@ -197,10 +274,8 @@ class HttpClient:
     httpDisconnectedCb = None       # HTTP disconnection callback
     httpMessageCb = None            # HTTP publish callback
     isConnected = False             # HTTP connected flag
-    smsPhoneNumber = None           # Phone number to send SMS to
-    deviceName = None               # Device name to get status
     deviceId = None                 # Device id to get status
-    sendDelay = 0                   # Delay bofore sending device status request (seconds)
+    domoticzVersion = ""            # Domoticz version of controller to ask (giving its API style)
 
     # Class initialization: save parameters and open connection
     def __init__(self, destination, username, password, port, isHttps, httpConnectedCb, httpDisconnectedCb, httpMessageCb):
@@ -235,22 +310,25 @@ class HttpClient:
             self.httpConn = Domoticz.Connection(Name="HTTP", Transport="TCP/IP", Protocol="HTTP", Address=self.Address, Port=self.Port)
         self.httpConn.Connect()
 
-    # Close HTTP connection
+    # Close HTTP connection (disconnecting it if needed, so that a late answer is not taken for next request one)
     def Close(self):
         Domoticz.Log("HttpClient::Close")
+        if self.httpConn != None and (self.httpConn.Connected() or self.httpConn.Connecting()):
+            self.httpConn.Disconnect()
         self.httpConn = None
         self.isConnected = False
 
     # TCP connect callback
     def onConnect(self, Connection, Status, Description):
         Domoticz.Debug("HttpClient::onConnect")
-        if (self.httpConn == None):
-            self.Open()
+        if Connection != self.httpConn:
+            # Connection closed after a timeout
+            Domoticz.Debug(F"Ignoring connection to {Connection.Address}:{Connection.Port}, already closed")
         else:
             if (Status == 0):
                 Domoticz.Log(F"Successful connect to {Connection.Address}:{Connection.Port}")
                 # HTTP API changed since 2023.2
-                domVersion = str(Parameters["DomoticzVersion"])
+                domVersion = str(self.domoticzVersion)
                 if (domVersion[:2] == "20" and domVersion >= "2023.2"):
                     apiParams = "?type=command&param=getdevices&rid="+str(self.deviceId)
                 else:
@@ -278,10 +356,11 @@ class HttpClient:
                                             'Host': self.Address+":"+self.Port, \
                                             'User-Agent':'Domoticz/1.0' }
                                 }
-                Connection.Send(sendData, self.sendDelay)
+                Connection.Send(sendData)
             else:
                 Domoticz.Error(F"Failed to connect to {Connection.Address}:{Connection.Port}, description: {Description}")
-                self.httpConn.Close()
+                self.Close()
+                _plugin.receiveDeviceStatus(None)
 
     # TCP disconnect callback
     def onDisconnect(self, Connection):
@@ -290,6 +369,10 @@ class HttpClient:
     # TCP received message callback
     def onMessage(self, Connection, Data):
         # DumpHTTPResponseToLog(Data)
+        if Connection != self.httpConn:
+            # Answer arrived after a timeout, request is already given up
+            Domoticz.Debug(F"Ignoring answer from {Connection.Address}:{Connection.Port}, already closed")
+            return
         Status = int(Data["Status"])
         if Status == 200:
             strData = Data["Data"].decode("utf-8", "ignore")
@@ -298,36 +381,106 @@ class HttpClient:
                 jsonData = json.loads(strData)
             except ValueError as e:
                 Domoticz.Error(F"Error {e} decoding json data")
+                self.Close()
+                _plugin.receiveDeviceStatus(None)
                 return
             result = getValue(jsonData, "result")
-            dataValue = getValue(result[0], "Data", "not known")
-            # Replace data value for selectors with level names (for old Domoticz versions)
-            if getValue(result[0], "SwitchType", "") == "Selector":
-                levelNames = getValue(result[0], "LevelNames","")
-                if levelNames:
-                    level = getValue(result[0], "LevelInt", "")
-                    if level != "":
-                        levelNamesList = base64.b64decode(levelNames.encode("ascii")).decode("UTF8").split("|")
-                        try:
-                            dataValue = levelNamesList[int(int(level)/10)]
-                        except Exception as e:
-                            Domoticz.Error(F"{e} reading item {level} of {levelNamesList}")
-            lastUpdate = getValue(result[0], "LastUpdate", "????-??-?? ??:??:??")
-            # Compose SMS answer message (device name/value @dd/mm hh:mm)
-            message = self.deviceName + F" is {dataValue} @{lastUpdate[8:10]}/{lastUpdate[5:7]} {lastUpdate[11:16]}"
-            jsonAnswer = {}
-            jsonAnswer['number'] = str(self.smsPhoneNumber)
-            # Limit long message to 200 chars
-            jsonAnswer['message'] = message[:200]
-            answerMessage = json.dumps(jsonAnswer, ensure_ascii=False)
-            Domoticz.Log(F"Show result: >{replaceCrLf(answerMessage)}<")
-            _plugin.mqttClient.Publish(_plugin.smsServerSendTopic, answerMessage)
             self.Close()
-            # Load response
-            responseDevice = _plugin.getDevice('response')
-            responseDevice.Update(nValue=0, sValue=message)
+            # Selector level names are base64 encoded by HTTP API since 2020 versions
+            _plugin.receiveDeviceStatus(result[0] if result else None, str(self.domoticzVersion)[:2] == "20")
         else:
             Domoticz.Error(F"Error {Status} returned by HTTP")
+            self.Close()
+            _plugin.receiveDeviceStatus(None)
+
+# Scheduled commands, kept in a heap ordered by due time and saved into a file to survive restarts
+#   Cancelled commands are only removed from job list, their heap entry being skipped when popped
+class JobScheduler:
+    # Class initialization: load jobs saved by previous run
+    def __init__(self, fileName):
+        self.fileName = fileName    # File where jobs are saved
+        self.jobs = {}              # Pending jobs by id ({id, due, number, message})
+        self.heap = []              # Heap of (due time, id), may contain cancelled jobs
+        self.nextId = 1             # Next job id
+        self.changed = False        # Were jobs changed since last save?
+        self.load()
+
+    # Load jobs from file
+    def load(self):
+        if not os.path.exists(self.fileName):
+            return
+        try:
+            with open(self.fileName, encoding="UTF-8") as stream:
+                data = json.load(stream)
+            for job in data['jobs']:
+                self.jobs[job['id']] = job
+            self.nextId = data['nextId']
+        except Exception as e:
+            Domoticz.Error(F"{e} when loading scheduled commands from {self.fileName}")
+        self.heap = [(job['due'], job['id']) for job in self.jobs.values()]
+        heapq.heapify(self.heap)
+        if self.jobs:
+            Domoticz.Log(F"Loaded {len(self.jobs)} scheduled command(s)")
+
+    # Save jobs into file if they changed (through a temporary file, to avoid loosing them if interrupted)
+    #   Called once per heartbeat (and when stopping), so that a burst of changes writes file only once
+    #   A crash may thus loose changes of last heartbeat (up to heartbeatDelay seconds)
+    def saveIfChanged(self):
+        if not self.changed:
+            return
+        self.changed = False
+        tempFile = self.fileName + ".tmp"
+        try:
+            with open(tempFile, "wt", encoding="UTF-8") as stream:
+                json.dump({'nextId': self.nextId, 'jobs': list(self.jobs.values())}, stream, ensure_ascii=False)
+            os.replace(tempFile, self.fileName)
+        except Exception as e:
+            Domoticz.Error(F"{e} when saving scheduled commands into {self.fileName}")
+
+    # Add a job, returning it
+    def add(self, due, number, message):
+        job = {'id': str(self.nextId), 'due': due, 'number': number, 'message': message}
+        self.nextId += 1
+        self.jobs[job['id']] = job
+        heapq.heappush(self.heap, (due, job['id']))
+        self.changed = True
+        return job
+
+    # Cancel a job given its id, returning it (or None if not found or not created by given number)
+    def cancel(self, id, number):
+        job = self.jobs.get(id)
+        if job == None or job['number'] != number:
+            return None
+        del self.jobs[id]
+        # Rebuild heap when it mostly contains cancelled jobs
+        if len(self.heap) > 2 * len(self.jobs) + 16:
+            self.heap = [(job['due'], job['id']) for job in self.jobs.values()]
+            heapq.heapify(self.heap)
+        self.changed = True
+        return job
+
+    # Remove cancelled jobs from heap top
+    def skipCancelled(self):
+        while self.heap and self.heap[0][1] not in self.jobs:
+            heapq.heappop(self.heap)
+
+    # Return due time of next job (None if no job)
+    def nextDue(self):
+        self.skipCancelled()
+        return self.heap[0][0] if self.heap else None
+
+    # Remove and return first job due at given time (None if no job is due)
+    def popDueJob(self, now):
+        self.skipCancelled()
+        if not self.heap or self.heap[0][0] > now:
+            return None
+        job = self.jobs.pop(heapq.heappop(self.heap)[1])
+        self.changed = True
+        return job
+
+    # Return pending jobs created by given number, sorted by due time
+    def pendingJobs(self, number):
+        return sorted((job for job in self.jobs.values() if job['number'] == number), key=lambda job: job['due'])
 
 # Base plug-in class
 class BasePlugin:
@@ -346,10 +499,36 @@ class BasePlugin:
     domoticzAddress = ""            # Domoticz IP address
     domoticzPort = ""               # Domoticz port
     domoticzHttps = False           # Is Domoticz using https scheme?
+    controllers = {}                # Domoticz controllers by name (address, port, credentials, MQTT topics)
+    defaultController = ""          # Name of controller used for devices without controller
     httpClient = None               # HTTP client object
+    confirmationTimeout = 10        # Maximum delay to wait for device change confirmation (seconds)
+    pendingConfirmation = None      # Device change waiting for confirmation (idx, number, name, controller, deadline)
+    statusCacheTtl = 10             # Delay while a device status is read from cache (seconds, 0 to disable)
+    statusCache = {}                # Last device status by (controller, idx): time, value and last update
+    changedDuringLookup = set()     # Devices (controller, idx) changed while their status was being looked up, whose status is not cached
+    statusLookups = {}              # Devices status lookups by (controller, idx), with requesters (number, device name) waiting for them
+    statusLookupDeadline = 0        # Time when status lookup in progress is given up (0 if none)
+    statusLookupTimeout = 10        # Maximum delay to get a device status (seconds)
+    statusLookupMqtt = False        # Is status lookup in progress using MQTT?
+    statusTransport = "http"        # Transport used to get device status ("http" or "mqtt")
+    mqttStatusTimeout = 5           # Maximum delay to get a device status through MQTT before using HTTP (seconds)
+    levelNamesCache = {}            # Decoded selector level names by (controller, idx), with original (encoded) value
+    heartbeatDelay = 15             # Normal heartbeat delay (seconds)
+    currentHeartbeat = 0            # Heartbeat delay currently set (seconds)
+    mqttBufferSize = 50             # Maximum count of messages buffered while MQTT is disconnected
+    nextMqttCheck = 0               # Next MQTT connection check time
+    scheduler = None                # Scheduled commands
+    scheduleDelayWords = ["in", "dans"]     # Words giving a delay at end of a command (like "in 2h30")
+    scheduleTimeWords = ["at", "vers"]      # Words giving a time at end of a command (like "at 18:00")
+    scheduleListCommand = "jobs"    # Command listing scheduled commands
+    scheduleCancelCommand = "cancel"        # Command cancelling a scheduled command, given its number
+    scheduleCatchUp = 3600          # Maximum lateness of a scheduled command (missed while stopped) to still execute it (seconds)
+    userRequestTopic = ""           # MQTT topic to send "setBy":"user" requests to (as JSON, instead of writing them into user request device)
     debugging = "Normal"            # Set Debug level
     initDone = False                # Clear init flag
     analyzer = FF_analyzeCommand()  # Load analyzer object
+    jsonFile = ""                   # Tables file name
 
     # Find a device by name in devices table
     def getDevice(self, deviceName):
@@ -387,6 +566,20 @@ class BasePlugin:
             Domoticz.Log(F"Creating device {deviceName}")
             Domoticz.Device(Name=deviceName, Unit=self.getNextDeviceId(), Type=243, Subtype=19, DeviceID=deviceKey, Used=True).Create()
 
+    # Reload tables into a new analyzer, used only if no error found (settings are not reloaded)
+    def reloadTables(self):
+        analyzer = FF_analyzeCommand()
+        errorText, messages = analyzer.loadData(self.jsonFile)
+        if errorText:
+            Domoticz.Error(F"Reloading tables status: {messages}")
+            # Don't try again until files change again
+            self.analyzer.loadedFiles = analyzer.loadedFiles
+            return
+        Domoticz.Log("Reloading tables status: ok")
+        if messages:
+            Domoticz.Log(messages)
+        self.analyzer = analyzer
+
     # Called on plug-in statup
     def onStart(self):
         # Parse options
@@ -408,8 +601,9 @@ class BasePlugin:
 
         # Json file name (at root of plug-in folder)
         jsonFile = Parameters['HomeFolder'] + Parameters["Mode1"]
+        self.jsonFile = jsonFile
 
-        # Load json file (except settings)
+        # Load json file (and files it includes)
         errorText, messages = self.analyzer.loadData(jsonFile)          
         # Do we had errors?
         if errorText:
@@ -421,55 +615,77 @@ class BasePlugin:
         if messages:
             Domoticz.Log(messages)
 
-        # Load JSON settings
-        with open(jsonFile, encoding = 'UTF-8') as configStream:
-            try:
-                jsonData = json.load(configStream)
-            except Exception as e:
-                Domoticz.Error(F"{e} when loading {jsonFile}")
-                return
-            # Get only settings part
-            settings = getValue(jsonData, 'settings')
-            if not settings:
-                # No settings found, exit
-                Domoticz.Error(F"Can't find 'settings' in {jsonFile}")
-                return
-            # Get the different settings values
-            self.smsServerReceiveTopic = getValue(settings, 'smsServerReceiveTopic')
-            self.smsServerSendTopic = getValue(settings, 'smsServerSendTopic')
-            self.smsServerLwtTopic = getValue(settings, 'smsServerLwtTopic')
-            self.smsServerPrefix = getValue(settings, 'smsServerPrefix')
-            self.domoticzInTopic = getValue(settings, 'domoticzInTopic')
-            self.domoticzOutTopic = getValue(settings, 'domoticzOutTopic')
-            self.domoticzUrl = getValue(settings, 'domoticzUrl')
-            if self.smsServerLwtTopic:
-                self.smsServerLwtTopic +=  "/" + self.smsServerPrefix
-            inError = False
-            if not self.smsServerSendTopic:
-                Domoticz.Error(F"Can't find 'settings/smsServerSendTopic' in {jsonFile}")
-                inError = True
-            if not self.smsServerReceiveTopic:
-                Domoticz.Error(F"Can't find 'settings/smsServerReceiveTopic' in {jsonFile}")
-                inError = True
-            if not self.domoticzInTopic:
-                Domoticz.Error(F"Can't find 'settings/domoticzInTopic' in {jsonFile}")
-                inError = True
-            if not self.domoticzOutTopic:
-                Domoticz.Error(F"Can't find 'settings/domoticzOutTopic' in {jsonFile}")
-                inError = True
-            if not self.domoticzUrl:
-                Domoticz.Error(F"Can't find 'settings/domoticzUrl' in {jsonFile}")
+        # Get only settings part (merged from all loaded files)
+        settings = self.analyzer.settings
+        if not settings:
+            # No settings found, exit
+            Domoticz.Error(F"Can't find 'settings' in {jsonFile}")
+            return
+        # Get the different settings values
+        self.smsServerReceiveTopic = getValue(settings, 'smsServerReceiveTopic')
+        self.smsServerSendTopic = getValue(settings, 'smsServerSendTopic')
+        self.smsServerLwtTopic = getValue(settings, 'smsServerLwtTopic')
+        self.smsServerPrefix = getValue(settings, 'smsServerPrefix')
+        self.domoticzInTopic = getValue(settings, 'domoticzInTopic')
+        self.domoticzOutTopic = getValue(settings, 'domoticzOutTopic')
+        self.domoticzUrl = getValue(settings, 'domoticzUrl')
+        self.confirmationTimeout = getValue(settings, 'confirmationTimeout', self.confirmationTimeout)
+        self.mqttBufferSize = getValue(settings, 'mqttBufferSize', self.mqttBufferSize)
+        self.statusCacheTtl = getValue(settings, 'statusCacheTtl', self.statusCacheTtl)
+        self.statusTransport = getValue(settings, 'statusTransport', self.statusTransport).lower()
+        self.mqttStatusTimeout = getValue(settings, 'mqttStatusTimeout', self.mqttStatusTimeout)
+        self.scheduleDelayWords = getValue(settings, 'scheduleDelayWords', self.scheduleDelayWords)
+        self.scheduleTimeWords = getValue(settings, 'scheduleTimeWords', self.scheduleTimeWords)
+        self.scheduleListCommand = getValue(settings, 'scheduleListCommand', self.scheduleListCommand)
+        self.scheduleCancelCommand = getValue(settings, 'scheduleCancelCommand', self.scheduleCancelCommand)
+        self.scheduleCatchUp = getValue(settings, 'scheduleCatchUp', self.scheduleCatchUp)
+        self.userRequestTopic = getValue(settings, 'userRequestTopic', self.userRequestTopic)
+        if self.smsServerLwtTopic:
+            self.smsServerLwtTopic +=  "/" + self.smsServerPrefix
+        inError = False
+        if not self.smsServerSendTopic:
+            Domoticz.Error(F"Can't find 'settings/smsServerSendTopic' in {jsonFile}")
+            inError = True
+        if not self.smsServerReceiveTopic:
+            Domoticz.Error(F"Can't find 'settings/smsServerReceiveTopic' in {jsonFile}")
+            inError = True
+        if not self.domoticzInTopic:
+            Domoticz.Error(F"Can't find 'settings/domoticzInTopic' in {jsonFile}")
+            inError = True
+        if not self.domoticzOutTopic:
+            Domoticz.Error(F"Can't find 'settings/domoticzOutTopic' in {jsonFile}")
+            inError = True
+        if not self.domoticzUrl:
+            Domoticz.Error(F"Can't find 'settings/domoticzUrl' in {jsonFile}")
+            inError = True
+        else:
+            # domoticzUrl can also be a list of controllers (URL or {"url", "name", "domoticzInTopic", "domoticzOutTopic", "version"}), first one being the default
+            #   Controller version (defaulting to local Domoticz one) gives its HTTP API style
+            self.controllers = {}
+            for item in self.domoticzUrl if isinstance(self.domoticzUrl, list) else [self.domoticzUrl]:
+                if not isinstance(item, dict):
+                    item = {'url': item}
+                urlParts = urlparse(getValue(item, 'url'))
+                controllerName = getControllerName(item)
+                self.controllers[controllerName] = {'username': urlParts.username, 'password': urlParts.password, \
+                    'address': urlParts.hostname, 'port': str(urlParts.port), 'https': urlParts.scheme.lower() == "https", \
+                    'inTopic': getValue(item, 'domoticzInTopic', self.domoticzInTopic), 'outTopic': getValue(item, 'domoticzOutTopic', self.domoticzOutTopic), \
+                    'version': str(getValue(item, 'version', Parameters["DomoticzVersion"]))}
+                if not self.defaultController:
+                    self.defaultController = controllerName
+            # Commands sent on a topic shared by several controllers would be executed by all of them
+            for error in getControllerTopicErrors(self.domoticzUrl, self.domoticzInTopic, self.domoticzOutTopic):
+                Domoticz.Error(error)
                 inError = True
-            else:
-                urlParts = urlparse(self.domoticzUrl)
-                self.domoticzUsername = urlParts.username
-                self.domoticzPassword = urlParts.password
-                self.domoticzAddress = urlParts.hostname
-                self.domoticzPort = str(urlParts.port)
-                self.domoticzHttps = urlParts.scheme.lower() == "https"
-            # Exit if something not found
-            if inError :
-                return
+            controller = self.controllers[self.defaultController]
+            self.domoticzUsername = controller['username']
+            self.domoticzPassword = controller['password']
+            self.domoticzAddress = controller['address']
+            self.domoticzPort = controller['port']
+            self.domoticzHttps = controller['https']
+        # Exit if something not found
+        if inError :
+            return
 
         # Create devices if not existing
         self.createDevice("SMS request","request")                      # This will contain SMS message received as command/request
@@ -484,11 +700,14 @@ class BasePlugin:
             lwtTopic = None
             lwtData = None
 
+        # Load scheduled commands kept from previous run
+        self.scheduler = JobScheduler(Parameters["HomeFolder"] + "FF_SmsServerJobs.json")
+
         self.initDone = True
         # Connect to MQTT server
         self.mqttClient = MqttClient(self.mqttServerAddress, self.mqttServerPort, \
             self.onMQTTConnected, self.onMQTTDisconnected, self.onMQTTPublish, self.onMQTTSubscribed, \
-            lwtTopic, lwtData)
+            lwtTopic, lwtData, self.mqttBufferSize)
 
         # Connect to HTTP server
         self.httpClient = HttpClient(self.domoticzAddress, self.domoticzUsername, self.domoticzPassword, \
@@ -496,7 +715,7 @@ class BasePlugin:
             self.onConnect, self.onDisconnect, self.onMessage)
 
         # Enable heartbeat
-        Domoticz.Heartbeat(15)
+        self.updateHeartbeat()
 
     # TCP base-plug-in connection callback
     def onConnect(self, Connection, Status, Description):
@@ -536,11 +755,12 @@ class BasePlugin:
         if not self.initDone:
             return
         Domoticz.Debug("onMQTTConnected")
+        self.updateHeartbeat()
         if self.smsServerLwtTopic:
             payload = '{"state":"up", "version":"'+str(Parameters['Version'])+'", "startDate":"'+str(datetime.now())+'"}'
             self.mqttClient.Publish(self.smsServerLwtTopic, payload, 1)
-        # Subscribe to topics to listen to
-        self.mqttClient.Subscribe({self.smsServerReceiveTopic})
+        # Subscribe to topics to listen to (Domoticz out topics are used to confirm device changes)
+        self.mqttClient.Subscribe({self.smsServerReceiveTopic} | self.getOutTopics())
 
     # TCP base plug-in MQTT disconnected callabck
     def onMQTTDisconnected(self):
@@ -548,6 +768,7 @@ class BasePlugin:
         if not self.initDone:
             return
         Domoticz.Debug("onMQTTDisconnected")
+        self.updateHeartbeat()
 
     # TCP base-plug-in MQTT published (received SMS) callback
     def onMQTTPublish(self, topic, rawmessage):
@@ -563,6 +784,16 @@ class BasePlugin:
         if self.debugging == "Verbose+":
             DumpMQTTMessageToLog(topic, rawmessage, 'onMQTTPublish: ')
 
+        # Is this a Domoticz device change?
+        if topic in self.getOutTopics():
+            if type(payload).__name__ == "dict":
+                # Answer to MQTT status lookup gives status to cache, other messages tell that device changed
+                if not (self.statusLookupMqtt and self.checkStatusLookup(payload, topic)):
+                    self.invalidateStatus(getValue(payload, 'idx', None), topic)
+                if self.pendingConfirmation:
+                    self.checkConfirmation(getValue(payload, 'idx', None), topic)
+            return
+
         # If this received SMS topic?
         if topic == self.smsServerReceiveTopic:
             # Extract number, date and message parts
@@ -579,94 +810,337 @@ class BasePlugin:
                 # Remove prefix
                 message = message[len(self.smsServerPrefix):].strip()
                 Domoticz.Log(F"Message >{replaceCrLf(message)}<")
-                # Analyze message
-                errorText, messages = self.analyzer.analyzeCommand(message)
-                # Do we had an error analyzing command?
-                if errorText != "":
-                    # Yes, log it and send error back to SMS sender
-                    Domoticz.Error(F"Error: {replaceCrLf(messages)}")
-                    # Compose SMS answer message
-                    message = errorText
-                    jsonAnswer = {}
-                    jsonAnswer['number'] = str(number)
-                    # Limit long message to 200 chars
-                    jsonAnswer['message'] = message[:200]
-                    answerMessage = json.dumps(jsonAnswer, ensure_ascii=False)
-                    Domoticz.Log(F"Answer: >{replaceCrLf(answerMessage)}<")
-                    self.mqttClient.Publish(self.smsServerSendTopic, answerMessage)
-                    return
-                else:
-                    # Analyzed without error
-                    if messages:
-                        Domoticz.Log(F"Info: {replaceCrLf(messages)}")
-                    # Rebuild non abbreviated command
-                    understoodMessage = self.analyzer.command+"  "+self.analyzer.deviceName+(" "+str(self.analyzer.valueToSet) if self.analyzer.valueToSet != None else "")
-                    Domoticz.Log(F"Understood command is >{understoodMessage}<")
-                    # Set Domoticz last request with non abbreviated command
-                    lastRequestDevice = self.getDevice('request')
-                    if lastRequestDevice:
-                        lastRequestDevice.Update(nValue=0, sValue=understoodMessage)
-                    if self.analyzer.setBy == "user":
-                        # Prepare Domoticz SMS command message (space delimited)
-                        domoticzMessage = (
-                            # SMS sender phone number
-                            str(number)+ 
-                            # Command value
-                            "~"+str(self.analyzer.commandValue)+ 
-                            # Device ID
-                            "~"+str(self.analyzer.deviceId)+ 
-                            # Device class
-                            "~"+str(self.analyzer.deviceCategory)+ 
-                            # Value to set as given
-                            "~"+str(self.analyzer.valueToSet)+ 
-                            # Value to set remapped with "values" in "devices" of smsTables.json
-                            "~"+str(self.analyzer.valueToSetOriginal)+
-                            # Value to set type
-                            "~"+str(self.analyzer.valueToSetType)
-                        )
-                        Domoticz.Log(F"Domoticz message: >{domoticzMessage}<")
-                        requestDevice = self.getDevice('userRequest')
-                        ## Update request device for domoticz or user to execute command
-                        requestDevice.Update(nValue=0, sValue=domoticzMessage)
-                        return
-                    else:   # self.analyzer.setBy != "user":
-                        # Save phone number, device name and id
-                        self.httpClient.smsPhoneNumber = number
-                        self.httpClient.deviceName = self.analyzer.deviceName
-                        self.httpClient.deviceId = self.analyzer.deviceId
-                        self.httpClient.sendDelay = 2
-                        jsonMessage = "{"+F'"command":"addlogmessage","message":"SMS server plugin: Can not set type >{self.analyzer.valueToSetType}< for >{replaceCrLf(message)}<'+"}"
-                        if self.analyzer.commandValue == 1:     # CdeOn
-                            jsonMessage = "{"+F'"command":"switchlight","idx":{self.analyzer.deviceId},"switchcmd":"On","rssi":6,"battery":255'+"}"
-                        elif self.analyzer.commandValue == 2:   # CdeOff
-                            jsonMessage = "{"+F'"command":"switchlight","idx":{self.analyzer.deviceId},"switchcmd":"Off","rssi":6,"battery":255'+"}"
-                        elif self.analyzer.commandValue == 4:   # CdeShow
-                            # Load current device status
-                            self.httpClient.Open()
-                            self.httpClient.sendDelay = 0
-                            return
-                        elif self.analyzer.commandValue == 8:   # CdeSet
-                            # 'level','setPoint', 'integer', 'float','string'
-                            if self.analyzer.valueToSetType == "level":
-                                numValue = int(self.analyzer.valueToSet)
-                                jsonMessage = "{"+F'"command":"switchlight","idx":{self.analyzer.deviceId},"switchcmd":"Set Level","level":{numValue}"rssi":6,"battery":255'+"}"
-                            elif self.analyzer.valueToSetType == "setPoint":
-                                jsonMessage = "{"+F'"command":"udevice","idx":{self.analyzer.deviceId},"svalue":"{self.analyzer.valueToSet}","rssi":6,"battery":255'+"}"
-                            elif self.analyzer.valueToSetType == "integer":
-                                jsonMessage = "{"+F'"command":"udevice","idx":{self.analyzer.deviceId},"nvalue":{self.analyzer.valueToSet},"rssi":6,"battery":255'+"}"
-                            elif self.analyzer.valueToSetType == "float":
-                                jsonMessage = "{"+F'"command":"udevice","idx":{self.analyzer.deviceId},"svalue":"{self.analyzer.valueToSet}","rssi":6,"battery":255'+"}"
-                            elif self.analyzer.valueToSetType == "string":
-                                jsonMessage = "{"+F'"command":"udevice","idx":{self.analyzer.deviceId},"svalue":"{self.analyzer.valueToSet}","rssi":6,"battery":255'+"}"
-                        Domoticz.Log(F"Domoticz update: >{jsonMessage}<")
-                        self.mqttClient.Publish(self.domoticzInTopic, jsonMessage)
-                        # Load current device status
-                        self.httpClient.Open()
+                self.executeMessage(number, message)
             else:
                 Domoticz.Debug(F"Prefix >{self.smsServerPrefix}< not found, message not for me")
         else:
             Domoticz.Error(F"Unknown topic >{topic}<, should be >{self.smsServerReceiveTopic}<")
 
+    # Analyze a message received from a phone number and execute it (now or later if scheduled)
+    def executeMessage(self, number, message):
+        # Scheduled jobs list and cancel commands
+        if self.executeJobCommand(number, message):
+            return
+        # Analyze message
+        errorText, messages = self.analyzer.analyzeCommand(message)
+        # Isolate delay or time at end of a message whose command is understood, but not the rest of it
+        #   (a value ending like a delay, understood with message, is not a schedule)
+        dueTime = None
+        if errorText != "" and self.analyzer.command:
+            commandMessage, dueTime = splitSchedule(message, self.scheduleDelayWords, self.scheduleTimeWords, self.analyzer)
+            if dueTime != None:
+                message = commandMessage
+                errorText, messages = self.analyzer.analyzeCommand(message)
+        # Do we had an error analyzing command?
+        if errorText != "":
+            # Yes, log it and send error back to SMS sender
+            Domoticz.Error(F"Error: {replaceCrLf(messages)}")
+            self.sendAnswer(number, errorText)
+            return
+        else:
+            # Analyzed without error
+            if messages:
+                Domoticz.Log(F"Info: {replaceCrLf(messages)}")
+            # Rebuild non abbreviated command
+            understoodMessage = self.analyzer.command+"  "+self.analyzer.deviceName+(" "+str(self.analyzer.valueToSet) if self.analyzer.valueToSet != None else "")
+            Domoticz.Log(F"Understood command is >{understoodMessage}<")
+            # Keep scheduled command for later (it'll be analyzed again when executed)
+            if dueTime != None:
+                job = self.scheduler.add(dueTime, number, message)
+                self.sendAnswer(number, F"Scheduled #{job['id']} at {formatTime(dueTime)}: {understoodMessage}")
+                self.updateHeartbeat()
+                return
+            # Set Domoticz last request with non abbreviated command
+            lastRequestDevice = self.getDevice('request')
+            if lastRequestDevice:
+                lastRequestDevice.Update(nValue=0, sValue=understoodMessage)
+            if self.analyzer.setBy == "user" and self.userRequestTopic:
+                # Send request as JSON to external handler, with an id to correlate its logs and answers
+                jsonRequest = {'id': str(uuid.uuid4()), 'number': str(number), 'command': self.analyzer.commandValueText, \
+                    'commandValue': self.analyzer.commandValue, 'idx': self.analyzer.deviceId, 'device': self.analyzer.deviceName, 'category': self.analyzer.deviceCategory, \
+                    'value': self.analyzer.valueToSet, 'originalValue': self.analyzer.valueToSetOriginal, 'setType': self.analyzer.valueToSetType, \
+                    'controller': self.analyzer.deviceController or self.defaultController}
+                userMessage = json.dumps(jsonRequest, ensure_ascii=False)
+                Domoticz.Log(F"User request: >{userMessage}<")
+                self.mqttClient.Publish(self.userRequestTopic, userMessage)
+                return
+            elif self.analyzer.setBy == "user":
+                # Prepare Domoticz SMS command message (space delimited)
+                domoticzMessage = (
+                    # SMS sender phone number
+                    str(number)+ 
+                    # Command value
+                    "~"+str(self.analyzer.commandValue)+ 
+                    # Device ID
+                    "~"+str(self.analyzer.deviceId)+ 
+                    # Device class
+                    "~"+str(self.analyzer.deviceCategory)+ 
+                    # Value to set as given
+                    "~"+str(self.analyzer.valueToSet)+ 
+                    # Value to set remapped with "values" in "devices" of smsTables.json
+                    "~"+str(self.analyzer.valueToSetOriginal)+
+                    # Value to set type
+                    "~"+str(self.analyzer.valueToSetType)
+                )
+                Domoticz.Log(F"Domoticz message: >{domoticzMessage}<")
+                requestDevice = self.getDevice('userRequest')
+                ## Update request device for domoticz or user to execute command
+                requestDevice.Update(nValue=0, sValue=domoticzMessage)
+                return
+            else:   # self.analyzer.setBy != "user":
+                # Route requests to controller owning device
+                domoticzInTopic = self.getController(self.analyzer.deviceController)['inTopic']
+                deviceId = int(self.analyzer.deviceId)
+                domoticzCommand = None
+                if self.analyzer.commandValue == 1:     # CdeOn
+                    domoticzCommand = {'command': "switchlight", 'idx': deviceId, 'switchcmd': "On"}
+                elif self.analyzer.commandValue == 2:   # CdeOff
+                    domoticzCommand = {'command': "switchlight", 'idx': deviceId, 'switchcmd': "Off"}
+                elif self.analyzer.commandValue == 4:   # CdeShow
+                    # Load current device status
+                    self.getDeviceStatus(number, self.analyzer.deviceName, self.analyzer.deviceId, self.analyzer.deviceController)
+                    return
+                elif self.analyzer.commandValue == 8:   # CdeSet
+                    # 'level','setPoint', 'integer', 'float','string'
+                    if self.analyzer.valueToSetType == "level":
+                        domoticzCommand = {'command': "switchlight", 'idx': deviceId, 'switchcmd': "Set Level", 'level': int(self.analyzer.valueToSet)}
+                    elif self.analyzer.valueToSetType == "integer":
+                        domoticzCommand = {'command': "udevice", 'idx': deviceId, 'nvalue': int(self.analyzer.valueToSet)}
+                    elif self.analyzer.valueToSetType in ["setPoint", "float", "string"]:
+                        domoticzCommand = {'command': "udevice", 'idx': deviceId, 'svalue': str(self.analyzer.valueToSet)}
+                if domoticzCommand == None:
+                    # Nothing will change, just log it into Domoticz and send current status
+                    jsonMessage = json.dumps({'command': "addlogmessage", \
+                        'message': F"SMS server plugin: Can not set type >{self.analyzer.valueToSetType}< for >{replaceCrLf(message)}<"}, ensure_ascii=False)
+                    Domoticz.Log(F"Domoticz log: >{jsonMessage}<")
+                    self.mqttClient.Publish(domoticzInTopic, jsonMessage)
+                    self.getDeviceStatus(number, self.analyzer.deviceName, self.analyzer.deviceId, self.analyzer.deviceController)
+                    return
+                jsonMessage = json.dumps(dict(domoticzCommand, rssi=6, battery=255), ensure_ascii=False)
+                Domoticz.Log(F"Domoticz update: >{jsonMessage}<")
+                # Cached status is no longer valid, even if Domoticz doesn't confirm change
+                self.forgetStatus((self.analyzer.deviceController or self.defaultController, str(self.analyzer.deviceId)))
+                # Wait for device change before loading its status
+                self.waitForConfirmation(number, self.analyzer.deviceName, self.analyzer.deviceId, self.analyzer.deviceController)
+                self.mqttClient.Publish(domoticzInTopic, jsonMessage)
+
+    # Send an SMS answer to a phone number
+    def sendAnswer(self, number, message):
+        jsonAnswer = {}
+        jsonAnswer['number'] = str(number)
+        # Limit long message to 200 chars
+        jsonAnswer['message'] = message[:200]
+        answerMessage = json.dumps(jsonAnswer, ensure_ascii=False)
+        Domoticz.Log(F"Answer: >{replaceCrLf(answerMessage)}<")
+        self.mqttClient.Publish(self.smsServerSendTopic, answerMessage)
+
+    # Execute scheduled commands list or cancel command, returning False if message is not one of them
+    #   Only commands scheduled by sender are listed and can be cancelled
+    def executeJobCommand(self, number, message):
+        words = message.split()
+        if len(words) == 1 and self.analyzer.convertUserData(words[0]) == self.analyzer.convertUserData(self.scheduleListCommand):
+            jobs = self.scheduler.pendingJobs(number)
+            self.sendAnswer(number, "; ".join(F"#{job['id']} {formatTime(job['due'])} {job['message']}" for job in jobs) if jobs else "No scheduled command")
+            return True
+        if len(words) == 2 and self.analyzer.convertUserData(words[0]) == self.analyzer.convertUserData(self.scheduleCancelCommand):
+            job = self.scheduler.cancel(words[1].lstrip("#"), number)
+            self.sendAnswer(number, F"Cancelled #{job['id']} {formatTime(job['due'])} {job['message']}" if job else F"Can't find scheduled command {words[1]}")
+            self.updateHeartbeat()
+            return True
+        return False
+
+    # Execute next scheduled command if due (one per heartbeat, after previous device change is confirmed)
+    def executeDueJob(self):
+        if self.pendingConfirmation:
+            return
+        job = self.scheduler.popDueJob(time.time())
+        if job == None:
+            return
+        lateness = time.time() - job['due']
+        if lateness > self.scheduleCatchUp:
+            Domoticz.Error(F"Scheduled command #{job['id']} >{job['message']}< is {int(lateness)} seconds late, dropped")
+            self.sendAnswer(job['number'], F"Scheduled #{job['id']} {formatTime(job['due'])} {job['message']} not executed (too late)")
+            return
+        Domoticz.Log(F"Executing scheduled command #{job['id']} >{job['message']}< from {job['number']}")
+        self.executeMessage(job['number'], job['message'])
+
+    # Return Domoticz out topics of all controllers
+    def getOutTopics(self):
+        return {controller['outTopic'] for controller in self.controllers.values()}
+
+    # Return a controller (default one if not given or unknown)
+    def getController(self, controllerName):
+        controller = getValue(self.controllers, controllerName or self.defaultController, None)
+        if controller == None:
+            Domoticz.Error(F"Unknown controller >{controllerName}<, using >{self.defaultController}<")
+            controller = self.controllers[self.defaultController]
+        return controller
+
+    # Wait for a device change to be confirmed by Domoticz before sending its status
+    def waitForConfirmation(self, number, deviceName, deviceId, controllerName = ""):
+        # Status of a previous device not yet confirmed is sent immediately
+        if self.pendingConfirmation:
+            self.sendDeviceStatus()
+        self.pendingConfirmation = {'idx': str(deviceId), 'number': number, 'deviceName': deviceName, 'controller': controllerName, \
+            'deadline': time.time() + float(self.confirmationTimeout)}
+        self.updateHeartbeat()
+
+    # Check Domoticz out idx (and topic) against device waiting for confirmation
+    def checkConfirmation(self, idx, topic):
+        controller = getValue(self.controllers, self.pendingConfirmation['controller'] or self.defaultController, None)
+        if str(idx) == self.pendingConfirmation['idx'] and (controller == None or topic == controller['outTopic']):
+            Domoticz.Debug(F"Change of idx {idx} confirmed")
+            self.sendDeviceStatus()
+
+    # Load status of device waiting for confirmation and send it back
+    def sendDeviceStatus(self):
+        confirmation = self.pendingConfirmation
+        self.pendingConfirmation = None
+        self.updateHeartbeat()
+        self.getDeviceStatus(confirmation['number'], confirmation['deviceName'], confirmation['idx'], confirmation['controller'])
+
+    # Send status of a device to a phone number, from cache if recent enough
+    #   Only one lookup is done at a time, requests for a device already being looked up waiting for its result
+    def getDeviceStatus(self, number, deviceName, deviceId, controllerName = ""):
+        key = (controllerName or self.defaultController, str(deviceId))
+        status = getValue(self.statusCache, key, None)
+        if status != None and time.time() - status['time'] < float(self.statusCacheTtl):
+            Domoticz.Debug(F"Status of idx {deviceId} read from cache")
+            self.sendStatus(number, deviceName, status['value'], status['lastUpdate'])
+            return
+        if key in self.statusLookups:
+            Domoticz.Debug(F"Status of idx {deviceId} already requested, waiting for it")
+            self.statusLookups[key].append((number, deviceName))
+            return
+        self.statusLookups[key] = [(number, deviceName)]
+        if len(self.statusLookups) == 1:
+            self.startStatusLookup()
+
+    # Start loading status of first device in lookup list, through MQTT if asked and connected, else through HTTP
+    def startStatusLookup(self, useMqtt = True):
+        controllerName, deviceId = next(iter(self.statusLookups))
+        controller = self.getController(controllerName)
+        self.statusLookupMqtt = useMqtt and self.statusTransport == "mqtt" and self.mqttClient.isConnected
+        if self.statusLookupMqtt:
+            # Domoticz answers on its out topic
+            self.statusLookupDeadline = time.time() + float(self.mqttStatusTimeout)
+            self.updateHeartbeat()
+            self.mqttClient.Publish(controller['inTopic'], json.dumps({'command': 'getdeviceinfo', 'idx': int(deviceId)}))
+            return
+        # Direct HTTP request to controller (only here, as only one lookup is done at a time)
+        self.httpClient.Address = controller['address']
+        self.httpClient.Port = controller['port']
+        self.httpClient.hostUsername = controller['username']
+        self.httpClient.hostPassword = controller['password']
+        self.httpClient.isHttps = controller['https']
+        self.httpClient.domoticzVersion = controller['version']
+        self.httpClient.deviceId = deviceId
+        self.statusLookupDeadline = time.time() + self.statusLookupTimeout
+        self.updateHeartbeat()
+        self.httpClient.Open()
+
+    # Check Domoticz out message against device status looked up through MQTT, returning True if it was the awaited answer
+    def checkStatusLookup(self, payload, topic):
+        controllerName, deviceId = next(iter(self.statusLookups))
+        controller = getValue(self.controllers, controllerName, None)
+        if str(getValue(payload, 'idx', None)) == deviceId and (controller == None or topic == controller['outTopic']):
+            self.receiveDeviceStatus(mqttDeviceStatus(payload))
+            return True
+        return False
+
+    # Receive status of device being looked up (None if lookup failed), send it to all requesters and start next lookup
+    #   Status of another device (answer to a previous request) is ignored
+    #   levelNamesEncoded tells if selector level names are base64 encoded (HTTP API) or given as is (MQTT)
+    def receiveDeviceStatus(self, device, levelNamesEncoded = False):
+        if not self.statusLookups:
+            return
+        key = next(iter(self.statusLookups))
+        if device != None and str(getValue(device, "idx", key[1])) != key[1]:
+            Domoticz.Error(F"Received status of idx {device['idx']} while waiting for idx {key[1]}, ignored")
+            return
+        requesters = self.statusLookups.pop(key)
+        if device == None:
+            Domoticz.Error(F"Can't get status of idx {key[1]}")
+            for number, deviceName in requesters:
+                self.sendAnswer(number, F"Can't get status of {deviceName}")
+        else:
+            dataValue = getValue(device, "Data", "not known")
+            # Replace data value for selectors with level names (for old Domoticz versions)
+            if getValue(device, "SwitchType", "") == "Selector":
+                levelNamesList = self.getLevelNames(key, getValue(device, "LevelNames", ""), levelNamesEncoded)
+                level = getValue(device, "LevelInt", "")
+                if levelNamesList and level != "":
+                    try:
+                        dataValue = levelNamesList[int(int(level)/10)]
+                    except Exception as e:
+                        Domoticz.Error(F"{e} reading item {level} of {levelNamesList}")
+            lastUpdate = getValue(device, "LastUpdate", "????-??-?? ??:??:??")
+            # Status read before a change of device is sent, but not cached
+            if key not in self.changedDuringLookup:
+                self.statusCache[key] = {'time': time.time(), 'value': dataValue, 'lastUpdate': lastUpdate}
+            for number, deviceName in requesters:
+                self.sendStatus(number, deviceName, dataValue, lastUpdate)
+        self.changedDuringLookup.discard(key)
+        self.statusLookupDeadline = 0
+        self.statusLookupMqtt = False
+        if self.statusLookups:
+            self.startStatusLookup()
+        else:
+            self.updateHeartbeat()
+
+    # Return selector level names of a device, decoding them (if encoded) only when changed
+    def getLevelNames(self, key, levelNames, encoded):
+        if not levelNames:
+            return []
+        cached = getValue(self.levelNamesCache, key, None)
+        if cached == None or cached[0] != (levelNames, encoded):
+            try:
+                cached = ((levelNames, encoded), (base64.b64decode(levelNames.encode("ascii")).decode("UTF8") if encoded else levelNames).split("|"))
+            except ValueError as e:
+                Domoticz.Error(F"{e} decoding level names {levelNames}")
+                return []
+            self.levelNamesCache[key] = cached
+        return cached[1]
+
+    # Send a device status to a phone number (device name/value @dd/mm hh:mm)
+    def sendStatus(self, number, deviceName, dataValue, lastUpdate):
+        message = deviceName + F" is {dataValue} @{lastUpdate[8:10]}/{lastUpdate[5:7]} {lastUpdate[11:16]}"
+        jsonAnswer = {}
+        jsonAnswer['number'] = str(number)
+        # Limit long message to 200 chars
+        jsonAnswer['message'] = message[:200]
+        answerMessage = json.dumps(jsonAnswer, ensure_ascii=False)
+        Domoticz.Log(F"Show result: >{replaceCrLf(answerMessage)}<")
+        self.mqttClient.Publish(self.smsServerSendTopic, answerMessage)
+        # Load response
+        responseDevice = self.getDevice('response')
+        responseDevice.Update(nValue=0, sValue=message)
+
+    # Forget cached status of a device changed on a Domoticz out topic
+    def invalidateStatus(self, idx, topic):
+        for key in [key for key in set(self.statusCache) | set(self.statusLookups) if key[1] == str(idx)]:
+            controller = getValue(self.controllers, key[0], None)
+            if controller == None or topic == controller['outTopic']:
+                self.forgetStatus(key)
+
+    # Forget cached status of a device (controller, idx), and don't cache status being looked up
+    def forgetStatus(self, key):
+        self.statusCache.pop(key, None)
+        if key in self.statusLookups:
+            self.changedDuringLookup.add(key)
+
+    # Use a one second heartbeat while waiting for a confirmation or a MQTT reconnection, or when a scheduled command is due soon
+    def updateHeartbeat(self):
+        nextDue = self.scheduler.nextDue() if self.scheduler != None else None
+        if self.pendingConfirmation or self.statusLookupDeadline or (self.mqttClient != None and not self.mqttClient.isConnected) \
+                or (nextDue != None and nextDue < time.time() + self.heartbeatDelay):
+            delay = 1
+        else:
+            delay = self.heartbeatDelay
+        if delay != self.currentHeartbeat:
+            self.currentHeartbeat = delay
+            Domoticz.Heartbeat(delay)
+
     def onMQTTSubscribed(self):
         # Exit if init not properly done
         if not self.initDone:
@@ -675,6 +1149,11 @@ class BasePlugin:
         Domoticz.Debug("onMQTTSubscribed")
         topics = set()
 
+    def onStop(self):
+        # Save scheduled commands changed since last heartbeat
+        if self.scheduler != None:
+            self.scheduler.saveIfChanged()
+
     def onCommand(self, Unit, Command, Level, sColor):
         # Exit if init not properly done
         if not self.initDone:
@@ -708,12 +1187,45 @@ class BasePlugin:
         if self.debugging == "Verbose+":
             Domoticz.Debug("Heartbeating...")
 
-        # Reconnect if connection has dropped
-        if self.mqttClient.mqttConn is None or (not self.mqttClient.mqttConn.Connecting() and not self.mqttClient.mqttConn.Connected() or not self.mqttClient.isConnected):
+        # Reload tables if one of their files changed (unchanged files are not checked again)
+        if self.analyzer.tablesChanged():
+            self.reloadTables()
+
+        # Send status of unconfirmed device change when timeout is reached
+        if self.pendingConfirmation and time.time() >= self.pendingConfirmation['deadline']:
+            Domoticz.Log(F"No change seen on idx {self.pendingConfirmation['idx']} after {self.confirmationTimeout} seconds")
+            self.sendDeviceStatus()
+
+        # Give up device status lookup when timeout is reached (asking it again through HTTP if MQTT was used)
+        if self.statusLookupDeadline and time.time() >= self.statusLookupDeadline:
+            if self.statusLookupMqtt:
+                Domoticz.Log(F"No status received through MQTT after {self.mqttStatusTimeout} seconds, using HTTP")
+                self.startStatusLookup(False)
+            else:
+                Domoticz.Log(F"No status received after {self.statusLookupTimeout} seconds")
+                self.httpClient.Close()
+                self.receiveDeviceStatus(None)
+
+        # Save scheduled commands changed since last heartbeat
+        self.scheduler.saveIfChanged()
+
+        # Reconnect if connection has dropped, as soon as reconnection delay is reached
+        if self.mqttClient.mqttConn is None or not self.mqttClient.mqttConn.Connected() or not self.mqttClient.isConnected:
             Domoticz.Debug("Reconnecting MQTT")
-            self.mqttClient.Open()
-        else:
-            self.mqttClient.Ping()
+            self.mqttClient.checkReconnect()
+            self.updateHeartbeat()
+            return
+
+        # Execute scheduled commands when due (including those missed while stopped)
+        self.executeDueJob()
+        self.scheduler.saveIfChanged()
+        self.updateHeartbeat()
+
+        # Ping MQTT server only at normal heartbeat rate
+        if time.time() < self.nextMqttCheck:
+            return
+        self.nextMqttCheck = time.time() + self.heartbeatDelay - 1
+        self.mqttClient.Ping()
 
 global _plugin
 _plugin = BasePlugin()
@@ -722,6 +1234,10 @@ def onStart():
     global _plugin
     _plugin.onStart()
 
+def onStop():
+    global _plugin
+    _plugin.onStop()
+
 def onConnect(Connection, Status, Description):
     global _plugin
     _plugin.onConnect(Connection, Status, Description)
@@ -803,3 +1319,49 @@ def DumpHTTPResponseToLog(httpResp, level=0):
 def replaceCrLf(message):
     return str(message).replace("\r","\\r").replace("\n","\\n")
 
+
+# Convert device info sent by Domoticz on MQTT out topic to HTTP API device format (Data, SwitchType, LevelInt, LevelNames, LastUpdate)
+#   Data is On/Off (or level) for switches, else sValues separated by ";" (without unit)
+def mqttDeviceStatus(payload):
+    switchType = getValue(payload, 'switchType', "")
+    device = {'SwitchType': switchType, 'LevelNames': getValue(payload, 'LevelNames', ""), \
+        'LastUpdate': getValue(payload, 'LastUpdate', "????-??-?? ??:??:??")}
+    sValues = [str(payload[key]) for key in sorted(payload) if key.startswith("svalue") and str(payload[key]) != ""]
+    if switchType == "Selector":
+        device['LevelInt'] = sValues[0] if sValues else ""
+        device['Data'] = sValues[0] if sValues else "not known"
+    elif switchType:
+        nValue = getValue(payload, 'nvalue', 0)
+        device['Data'] = "Off" if nValue == 0 else "On" if nValue == 1 or not sValues else sValues[0]
+    else:
+        device['Data'] = ";".join(sValues) if sValues else str(getValue(payload, 'nvalue', "not known"))
+    return device
+
+# Split delay ("in 2h30", "in 45min") or time ("at 18:00", "at 7h") at end of a message, returning message without it and due time (None if not given)
+def splitSchedule(message, delayWords, timeWords, analyzer):
+    words = message.split()
+    if len(words) < 3:
+        return message, None
+    keyword = analyzer.convertUserData(words[-2]).lower()
+    value = words[-1].lower()
+    dueTime = None
+    if keyword in [analyzer.convertUserData(word).lower() for word in delayWords]:
+        match = re.match(r"^(?:(\d+)h(\d{2})?|(\d+)(?:min|mn|m))$", value)
+        if match:
+            hours, minutes, onlyMinutes = match.groups()
+            dueTime = time.time() + (int(hours) * 3600 + int(minutes or 0) * 60 if hours else int(onlyMinutes) * 60)
+    elif keyword in [analyzer.convertUserData(word).lower() for word in timeWords]:
+        match = re.match(r"^(\d{1,2})[:h](\d{2})?$", value)
+        if match and int(match.group(1)) < 24 and int(match.group(2) or 0) < 60:
+            due = datetime.now().replace(hour=int(match.group(1)), minute=int(match.group(2) or 0), second=0, microsecond=0)
+            # Time already passed today is for tomorrow
+            if due <= datetime.now():
+                due += timedelta(days=1)
+            dueTime = due.timestamp()
+    if dueTime == None:
+        return message, None
+    return " ".join(words[:-2]), dueTime
+
+# Format a due time for SMS answers
+def formatTime(dueTime):
+    return datetime.fromtimestamp(dueTime).strftime("%d/%m %H:%M")
@@ -0,0 +1,12 @@
+# Test configuration: make modules of repository root importable, and replace Domoticz module (only given to plug-ins by Domoticz)
+import os
+import sys
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if "Domoticz" not in sys.modules:
+    domoticz = types.ModuleType("Domoticz")
+    for name in ["Log", "Error", "Debug", "Status", "Heartbeat", "Debugging"]:
+        setattr(domoticz, name, lambda *args, **kwargs: None)
+    sys.modules["Domoticz"] = domoticz
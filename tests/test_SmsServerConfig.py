@@ -0,0 +1,67 @@
+# Regression tests of FF_SmsServerConfig.py helpers
+import os
+import pytest
+from FF_analyzeCommand import FF_analyzeCommand
+
+# Load functions of FF_SmsServerConfig.py, without running its main code
+@pytest.fixture(scope="module")
+def script():
+    fileName = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "FF_SmsServerConfig.py")
+    with open(fileName, encoding="UTF-8") as stream:
+        source = stream.read()
+    namespace = {}
+    exec(compile(source[:source.index("#   *** Main code ***")], fileName, "exec"), namespace)
+    return namespace
+
+# Names are compared as analyzer splits them, ignored words and elisions being removed
+def testAmbiguousNames(script, capsys):
+    allow = {"allow": ["cdeOn", "cdeOff"]}
+    devices = {"lampe de la cuisine": allow, "lampe cuisine": allow, "salle d'eau": allow, "salle eau chaude": allow, "porte garage": allow}
+    script["checkAmbiguousNames"](devices, ["de", "la", "d'", "l'"], FF_analyzeCommand())
+    assert capsys.readouterr().out.splitlines() == [
+        "\"lampe cuisine\" is hidden by \"lampe de la cuisine\" for ['cdeOn', 'cdeOff']",
+        "\"lampe de la cuisine\" is hidden by \"lampe cuisine\" for ['cdeOn', 'cdeOff']",
+        "\"salle d'eau\" is hidden by \"salle eau chaude\" for ['cdeOn', 'cdeOff']"]
+
+# RegEx items match start of names ignoring case, combined or not, all matching items being returned in list order
+def testRegExList(script):
+    regExList = ["Test.*", "^Zwave", ".*lamp$", "(Kitchen) \\1", "(?s)Hall.Light", "(?i:door)"]
+    compiledRegEx = script["compileRegExList"](regExList)
+    assert compiledRegEx[0] != None and [ptr for (ptr, regEx) in compiledRegEx[1]] == [3, 4]
+    for (name, expected) in [("test lamp", ["Test.*", ".*lamp$"]), ("zwave 1", ["^Zwave"]), ("ZWAVE", ["^Zwave"]), ("my Zwave", []), \
+            ("kitchen KITCHEN", ["(Kitchen) \\1"]), ("hall\nlight", ["(?s)Hall.Light"]), ("DOOR lamp", [".*lamp$", "(?i:door)"])]:
+        assert script["checkRegExIn"](name, compiledRegEx, regExList) == expected
+
+# Return a device entry
+def entry(index, category = "On/Off"):
+    return {"index": index, "category": category, "allow": ["cdeShow", "cdeOn", "cdeOff"]}
+
+# Domoticz changes since previous run are applied by idx, hand-made changes being kept
+def testMergeDevices(script, capsys):
+    lastRunDevices = {str(index): {"name": name, "entry": entry(index)} \
+        for (index, name) in [(1, "lampe cuisine"), (2, "lampe salon"), (3, "volet"), (4, "porte"), (5, "garage")]}
+    existingDevices = {"lampe cuisine": entry(1), "lampe salon": entry(2), "volet": entry(3), "porte d'entrée": entry(4), \
+        "garage": dict(entry(5), allow=["cdeShow"]), "alarme": entry(20)}
+    generatedDevices = {"lampe cuisine": entry(1, "Dimmer"), "lampe séjour": entry(2), "porte": entry(4, "Dimmer"), \
+        "garage": entry(5, "Dimmer"), "prise": entry(6)}
+    mergedDevices = script["mergeDevices"](generatedDevices, existingDevices, lastRunDevices)
+    assert mergedDevices == {
+        "lampe cuisine": entry(1, "Dimmer"),                # Updated
+        "lampe séjour": entry(2),                           # Renamed
+        "porte d'entrée": entry(4, "Dimmer"),               # Renamed by hand, name kept
+        "garage": dict(entry(5), allow=["cdeShow"]),        # Changed by hand, entry kept
+        "alarme": entry(20),                                # Added by hand
+        "prise": entry(6)}                                  # Added
+    assert capsys.readouterr().out.splitlines() == [
+        "Updating device lampe cuisine (idx 1)",
+        "Renaming device lampe salon to lampe séjour (idx 2)",
+        "Removing device volet (idx 3)",
+        "Updating device porte d'entrée (idx 4)",
+        "Adding device prise (idx 6)"]
+
+# Unchanged devices give same devices, in same order
+def testMergeDevicesUnchanged(script, capsys):
+    devices = {"lampe cuisine": entry(1), "volet": entry(3)}
+    lastRunDevices = {script["deviceKey"](deviceEntry): {"name": name, "entry": deviceEntry} for (name, deviceEntry) in devices.items()}
+    mergedDevices = script["mergeDevices"](dict(devices), dict(devices), lastRunDevices)
+    assert list(mergedDevices.items()) == list(devices.items()) and capsys.readouterr().out == ""
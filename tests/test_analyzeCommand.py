@@ -0,0 +1,250 @@
+# Regression tests of FF_analyzeCommand, using smsTables.json and corpus.json of this folder
+import json
+import os
+import pytest
+from FF_analyzeCommand import FF_analyzeCommand, ValueValidator
+
+testFolder = os.path.dirname(os.path.abspath(__file__))
+
+with open(os.path.join(testFolder, "corpus.json"), encoding="UTF-8") as corpusStream:
+    corpus = json.load(corpusStream)
+
+@pytest.fixture(scope="module")
+def analyzer():
+    analyzer = FF_analyzeCommand()
+    errorText, messages = analyzer.loadData(os.path.join(testFolder, "smsTables.json"))
+    assert errorText == "", messages
+    return analyzer
+
+# Corpus commands give expected results (same checks as checkJsonFiles.py batch mode)
+@pytest.mark.parametrize("test", corpus, ids=[test["message"] for test in corpus])
+def testCorpus(analyzer, test):
+    errorText, messages = analyzer.analyzeCommand(test["message"])
+    results = {"command": analyzer.command, "device": analyzer.deviceName, \
+        "value": None if analyzer.valueToSet == None else str(analyzer.valueToSet), "error": errorText}
+    assert {key: results[key] for key in results.keys() & test.keys()} == {key: test[key] for key in results.keys() & test.keys()}
+
+# Each abbreviation selects its device, alone or followed by a value
+def testAbbreviations(analyzer):
+    for (commandValue, command) in [("cdeOn", "allume"), ("cdeSet", "règle")]:
+        for (abbreviation, deviceName) in analyzer.deviceAbbreviations[commandValue][1].items():
+            errorText, messages = analyzer.analyzeCommand(F"{command} {abbreviation}")
+            assert analyzer.deviceName == deviceName, messages
+    for (abbreviation, value) in analyzer.mappingAbbreviations["chauffage"][1].items():
+        errorText, messages = analyzer.analyzeCommand(F"règle chauffage {abbreviation}")
+        assert (errorText, analyzer.valueToSetOriginal) == ("", value)
+
+# Items are split into words as messages are, elisions and punctuation being removed
+def testItemWords(analyzer):
+    assert analyzer.itemWords("salle d'eau") == ["salle", "eau"]
+    assert analyzer.itemWords("porte l'entrée") == ["porte", "entree"]
+    assert analyzer.tokenize("allume, la porte de l’entrée !")[0] == ["allume", "porte", "entree"]
+
+# Bounds are converted to value type (level defaulting to 0-100), list values are normalized and mapping values indexed by word prefixes
+def testValueValidator(analyzer):
+    level = ValueValidator(analyzer, {"setType": "level", "mapping": {"hors gel": 10, "haut": 20, "confort": 30}})
+    assert (level.convert, level.minValue, level.maxValue, level.setBy) == (int, 0, 100, "plugIn")
+    assert level.mappingIndex[0]["h"] == {"hors gel", "haut"} and level.mappingIndex[1]["gel"] == {"hors gel"}
+    setPoint = ValueValidator(analyzer, {"setType": "setPoint", "minValue": 5, "maxValue": "30", "setBy": "user"})
+    assert (setPoint.convert, setPoint.minValue, setPoint.maxValue, setPoint.setBy) == (float, 5.0, 30.0, "user")
+    assert type(setPoint.minValue) == float
+    text = ValueValidator(analyzer, {"setType": "string", "list": ["Élevé", "Bas"]})
+    assert (text.convert, text.minValue, text.maxValue, text.listValues) == (None, None, None, {"eleve", "bas"})
+    # Only mapping value starting with all given words is found
+    assert [level.findMapping(words) for words in [["ho"], ["h"], ["h", "g"], ["co"], ["h", "g", "x"], ["x"]]] == \
+        ["hors gel", None, "hors gel", "confort", "hors gel", None]
+
+# Values are checked against list (ignoring case and accents), converted and checked against bounds, giving analyzer value and setter
+@pytest.mark.parametrize("deviceItem, message, value, error", [
+    ({"setType": "string", "list": ["Élevé", "Bas"]}, "ELEVE", "ELEVE", ""),
+    ({"setType": "string", "list": ["Élevé", "Bas"]}, "haut", "haut", "Given value (haut) should be one of ['Élevé', 'Bas']"),
+    ({"setType": "integer", "minValue": 1}, "7", "7", ""),
+    ({"setType": "integer", "minValue": 1}, "0", "0", "Given value (0) should not be less than 1"),
+    ({"setType": "integer"}, "7.5", "7.5", "(7.5) is not a valid number"),
+    ({"setType": "float", "maxValue": 2}, "1.5", "1.5", ""),
+    ({"setType": "level"}, "101", "101", "Given value (101) should not be greater than 100"),
+    ({"setType": "level", "mapping": {"hors gel": 10, "confort": 20}}, "hors g", 10, ""),
+    ({"setType": "level", "mapping": {"hors gel": 10, "confort": 20}}, "confort plus", 20, "Can't understand ['plus'] after 20"),
+    ({"setType": "level", "mapping": {"hors gel": 10, "confort": 20}, "minValue": 15}, "hors gel", 10, \
+        "Given value (10) should not be less than 15"),
+])
+def testValueValidatorCheck(deviceItem, message, value, error):
+    analyzer = FF_analyzeCommand()
+    validator = ValueValidator(analyzer, dict(deviceItem, setBy="user"))
+    (normalizedKeywords, keywords, positions) = analyzer.tokenize(message)
+    validator.check(analyzer, keywords, normalizedKeywords, 0, message)
+    assert (analyzer.valueToSet, analyzer.valueToSetType, analyzer.firstErrorMessage) == (value, deviceItem["setType"], error)
+    assert analyzer.setBy == (None if error else "user")
+
+# Analyzer checking devices one by one against command values of tables of this folder, as FF_SmsServerConfig.py does
+@pytest.fixture
+def deviceChecker():
+    with open(os.path.join(testFolder, "smsTables.json"), encoding="UTF-8") as stream:
+        tables = json.load(stream)
+    deviceChecker = FF_analyzeCommand()
+    deviceChecker.checkFile = "smsTables.json"
+    deviceChecker.checkPhase = "checking devices"
+    deviceChecker.commandValuesDict = tables["commandValues"]
+    return deviceChecker
+
+# Each device is checked alone, giving first error found (or none)
+@pytest.mark.parametrize("deviceItem, error", [
+    ({"index": 1, "category": "On/Off", "allow": ["cdeOn", "cdeOff"]}, ""),
+    ({"index": "1", "category": "On/Off", "allow": ["cdeOn"], "controller": "garage"}, ""),
+    ({"index": 9, "category": "Selector", "allow": ["cdeSet"], "setType": "level", "mapping": {"off": 0, "on": 10}, "setBy": "user"}, ""),
+    ({"index": 10, "category": "Setpoint", "allow": ["cdeSet"], "setType": "setPoint", "minValue": 5, "maxValue": 30.5}, ""),
+    ({"index": 11, "category": "Counter", "allow": ["cdeSet"], "setType": "integer", "list": [10, 20]}, ""),
+    ({"index": 8, "category": "Text", "allow": ["cdeOn"], "unknown": 1}, ""),
+    ([1, "On/Off"], "deviceItem type ([1, 'On/Off']) is list, should be dict"),
+    ({"index": "", "category": "On/Off", "allow": ["cdeOn"]}, "device index"),
+    ({"index": 0, "category": "On/Off", "allow": ["cdeOn"]}, "device index"),
+    ({"index": 1.5, "category": "On/Off", "allow": ["cdeOn"]}, "device index (1.5) is float"),
+    ({"index": 1, "category": "On/Off", "allow": ["cdeOn"], "controller": 2}, "device controller (2) is int"),
+    ({"index": 1, "category": 3, "allow": ["cdeOn"]}, "device category (3) is int"),
+    ({"index": 1, "category": "On/Off", "allow": {"cdeOn": 1}}, "device allowed commands"),
+    ({"index": 1, "category": "Dimmer", "allow": ["cdeSet"]}, "setType type (None) is NoneType"),
+    ({"index": 1, "category": "Dimmer", "allow": ["cdeSet"], "setType": "color"}, "setType"),
+    ({"index": 9, "category": "Selector", "allow": ["cdeSet"], "setType": "level", "mapping": {"off": "0"}}, "mapping value type (0) is str"),
+    ({"index": 9, "category": "Selector", "allow": ["cdeSet"], "setType": "level", "mapping": ["off"]}, "deviceMap type"),
+    ({"index": 10, "category": "Setpoint", "allow": ["cdeSet"], "setType": "setPoint", "minValue": "5"}, "minValue type (5) is str"),
+    ({"index": 10, "category": "Setpoint", "allow": ["cdeSet"], "setType": "setPoint", "maxValue": "30"}, "maxValue type (30) is str"),
+    ({"index": 10, "category": "Setpoint", "allow": ["cdeSet"], "setType": "setPoint", "minValue": 30, "maxValue": 5}, \
+        "minValue (30) should be less or equal to maxValue (5)"),
+    ({"index": 12, "category": "Dimmer", "allow": ["cdeSet"], "setType": "level", "minValue": 150}, \
+        "minValue (150) should be less or equal to maxValue (100)"),
+    ({"index": 11, "category": "Counter", "allow": ["cdeSet"], "setType": "integer", "list": "10"}, "list type (10) is str"),
+    ({"index": 11, "category": "Counter", "allow": ["cdeSet"], "setType": "integer", "list": [10, "20"]}, "list value type (20) is str"),
+    ({"index": 9, "category": "Selector", "allow": ["cdeSet"], "setType": "level", "setBy": "admin"}, "setBy"),
+    ({"index": 9, "category": "Selector", "allow": ["cdeSet"], "setType": "level", "colour": "red"}, "Can't understand colour in"),
+])
+def testCheckDevice(deviceChecker, deviceItem, error):
+    deviceChecker.checkDevice("device", deviceItem)
+    assert deviceChecker.errorSeen == (error != "")
+    assert error in deviceChecker.firstErrorMessage
+
+# Errors of all devices are kept, first one being given as short message
+def testCheckDevices(deviceChecker):
+    deviceChecker.checkDevice("lampe", {"index": 1, "category": "On/Off", "allow": ["cdeOn"]})
+    deviceChecker.checkDevice("volet", {"index": 0, "category": "On/Off", "allow": ["cdeOn"]})
+    deviceChecker.checkDevice("store", {"index": 12, "category": "Dimmer", "allow": ["cdeSet"], "setType": "level", "setBy": "admin"})
+    assert deviceChecker.firstErrorMessage.startswith("Error analyzing smsTables.json, when checking devices: device index")
+    assert "device index" in deviceChecker.allMessages and "setBy" in deviceChecker.allMessages
+
+# Write a tables file, returning its name
+def writeTables(folder, name, data):
+    fileName = os.path.join(folder, name)
+    with open(fileName, "wt", encoding="UTF-8") as stream:
+        json.dump(data, stream, ensure_ascii=False)
+    return fileName
+
+# Tables of this folder, split into a main file (without devices) and two included files of devices (sharing one), returning main file name and devices
+def splitTables(folder, include=["floor1.json", "floor2.json"]):
+    with open(os.path.join(testFolder, "smsTables.json"), encoding="UTF-8") as stream:
+        tables = json.load(stream)
+    devices = list(tables["devices"].items())
+    mainFile = writeTables(folder, "main.json", dict(tables, devices={}, include=include))
+    writeTables(folder, "floor1.json", {"devices": dict(devices[:6])})
+    writeTables(folder, "floor2.json", {"devices": dict(devices[5:])})
+    return mainFile, devices
+
+# Included files are merged (first definition kept), and compiled parts of unchanged files reused
+def testIncludes(tmp_path):
+    mainFile, devices = splitTables(tmp_path)
+    analyzer = FF_analyzeCommand()
+    errorText, messages = analyzer.loadData(mainFile)
+    assert errorText == ""
+    assert F"{devices[5][0]}< of {os.path.join(tmp_path, 'floor2.json')} ignored" in messages
+    assert list(analyzer.devicesDict) == [name for (name, item) in devices]
+    assert sorted(analyzer.valueValidators) == ["chauffage", "message", "store", "thermostat salon", "volume"]
+    assert analyzer.analyzeCommand("règle chauffage hors gel") == ("", "") and analyzer.valueToSet == 10
+    # Change second file only
+    compiled = {name: FF_analyzeCommand.tablesFileCache[("check", os.path.join(tmp_path, name))][1][2] for name in ["floor1.json", "floor2.json"]}
+    writeTables(tmp_path, "floor2.json", {"devices": dict(devices[6:], **{"cave": {"index": 20, "category": "On/Off", "allow": ["cdeOn"]}})})
+    assert analyzer.tablesChanged()
+    analyzer = FF_analyzeCommand()
+    assert analyzer.loadData(mainFile)[0] == ""
+    assert FF_analyzeCommand.tablesFileCache[("check", os.path.join(tmp_path, "floor1.json"))][1][2] is compiled["floor1.json"]
+    assert FF_analyzeCommand.tablesFileCache[("check", os.path.join(tmp_path, "floor2.json"))][1][2] is not compiled["floor2.json"]
+    assert analyzer.analyzeCommand("allume cave") == ("", "") and analyzer.deviceId == 20
+
+# Load results are cached by content hash, a file rewritten with same content being not decoded again
+def testTablesFileCache(tmp_path):
+    mainFile, devices = splitTables(tmp_path)
+    assert FF_analyzeCommand().loadData(mainFile)[0] == ""
+    fileName = os.path.join(tmp_path, "floor1.json")
+    (contentHash, loaded) = FF_analyzeCommand.tablesFileCache[("load", fileName)]
+    writeTables(tmp_path, "floor1.json", {"devices": dict(devices[:6])})
+    assert FF_analyzeCommand().loadData(mainFile)[0] == ""
+    assert FF_analyzeCommand.tablesFileCache[("load", fileName)] == (contentHash, loaded)
+    assert FF_analyzeCommand.tablesFileCache[("load", fileName)][1] is loaded
+    writeTables(tmp_path, "floor1.json", {"devices": dict(devices[:5])})
+    assert FF_analyzeCommand().loadData(mainFile)[0] == ""
+    assert FF_analyzeCommand.tablesFileCache[("load", fileName)][0] != contentHash
+
+# A missing, invalid or including file stops the load, errors of all files being reported
+@pytest.mark.parametrize("include, files, errors", [
+    (["floor1.json", "floor2.json", "missing.json"], {}, ["missing.json"]),
+    (["floor1.json", "floor2.json", "bad.json"], {"bad.json": {"devices": {"cave": {"index": "", "category": "On/Off", "allow": ["cdeOn"]}}}}, ["bad.json"]),
+    (["floor1.json", "floor2.json", "bad.json"], {"bad.json": {"grammar": []}, "floor2.json": {"device": {}}}, \
+        ["section grammar in", "section device in"]),
+    (["floor1.json", "floor2.json", "nested.json"], {"nested.json": {"include": ["floor1.json"]}}, ["Can't include other files in"]),
+    (["floor1.json", 3], {}, ["include item type (3) is int"]),
+])
+def testIncludeErrors(tmp_path, include, files, errors):
+    mainFile, devices = splitTables(tmp_path, include)
+    for (name, data) in files.items():
+        writeTables(tmp_path, name, data)
+    analyzer = FF_analyzeCommand()
+    errorText, messages = analyzer.loadData(mainFile)
+    assert errorText == F"Error detected, please check {mainFile} file!"
+    for error in errors:
+        assert error in messages
+    assert analyzer.devicesDict == {} and analyzer.grammars == []
+
+# Analyzer using tables of this folder, with command first and device first grammars (with particles)
+@pytest.fixture(scope="module")
+def grammarAnalyzer(tmp_path_factory):
+    with open(os.path.join(testFolder, "smsTables.json"), encoding="UTF-8") as stream:
+        tables = json.load(stream)
+    tables["grammars"] = [["command", "device", "value"], ["device", "command", ["en"], "value"], ["device", ["puis"], "command", "value"]]
+    analyzer = FF_analyzeCommand()
+    errorText, messages = analyzer.loadData(writeTables(tmp_path_factory.mktemp("grammars"), "smsTables.json", tables))
+    assert errorText == "", messages
+    return analyzer
+
+# Grammars giving items in same order are merged, particles of each state being merged
+def testCompileGrammars(grammarAnalyzer):
+    assert [[slot for (slot, particles, completeMatch) in grammar] for grammar in grammarAnalyzer.grammars] == \
+        [["command", "device", "value"], ["device", "command", "value"]]
+    assert grammarAnalyzer.grammars[1] == [("device", set(), True), ("command", {"puis"}, False), ("value", {"en"}, False)]
+
+# Messages are parsed with grammar starting with item given by first keyword, particles being optional
+@pytest.mark.parametrize("message, command, device, value", [
+    ("allume lampe chambre", "allume", "lampe chambre", None),
+    ("lampe chambre allume", "allume", "lampe chambre", None),
+    ("l ch allume", "allume", "lampe chambre", None),
+    ("porte garage puis ferme", "ferme", "porte garage", None),
+    ("chauffage règle en confort", "règle", "chauffage", 20),
+    ("chauffage règle confort", "règle", "chauffage", 20),
+    ("la lampe de la cuisine plafond éteins", "éteins", "lampe cuisine plafond", None),
+    ("thermostat salon règle 21", "règle", "thermostat salon", "21"),
+])
+def testGrammars(grammarAnalyzer, message, command, device, value):
+    assert grammarAnalyzer.analyzeCommand(message)[0] == ""
+    assert (grammarAnalyzer.command, grammarAnalyzer.deviceName, grammarAnalyzer.valueToSet) == (command, device, value)
+
+# Mistyped first keyword is corrected once, to select grammar
+def testGrammarTypo(grammarAnalyzer):
+    errorText, messages = grammarAnalyzer.analyzeCommand("chaufage règle confort")
+    assert (errorText, grammarAnalyzer.deviceName, grammarAnalyzer.valueToSet) == ("", "chauffage", 20)
+    assert messages == "Understood chaufage as chauffage\r\n"
+
+# Errors are the ones of grammar selected by first keyword
+@pytest.mark.parametrize("message, error", [
+    ("lampe chambre zz", "['zz'] is not a known command"),
+    ("allume zz", "['zz'] is not a known device"),
+    ("zz lampe chambre", "['zz', 'lampe', 'chambre'] is not a known command"),
+    ("lampe chambre règle 10", "Can't do command règle on device lampe chambre"),
+])
+def testGrammarErrors(grammarAnalyzer, message, error):
+    assert grammarAnalyzer.analyzeCommand(message)[0].startswith(error)
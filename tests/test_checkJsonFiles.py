@@ -0,0 +1,51 @@
+# Regression tests of checkJsonFiles.py abbreviation report
+import json
+import os
+import shutil
+import subprocess
+import sys
+import pytest
+from FF_analyzeCommand import FF_analyzeCommand
+
+testFolder = os.path.dirname(os.path.abspath(__file__))
+rootFolder = os.path.dirname(testFolder)
+
+# Load functions of checkJsonFiles.py, without running its main code
+@pytest.fixture(scope="module")
+def script():
+    fileName = os.path.join(rootFolder, "checkJsonFiles.py")
+    with open(fileName, encoding="UTF-8") as stream:
+        source = stream.read()
+    namespace = {}
+    exec(compile(source[:source.index("#   *** Main code ***")], fileName, "exec"), namespace)
+    return namespace
+
+# Abbreviations are printed sorted by item, for commands, devices by allowed commandValue and mapping values by device
+def testPrintAbbreviations(script, capsys):
+    analyzer = FF_analyzeCommand()
+    assert analyzer.loadData(os.path.join(testFolder, "smsTables.json"))[0] == ""
+    script["printAbbreviations"](analyzer)
+    report = capsys.readouterr().out
+    assert report.startswith("Commands:\n\taffiche: af\n\tallume: al\n\tdéfinis: d\n\tferme: f\n\touvre: o\n\trègle: r\n\tétat: eta\n\téteins: ete\n")
+    assert "Devices allowing cdeSet:\n\tchauffage: c\n\tmessage: m\n\tstore: s\n\tthermostat salon: t\n\tvolume: v\n" in report
+    assert report.endswith("Values of chauffage:\n\tarrêt: ar\n\tconfort: c\n\thors gel: h\n")
+    # Item being the start of another one has no abbreviation
+    assert report.count("\tlampe cuisine: (none, hidden by another one)\n") == 3
+    assert [line for line in report.splitlines() if not line.startswith("\t")] == ["Commands:", "Devices allowing cdeOn:", \
+        "Devices allowing cdeOff:", "Devices allowing cdeShow:", "Devices allowing cdeSet:", "Values of chauffage:"]
+
+# Report is printed only when tables load without error
+@pytest.mark.parametrize("valid", [True, False])
+def testAbbreviationsOption(tmp_path, valid):
+    for fileName in ["checkJsonFiles.py", "FF_analyzeCommand.py"]:
+        shutil.copy(os.path.join(rootFolder, fileName), tmp_path)
+    with open(os.path.join(testFolder, "smsTables.json"), encoding="UTF-8") as stream:
+        tables = json.load(stream)
+    if not valid:
+        tables["devices"]["volume"]["index"] = 0
+    with open(tmp_path / "smsTables.json", "wt", encoding="UTF-8") as stream:
+        json.dump(tables, stream, ensure_ascii=False)
+    result = subprocess.run([sys.executable, str(tmp_path / "checkJsonFiles.py"), "--abbreviations"], capture_output=True, encoding="UTF-8", timeout=60)
+    assert result.returncode == (0 if valid else 2)
+    assert result.stdout.startswith("LoadData status: " + ("Ok" if valid else "Error detected"))
+    assert ("Commands:\n" in result.stdout) == valid
@@ -0,0 +1,124 @@
+# Regression tests of makeDoc.py, run on a copy in a temporary folder, with tables and device list of tests/makeDoc folder
+import base64
+import http.server
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import pytest
+
+testFolder = os.path.dirname(os.path.abspath(__file__))
+rootFolder = os.path.dirname(testFolder)
+goldenFolder = os.path.join(testFolder, "makeDoc")
+
+# Domoticz devices (idx 50 has no SMS device, SMS device "store" has no Domoticz device)
+devices = [
+    {"idx": "9", "Name": "Chauffage", "Data": "Confort", "Level": 20, "LevelNames": base64.b64encode("Arrêt|Hors gel|Confort".encode("UTF-8")).decode("ascii"), \
+        "LastUpdate": "2026-10-19 08:15:00"},
+    {"idx": "1", "Name": "Lampe cuisine", "Data": "On", "LastUpdate": "2026-10-19 10:00:00"},
+    {"idx": "11", "Name": "Compteur eau", "Data": "120 m3", "Usage": "5 l", "CounterToday": "40 l", "LastUpdate": "2026-10-19 09:30:00"},
+    {"idx": "50", "Name": "Température <salon>", "Data": "20.5 C", "LastUpdate": "2026-10-18 23:59:00"},
+    {"idx": "10", "Name": "Thermostat, salon", "Data": "19.5", "LastUpdate": "2026-10-19 07:00:00"},
+]
+
+# Write makeDoc.py, its modules and tables (with given settings) into a folder, returning makeDoc.py path
+def installMakeDoc(folder, **settings):
+    for fileName in ["makeDoc.py", "FF_analyzeCommand.py", "FF_domoticzApi.py"]:
+        shutil.copy(os.path.join(rootFolder, fileName), folder)
+    with open(os.path.join(testFolder, "smsTables.json"), encoding="UTF-8") as stream:
+        tables = json.load(stream)
+    tables["settings"] = dict(tables["settings"], smsServerPrefix="sms", apiCacheFolder="", **settings)
+    tables["devices"] = {name: item for (name, item) in tables["devices"].items() if item["index"] in [1, 9, 10, 11, 12]}
+    with open(os.path.join(folder, "smsTables.json"), "wt", encoding="UTF-8") as stream:
+        json.dump(tables, stream, ensure_ascii=False)
+    with open(os.path.join(folder, "DeviceList.json"), "wt", encoding="UTF-8") as stream:
+        json.dump({"status": "OK", "result": devices, "ActTime": 1000}, stream, ensure_ascii=False)
+    return os.path.join(folder, "makeDoc.py")
+
+# Run makeDoc.py, returning its result
+def runMakeDoc(fileName, *args):
+    return subprocess.run([sys.executable, fileName] + list(args), capture_output=True, encoding="UTF-8", timeout=60)
+
+# Return content of a golden file (written with universal newlines, as read from makeDoc output)
+def golden(name):
+    with open(os.path.join(goldenFolder, name), encoding="UTF-8", newline="") as stream:
+        return stream.read()
+
+# Each format gives expected output, SMS devices not found being reported (on error output for machine-readable formats)
+@pytest.mark.parametrize("docFormat, docSort, expected", [
+    ("text", True, "sorted.txt"),
+    ("text", False, "unsorted.txt"),
+    ("jsonl", True, "sorted.jsonl"),
+    ("csv", True, "sorted.csv"),
+    ("html", True, "sorted.html"),
+])
+def testFormats(tmp_path, docFormat, docSort, expected):
+    result = runMakeDoc(installMakeDoc(tmp_path, docFormat=docFormat, docSort=docSort), "DeviceList.json")
+    assert result.returncode == 0, result.stdout + result.stderr
+    missing = "SMS device store (idx 12 on 127.0.0.1) not found in Domoticz device list\n"
+    if docFormat == "text":
+        assert result.stdout == golden(expected) + missing
+    else:
+        assert (result.stdout, result.stderr) == (golden(expected), missing)
+
+# Output written into docFile is the same, missing devices being reported on terminal
+def testDocFile(tmp_path):
+    result = runMakeDoc(installMakeDoc(tmp_path, docFormat="csv", docFile="doc.csv"), "DeviceList.json")
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert result.stdout == "SMS device store (idx 12 on 127.0.0.1) not found in Domoticz device list\n"
+    with open(tmp_path / "doc.csv", encoding="UTF-8") as stream:
+        assert stream.read() == golden("sorted.csv")
+
+# Watch mode is refused with device list files, before writing anything
+def testWatchDeviceListFiles(tmp_path):
+    result = runMakeDoc(installMakeDoc(tmp_path, docWatch=1, docFile="doc.txt"), "DeviceList.json")
+    assert (result.returncode, result.stdout) == (2, "Watch mode needs Domoticz, can't be used with device list files\n")
+    assert not (tmp_path / "doc.txt").exists()
+
+# Domoticz server giving all devices, then only devices changed since given lastupdate
+class DomoticzHandler(http.server.BaseHTTPRequestHandler):
+    lastUpdates = []
+
+    def do_GET(self):
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        if query.get("param") == ["getversion"]:
+            answer = {"status": "OK", "version": "2024.7"}
+        elif "lastupdate" in query:
+            DomoticzHandler.lastUpdates.append(query["lastupdate"][0])
+            # Only first poll gives a change
+            changed = [dict(devices[1], Data="Off", LastUpdate="2026-10-19 10:05:00")] if len(DomoticzHandler.lastUpdates) == 1 else []
+            answer = {"status": "OK", "result": changed, "ActTime": 1000 + len(DomoticzHandler.lastUpdates)}
+        else:
+            answer = {"status": "OK", "result": devices, "ActTime": 1000}
+        data = json.dumps(answer).encode("UTF-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+# Watch mode asks devices changed since previous poll, and rewrites docFile with changed records
+def testWatch(tmp_path, monkeypatch):
+    monkeypatch.setattr(DomoticzHandler, "lastUpdates", [])
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), DomoticzHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    process = subprocess.Popen([sys.executable, installMakeDoc(tmp_path, docWatch=0.2, docFile="doc.txt", \
+        domoticzUrl=F"http://127.0.0.1:{server.server_address[1]}/")], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        deadline = time.time() + 30
+        while len(DomoticzHandler.lastUpdates) < 3 and time.time() < deadline and process.poll() == None:
+            time.sleep(0.1)
+    finally:
+        process.kill()
+        process.communicate()
+        server.shutdown()
+    assert DomoticzHandler.lastUpdates[:3] == ["1000", "1001", "1002"]
+    with open(tmp_path / "doc.txt", encoding="UTF-8") as stream:
+        assert stream.read() == golden("sorted.txt").replace("Lampe cuisine = On (19 10:00)", "Lampe cuisine = Off (19 10:05)")
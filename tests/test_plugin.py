@@ -0,0 +1,504 @@
+# Regression tests of plug-in logic
+import base64
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+import pytest
+import plugin
+from FF_analyzeCommand import FF_analyzeCommand
+
+analyzer = FF_analyzeCommand()
+testFolder = os.path.dirname(os.path.abspath(__file__))
+
+# Connected MQTT connection
+class FakeMqttConnection:
+    def Connected(self):
+        return True
+
+# MQTT client keeping published messages
+class FakeMqttClient:
+    isConnected = True
+
+    def __init__(self):
+        self.mqttConn = FakeMqttConnection()
+        self.published = []
+
+    def Publish(self, topic, message):
+        self.published.append((topic, message))
+
+    def Ping(self):
+        pass
+
+# HTTP client keeping requested device ids, and controllers (address, username) they were asked to
+class FakeHttpClient:
+    Address = ""
+    hostUsername = ""
+
+    def __init__(self):
+        self.requests = []
+        self.controllers = []
+
+    def Open(self):
+        self.requests.append(self.deviceId)
+        self.controllers.append((self.Address, self.hostUsername))
+
+    def Close(self):
+        pass
+
+# Plug-in with one controller, fake clients and no pending state
+@pytest.fixture
+def basePlugin(tmp_path):
+    basePlugin = plugin.BasePlugin()
+    basePlugin.controllers = {"main": {'address': "127.0.0.1", 'port': "8080", 'username': "", 'password': "", 'https': False, \
+        'inTopic': "domoticz/in", 'outTopic': "domoticz/out", 'version': "2024.7"}}
+    basePlugin.defaultController = "main"
+    basePlugin.mqttClient = FakeMqttClient()
+    basePlugin.httpClient = FakeHttpClient()
+    basePlugin.smsServerSendTopic = "sms/send"
+    basePlugin.statusCache = {}
+    basePlugin.statusLookups = {}
+    basePlugin.changedDuringLookup = set()
+    basePlugin.levelNamesCache = {}
+    basePlugin.scheduler = plugin.JobScheduler(str(tmp_path / "jobs.json"))
+    basePlugin.initDone = True
+    return basePlugin
+
+# Domoticz device keeping its last value
+class FakeDevice:
+    def __init__(self, deviceId):
+        self.DeviceID = deviceId
+        self.sValue = ""
+
+    def Update(self, nValue, sValue):
+        self.sValue = sValue
+
+# Plug-in devices
+@pytest.fixture
+def devices(monkeypatch):
+    devices = {unit: FakeDevice(deviceId) for (unit, deviceId) in enumerate(["request", "response", "userRequest"], 1)}
+    monkeypatch.setattr(plugin, "Devices", devices, raising=False)
+    return devices
+
+# Return an analyzer loaded with tables of tests folder, some devices being changed ({device name: {item: value}})
+def makeAnalyzer(folder, deviceChanges):
+    with open(os.path.join(testFolder, "smsTables.json"), encoding="UTF-8") as stream:
+        tables = json.load(stream)
+    for (deviceName, changes) in deviceChanges.items():
+        tables["devices"][deviceName].update(changes)
+    fileName = str(folder / "smsTables.json")
+    with open(fileName, "wt", encoding="UTF-8") as stream:
+        json.dump(tables, stream, ensure_ascii=False)
+    analyzer = FF_analyzeCommand()
+    assert analyzer.loadData(fileName)[0] == ""
+    return analyzer
+
+# Analyzer loaded with tables of tests folder, "porte garage" being owned by "garage" controller
+@pytest.fixture
+def loadedAnalyzer(tmp_path):
+    return makeAnalyzer(tmp_path, {"porte garage": {"controller": "garage"}})
+
+# Plug-in with a second controller ("garage") and loaded tables
+@pytest.fixture
+def multiPlugin(basePlugin, devices, loadedAnalyzer):
+    basePlugin.controllers["garage"] = {'address': "10.0.0.2", 'port': "8080", 'username': "garage", 'password': "secret", 'https': False, \
+        'inTopic': "garage/in", 'outTopic': "garage/out", 'version': "4.10717"}
+    basePlugin.analyzer = loadedAnalyzer
+    return basePlugin
+
+# Changed tables are reloaded into a new analyzer, previous one being kept (until files change again) if they have errors
+def testReloadTables(basePlugin, loadedAnalyzer, tmp_path):
+    basePlugin.analyzer = loadedAnalyzer
+    basePlugin.jsonFile = str(tmp_path / "smsTables.json")
+    with open(basePlugin.jsonFile, encoding="UTF-8") as stream:
+        tables = json.load(stream)
+    with open(basePlugin.jsonFile, "wt", encoding="UTF-8") as stream:
+        json.dump(dict(tables, include=["missing.json"]), stream, ensure_ascii=False)
+    os.utime(basePlugin.jsonFile, (0, 0))
+    assert basePlugin.analyzer.tablesChanged()
+    basePlugin.reloadTables()
+    assert basePlugin.analyzer is loadedAnalyzer and not basePlugin.analyzer.tablesChanged()
+    assert basePlugin.analyzer.analyzeCommand("allume lampe chambre")[0] == ""
+    tables["devices"]["cave"] = {"index": 20, "category": "On/Off", "allow": ["cdeOn"]}
+    with open(basePlugin.jsonFile, "wt", encoding="UTF-8") as stream:
+        json.dump(tables, stream, ensure_ascii=False)
+    os.utime(basePlugin.jsonFile, (1, 1))
+    assert basePlugin.analyzer.tablesChanged()
+    basePlugin.reloadTables()
+    assert basePlugin.analyzer is not loadedAnalyzer
+    assert basePlugin.analyzer.analyzeCommand("allume cave")[0] == "" and basePlugin.analyzer.deviceId == 20
+
+# Return messages published on a topic
+def publishedOn(basePlugin, topic):
+    return [json.loads(message) for (publishedTopic, message) in basePlugin.mqttClient.published if publishedTopic == topic]
+
+# Status is read as soon as Domoticz out topic shows device change
+def testConfirmation(basePlugin):
+    basePlugin.waitForConfirmation("+331", "lampe", 12)
+    basePlugin.onMQTTPublish("domoticz/out", json.dumps({'idx': 11}).encode("UTF-8"))
+    assert basePlugin.pendingConfirmation != None and basePlugin.httpClient.requests == []
+    basePlugin.onMQTTPublish("domoticz/out", json.dumps({'idx': 12}).encode("UTF-8"))
+    assert basePlugin.pendingConfirmation == None and basePlugin.httpClient.requests == ["12"]
+
+# Status is read anyway when no change is seen before timeout
+def testConfirmationTimeout(basePlugin):
+    basePlugin.waitForConfirmation("+331", "lampe", 12)
+    basePlugin.pendingConfirmation['deadline'] = time.time() + 60
+    basePlugin.onHeartbeat()
+    assert basePlugin.pendingConfirmation != None and basePlugin.httpClient.requests == []
+    basePlugin.pendingConfirmation['deadline'] = time.time() - 1
+    basePlugin.onHeartbeat()
+    assert basePlugin.pendingConfirmation == None and basePlugin.httpClient.requests == ["12"]
+
+# A new device change sends status of previous one immediately
+def testConfirmationReplaced(basePlugin):
+    basePlugin.waitForConfirmation("+331", "lampe", 12)
+    basePlugin.waitForConfirmation("+331", "volet", 13)
+    assert basePlugin.pendingConfirmation['idx'] == "13" and basePlugin.httpClient.requests == ["12"]
+
+# Delay or time at end of message is isolated, other messages being kept as is
+@pytest.mark.parametrize("message, expectedMessage, expectedDelay", [
+    ("allume lampe dans 2h30", "allume lampe", 9000),
+    ("on lamp in 45min", "on lamp", 2700),
+    ("on lamp in 3h", "on lamp", 10800),
+    ("on lamp IN 10mn", "on lamp", 600),
+    ("set boiler 21", "set boiler 21", None),
+    ("set boiler in 21", "set boiler in 21", None),
+    ("in 2h", "in 2h", None),
+    ("set temp at 25:00", "set temp at 25:00", None),
+])
+def testSplitScheduleDelay(message, expectedMessage, expectedDelay):
+    startTime = time.time()
+    (message, dueTime) = plugin.splitSchedule(message, ["in", "dans"], ["at", "vers"], analyzer)
+    assert message == expectedMessage
+    if expectedDelay == None:
+        assert dueTime == None
+    else:
+        assert startTime + expectedDelay <= dueTime <= time.time() + expectedDelay
+
+# Time already passed today is for tomorrow
+def testSplitScheduleTime():
+    now = datetime.now()
+    for due in [now + timedelta(minutes=2), now - timedelta(minutes=2)]:
+        (message, dueTime) = plugin.splitSchedule(F"allume lampe vers {due.hour}h{due.minute:02d}", ["in", "dans"], ["at", "vers"], analyzer)
+        assert message == "allume lampe"
+        expected = due.replace(second=0, microsecond=0)
+        if expected <= now:
+            expected += timedelta(days=1)
+        assert dueTime == expected.timestamp()
+
+# Jobs are saved only when changed, and can only be listed or cancelled by their sender
+def testJobScheduler(tmp_path):
+    fileName = str(tmp_path / "jobs.json")
+    scheduler = plugin.JobScheduler(fileName)
+    first = scheduler.add(time.time() - 10, "+331", "allume lampe")
+    second = scheduler.add(time.time() + 100, "+332", "éteins lampe")
+    scheduler.add(time.time() - 5, "+331", "état lampe")
+    assert not (tmp_path / "jobs.json").exists()
+    scheduler.saveIfChanged()
+    assert (tmp_path / "jobs.json").exists()
+    assert scheduler.cancel(first['id'], "+332") == None
+    assert scheduler.cancel(first['id'], "+331") == first
+    assert [job['message'] for job in scheduler.pendingJobs("+331")] == ["état lampe"]
+    scheduler.saveIfChanged()
+    # Jobs survive a restart, and are popped when due
+    scheduler = plugin.JobScheduler(fileName)
+    assert scheduler.pendingJobs("+332") == [second]
+    assert scheduler.popDueJob(time.time())['message'] == "état lampe"
+    assert scheduler.popDueJob(time.time()) == None
+    assert scheduler.nextDue() == second['due']
+
+# Commands are sent to controller owning device, HTTP client being directed to a controller only when its status lookup starts
+def testControllerRouting(multiPlugin, devices):
+    multiPlugin.executeMessage("+331", "affiche lampe chambre")
+    assert multiPlugin.httpClient.requests == ["3"] and multiPlugin.httpClient.controllers == [("127.0.0.1", "")]
+    multiPlugin.executeMessage("+331", "allume porte garage")
+    assert [message['idx'] for message in publishedOn(multiPlugin, "garage/in")] == [7] and publishedOn(multiPlugin, "domoticz/in") == []
+    # Lookup in progress keeps its controller
+    assert (multiPlugin.httpClient.Address, multiPlugin.httpClient.hostUsername) == ("127.0.0.1", "")
+    # Change is only confirmed on out topic of device controller
+    multiPlugin.onMQTTPublish("domoticz/out", json.dumps({'idx': 7}).encode("UTF-8"))
+    assert multiPlugin.pendingConfirmation != None
+    multiPlugin.onMQTTPublish("garage/out", json.dumps({'idx': 7}).encode("UTF-8"))
+    assert multiPlugin.pendingConfirmation == None and list(multiPlugin.statusLookups) == [("main", "3"), ("garage", "7")]
+    # Next lookup is directed to its controller once previous one is done
+    multiPlugin.receiveDeviceStatus({'idx': "3", 'Data': "On", 'LastUpdate': "2026-10-19 10:00:00"})
+    assert devices[2].sValue == "lampe chambre is On @19/10 10:00"
+    assert multiPlugin.httpClient.requests == ["3", "7"] and multiPlugin.httpClient.controllers[-1] == ("10.0.0.2", "garage")
+
+# Status of idx 12 as given by Domoticz
+lampStatus = {'idx': "12", 'Data': "On", 'LastUpdate': "2026-10-19 10:00:00"}
+
+# Status is read from cache until its TTL expires
+def testStatusCache(basePlugin, devices):
+    basePlugin.getDeviceStatus("+331", "lampe", 12)
+    basePlugin.receiveDeviceStatus(lampStatus)
+    basePlugin.getDeviceStatus("+332", "lampe", 12)
+    assert basePlugin.httpClient.requests == ["12"]
+    assert [(answer['number'], answer['message']) for answer in publishedOn(basePlugin, "sms/send")] == \
+        [("+331", "lampe is On @19/10 10:00"), ("+332", "lampe is On @19/10 10:00")]
+    basePlugin.statusCache[("main", "12")]['time'] -= basePlugin.statusCacheTtl
+    basePlugin.getDeviceStatus("+333", "lampe", 12)
+    assert basePlugin.httpClient.requests == ["12", "12"]
+
+# Requests for a device being looked up wait for its status, other devices being looked up one after the other
+def testStatusCoalescing(basePlugin, devices):
+    basePlugin.getDeviceStatus("+331", "lampe", 12)
+    basePlugin.getDeviceStatus("+332", "lampe", 12)
+    basePlugin.getDeviceStatus("+331", "volet", 13)
+    assert basePlugin.httpClient.requests == ["12"]
+    basePlugin.receiveDeviceStatus(lampStatus)
+    assert [answer['number'] for answer in publishedOn(basePlugin, "sms/send")] == ["+331", "+332"]
+    assert basePlugin.httpClient.requests == ["12", "13"]
+    # Late answer for another device is ignored
+    basePlugin.receiveDeviceStatus(lampStatus)
+    assert list(basePlugin.statusLookups) == [("main", "13")]
+
+# Failed lookup answers all requesters with an error
+def testStatusFailure(basePlugin, devices):
+    basePlugin.getDeviceStatus("+331", "lampe", 12)
+    basePlugin.getDeviceStatus("+332", "lampe", 12)
+    basePlugin.receiveDeviceStatus(None)
+    assert [(answer['number'], answer['message']) for answer in publishedOn(basePlugin, "sms/send")] == \
+        [("+331", "Can't get status of lampe"), ("+332", "Can't get status of lampe")]
+    assert basePlugin.statusLookups == {} and basePlugin.statusCache == {}
+
+# Cached status is forgotten when plug-in changes device, even without confirmation, or when device changes on its out topic
+def testStatusInvalidation(multiPlugin):
+    multiPlugin.getDeviceStatus("+331", "lampe chambre", 3)
+    multiPlugin.receiveDeviceStatus({'idx': "3", 'Data': "On", 'LastUpdate': "2026-10-19 10:00:00"})
+    multiPlugin.executeMessage("+331", "éteins lampe chambre")
+    assert multiPlugin.statusCache == {}
+    multiPlugin.pendingConfirmation['deadline'] = time.time() - 1
+    multiPlugin.onHeartbeat()
+    assert multiPlugin.httpClient.requests == ["3", "3"]
+    multiPlugin.receiveDeviceStatus({'idx': "3", 'Data': "Off", 'LastUpdate': "2026-10-19 10:01:00"})
+    assert multiPlugin.statusCache[("main", "3")]['value'] == "Off"
+    multiPlugin.onMQTTPublish("garage/out", json.dumps({'idx': 3}).encode("UTF-8"))
+    assert ("main", "3") in multiPlugin.statusCache
+    multiPlugin.onMQTTPublish("domoticz/out", json.dumps({'idx': 3}).encode("UTF-8"))
+    assert multiPlugin.statusCache == {}
+
+# Status read while device changes is sent, but not cached
+def testStatusChangedDuringLookup(basePlugin, devices):
+    basePlugin.getDeviceStatus("+331", "lampe", 12)
+    basePlugin.onMQTTPublish("domoticz/out", json.dumps({'idx': 12}).encode("UTF-8"))
+    basePlugin.receiveDeviceStatus(lampStatus)
+    assert len(publishedOn(basePlugin, "sms/send")) == 1 and basePlugin.statusCache == {}
+    basePlugin.getDeviceStatus("+331", "lampe", 12)
+    basePlugin.receiveDeviceStatus(lampStatus)
+    assert ("main", "12") in basePlugin.statusCache
+
+# Delay or time is only isolated from a command understood without it, a value ending like a delay being kept
+@pytest.mark.parametrize("message, scheduled, published", [
+    ("allume lampe chambre dans 2h", "allume lampe chambre", None),
+    ("règle thermostat salon 21 dans 1h", "règle thermostat salon 21", None),
+    ("règle message rentre dans 2h", None, "rentre dans 2h"),
+    ("règle message rentre vers 18h", None, "rentre vers 18h"),
+    ("zz dans 2h", None, None),
+])
+def testScheduledMessage(multiPlugin, message, scheduled, published):
+    multiPlugin.executeMessage("+331", message)
+    assert [job['message'] for job in multiPlugin.scheduler.pendingJobs("+331")] == ([scheduled] if scheduled else [])
+    assert [update['svalue'] for update in publishedOn(multiPlugin, "domoticz/in")] == ([published] if published else [])
+
+# Status is asked on controller in topic through MQTT when configured, and read from its out topic
+def testMqttStatusLookup(multiPlugin):
+    multiPlugin.statusTransport = "mqtt"
+    multiPlugin.getDeviceStatus("+331", "porte garage", 7, "garage")
+    assert publishedOn(multiPlugin, "garage/in") == [{'command': 'getdeviceinfo', 'idx': 7}] and multiPlugin.httpClient.requests == []
+    # Same idx on another controller is not the awaited answer
+    multiPlugin.onMQTTPublish("domoticz/out", json.dumps({'idx': 7, 'nvalue': 1, 'switchType': "On/Off"}).encode("UTF-8"))
+    assert publishedOn(multiPlugin, "sms/send") == []
+    multiPlugin.onMQTTPublish("garage/out", json.dumps({'idx': 7, 'nvalue': 1, 'svalue1': "", 'switchType': "On/Off", \
+        'LastUpdate': "2026-10-19 10:00:00"}).encode("UTF-8"))
+    assert [answer['message'] for answer in publishedOn(multiPlugin, "sms/send")] == ["porte garage is On @19/10 10:00"]
+    assert multiPlugin.statusLookups == {} and multiPlugin.statusLookupDeadline == 0
+
+# Status read through MQTT is cached, next request within TTL being answered without asking it again, until device changes
+def testMqttStatusCached(multiPlugin):
+    multiPlugin.statusTransport = "mqtt"
+    answer = json.dumps({'idx': 7, 'nvalue': 1, 'switchType': "On/Off", 'LastUpdate': "2026-10-19 10:00:00"}).encode("UTF-8")
+    multiPlugin.getDeviceStatus("+331", "porte garage", 7, "garage")
+    multiPlugin.onMQTTPublish("garage/out", answer)
+    assert multiPlugin.statusCache[("garage", "7")]['value'] == "On"
+    multiPlugin.getDeviceStatus("+332", "porte garage", 7, "garage")
+    assert len(publishedOn(multiPlugin, "garage/in")) == 1
+    assert [answer['number'] for answer in publishedOn(multiPlugin, "sms/send")] == ["+331", "+332"]
+    # Change seen while no lookup is waiting invalidates cache
+    multiPlugin.onMQTTPublish("garage/out", answer)
+    assert multiPlugin.statusCache == {}
+
+# Status is asked again through HTTP (to same controller) when no MQTT answer comes in time, then given up after HTTP timeout
+def testMqttStatusTimeout(multiPlugin):
+    multiPlugin.statusTransport = "mqtt"
+    multiPlugin.getDeviceStatus("+331", "porte garage", 7, "garage")
+    multiPlugin.statusLookupDeadline = time.time() - 1
+    multiPlugin.onHeartbeat()
+    assert multiPlugin.statusLookupMqtt == False and multiPlugin.statusLookupDeadline > time.time()
+    assert multiPlugin.httpClient.requests == ["7"] and multiPlugin.httpClient.controllers == [("10.0.0.2", "garage")]
+    # Late MQTT answer is no more awaited
+    multiPlugin.onMQTTPublish("garage/out", json.dumps({'idx': 7, 'nvalue': 1, 'switchType': "On/Off"}).encode("UTF-8"))
+    assert publishedOn(multiPlugin, "sms/send") == []
+    multiPlugin.statusLookupDeadline = time.time() - 1
+    multiPlugin.onHeartbeat()
+    assert [answer['message'] for answer in publishedOn(multiPlugin, "sms/send")] == ["Can't get status of porte garage"]
+
+# Selector level names are decoded from base64 when given by HTTP API, and used as is when given by MQTT
+@pytest.mark.parametrize("levelNames, levelNamesEncoded", [
+    (base64.b64encode("Arrêt|Hors gel|Confort".encode("UTF-8")).decode("ascii"), True),
+    ("Arrêt|Hors gel|Confort", False),
+])
+def testLevelNames(basePlugin, devices, levelNames, levelNamesEncoded):
+    basePlugin.getDeviceStatus("+331", "chauffage", 9)
+    basePlugin.receiveDeviceStatus({'idx': "9", 'SwitchType': "Selector", 'LevelNames': levelNames, 'LevelInt': 10, \
+        'Data': "10", 'LastUpdate': "2026-10-19 10:00:00"}, levelNamesEncoded)
+    assert [answer['message'] for answer in publishedOn(basePlugin, "sms/send")] == ["chauffage is Hors gel @19/10 10:00"]
+    assert basePlugin.levelNamesCache[("main", "9")][1] == ["Arrêt", "Hors gel", "Confort"]
+
+# Requests set by user are sent as JSON with a new uuid to user request topic when given, else written into user request device
+def testUserRequestTopic(multiPlugin, devices, tmp_path):
+    multiPlugin.analyzer = makeAnalyzer(tmp_path, {"chauffage": {"setBy": "user", "controller": "garage"}})
+    multiPlugin.userRequestTopic = "sms/userRequest"
+    multiPlugin.executeMessage("+331", "règle chauffage hors gel")
+    multiPlugin.executeMessage("+331", "règle chauffage hors gel")
+    requests = publishedOn(multiPlugin, "sms/userRequest")
+    ids = [request.pop('id') for request in requests]
+    assert [uuid.UUID(id).version for id in ids] == [4, 4] and ids[0] != ids[1]
+    assert requests == [{'number': "+331", 'command': "cdeSet", 'commandValue': 8, 'idx': 9, 'device': "chauffage", 'category': "Selector", \
+        'value': 10, 'originalValue': "hors gel", 'setType': "level", 'controller': "garage"}] * 2
+    assert publishedOn(multiPlugin, "garage/in") == [] and devices[3].sValue == ""
+    multiPlugin.userRequestTopic = ""
+    multiPlugin.executeMessage("+331", "règle chauffage hors gel")
+    assert len(publishedOn(multiPlugin, "sms/userRequest")) == 2 and devices[3].sValue == "+331~8~9~Selector~10~hors gel~level"
+
+# Device changes are published as valid JSON, on in topic of device controller
+@pytest.mark.parametrize("message, command", [
+    ("allume lampe chambre", {'command': "switchlight", 'idx': 3, 'switchcmd': "On"}),
+    ("éteins porte garage", {'command': "switchlight", 'idx': 7, 'switchcmd': "Off"}),
+    ("règle store 50", {'command': "switchlight", 'idx': 12, 'switchcmd': "Set Level", 'level': 50}),
+    ("règle chauffage confort", {'command': "switchlight", 'idx': 9, 'switchcmd': "Set Level", 'level': 20}),
+    ("règle thermostat salon 21.5", {'command': "udevice", 'idx': 10, 'svalue': "21.5"}),
+    ("règle volume 20", {'command': "udevice", 'idx': 11, 'nvalue': 20}),
+    ('règle message "Porte" ouverte\\', {'command': "udevice", 'idx': 8, 'svalue': '"Porte" ouverte\\'}),
+])
+def testDeviceCommands(multiPlugin, message, command):
+    multiPlugin.executeMessage("+331", message)
+    published = [(topic, json.loads(message)) for (topic, message) in multiPlugin.mqttClient.published]
+    assert published == [("garage/in" if command['idx'] == 7 else "domoticz/in", dict(command, rssi=6, battery=255))]
+    assert multiPlugin.pendingConfirmation['idx'] == str(command['idx'])
+
+# Domoticz connection keeping sent messages, all connections being kept
+class FakeConnection:
+    connections = []
+
+    def __init__(self, Name, Transport, Protocol, Address, Port):
+        self.Address = Address
+        self.Port = Port
+        self.sent = []
+        self.connecting = False
+        FakeConnection.connections.append(self)
+
+    def Connect(self):
+        self.connecting = True
+
+    def Connecting(self):
+        return self.connecting
+
+    def Connected(self):
+        return False
+
+    def Send(self, message):
+        self.sent.append(message)
+
+    def Disconnect(self):
+        self.connecting = False
+
+# Plug-in with two controllers, using an HTTP client with fake Domoticz connections
+@pytest.fixture
+def httpPlugin(multiPlugin, monkeypatch):
+    monkeypatch.setattr(plugin.Domoticz, "Connection", FakeConnection, raising=False)
+    monkeypatch.setattr(FakeConnection, "connections", [])
+    monkeypatch.setattr(plugin, "_plugin", multiPlugin)
+    multiPlugin.httpClient = plugin.HttpClient("127.0.0.1", "", "", "8080", False, None, None, None)
+    return multiPlugin
+
+# HTTP API style and level names encoding are given by version of controller asked
+def testHttpControllerVersion(httpPlugin):
+    selector = {'idx': "9", 'SwitchType': "Selector", 'LevelInt': 10, 'LastUpdate': "2026-10-19 10:00:00"}
+    levelNames = {"main": base64.b64encode("Arrêt|Hors gel".encode("UTF-8")).decode("ascii"), "garage": "Arrêt|Hors gel"}
+    for (controllerName, url) in [("main", "/json.htm?type=command&param=getdevices&rid=9"), ("garage", "/json.htm?type=devices&rid=9")]:
+        httpPlugin.getDeviceStatus("+331", "chauffage", 9, controllerName)
+        connection = FakeConnection.connections[-1]
+        httpPlugin.httpClient.onConnect(connection, 0, "")
+        assert [message['URL'] for message in connection.sent] == [url]
+        answer = {"status": "OK", "result": [dict(selector, LevelNames=levelNames[controllerName])]}
+        httpPlugin.httpClient.onMessage(connection, {'Status': 200, 'Data': json.dumps(answer).encode("UTF-8")})
+    assert [answer['message'] for answer in publishedOn(httpPlugin, "sms/send")] == ["chauffage is Hors gel @19/10 10:00"] * 2
+
+# Failed connection answers requesters at once, and next lookup starts on a new connection
+def testHttpConnectFailure(httpPlugin):
+    httpPlugin.getDeviceStatus("+331", "lampe chambre", 3)
+    httpPlugin.getDeviceStatus("+332", "lampe chambre", 3)
+    httpPlugin.getDeviceStatus("+331", "porte garage", 7, "garage")
+    connection = FakeConnection.connections[-1]
+    httpPlugin.httpClient.onConnect(connection, 1, "Connection refused")
+    assert [(answer['number'], answer['message']) for answer in publishedOn(httpPlugin, "sms/send")] == \
+        [("+331", "Can't get status of lampe chambre"), ("+332", "Can't get status of lampe chambre")]
+    assert not connection.Connecting() and list(httpPlugin.statusLookups) == [("garage", "7")]
+    assert len(FakeConnection.connections) == 2 and FakeConnection.connections[-1].Address == "10.0.0.2"
+
+# MQTT client using fake Domoticz connections, with a 3 messages buffer
+@pytest.fixture
+def mqttClient(monkeypatch):
+    monkeypatch.setattr(plugin.Domoticz, "Connection", FakeConnection, raising=False)
+    monkeypatch.setattr(FakeConnection, "connections", [])
+    return plugin.MqttClient("127.0.0.1", "1883", None, None, None, None, bufferSize=3)
+
+# Messages published while disconnected are buffered (oldest ones being dropped when full), then sent in order on CONNACK
+def testMqttBuffer(mqttClient):
+    for ptr in range(5):
+        mqttClient.Publish("topic", F"message {ptr}")
+    assert list(mqttClient.bufferedMessages) == [("topic", F"message {ptr}", 0) for ptr in range(2, 5)] and mqttClient.droppedMessages == 2
+    assert len(FakeConnection.connections) == 1
+    mqttClient.onMessage(mqttClient.mqttConn, {'Verb': "CONNACK"})
+    assert [message['Payload'].decode("UTF-8") for message in mqttClient.mqttConn.sent] == ["message 2", "message 3", "message 4"]
+    assert not mqttClient.bufferedMessages and mqttClient.droppedMessages == 0
+    mqttClient.Publish("topic", "message 5")
+    assert mqttClient.mqttConn.sent[-1]['Payload'] == bytearray("message 5", "UTF-8")
+
+# Reconnections are delayed by an exponential backoff with jitter, connections in progress being kept
+def testMqttBackoff(mqttClient, monkeypatch):
+    monkeypatch.setattr(plugin.random, "uniform", lambda low, high: high)
+    mqttClient.checkReconnect()
+    assert len(FakeConnection.connections) == 1
+    mqttClient.onMessage(mqttClient.mqttConn, {'Verb': "CONNACK"})
+    mqttClient.onDisconnect(mqttClient.mqttConn)
+    assert mqttClient.nextReconnect - time.time() == pytest.approx(mqttClient.firstReconnectDelay, abs=0.5)
+    delays = []
+    for attempt in range(8):
+        # Nothing is done before reconnection delay
+        mqttClient.checkReconnect()
+        mqttClient.Ping()
+        assert len(FakeConnection.connections) == attempt + 1
+        if mqttClient.mqttConn:
+            mqttClient.mqttConn.connecting = False
+        mqttClient.nextReconnect = time.time() - 1
+        mqttClient.checkReconnect()
+        delays.append(round(mqttClient.nextReconnect - time.time()))
+    assert len(FakeConnection.connections) == 9
+    assert delays == [2, 4, 8, 16, 32, 60, 60, 60]
+
+# Ping doesn't reconnect before reconnection delay
+def testMqttPingDisconnected(mqttClient):
+    mqttClient.onMessage(mqttClient.mqttConn, {'Verb': "CONNACK"})
+    mqttClient.Ping()
+    assert mqttClient.mqttConn.sent == [{'Verb': "PING"}]
+    mqttClient.onDisconnect(mqttClient.mqttConn)
+    for ptr in range(3):
+        mqttClient.Ping()
+    assert len(FakeConnection.connections) == 1
+    mqttClient.nextReconnect = time.time() - 1
+    mqttClient.Ping()
+    assert len(FakeConnection.connections) == 2